@@ -0,0 +1,149 @@
+# admission control for operations on a backend session
+
+import math
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, Callable, Dict, List
+
+from . import deadlines, settings
+from .browser import RequestTimeout
+
+READ = "read"
+WRITE = "write"
+LANES = (READ, WRITE)
+
+
+class Overloaded(Exception):
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__(f"{lane} queue full; retry after {retry_after}s")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class Gate:
+    """admit a bounded number of operations per lane, running them in priority order
+
+    An operation is admitted while its lane holds fewer than the lane's limit, counting operations both
+    waiting and running; otherwise admit() raises Overloaded with a retry delay estimated from recent
+    operation times. Up to concurrency admitted operations run at once (None: no limit). Waiting reads
+    run before waiting writes, but after read_burst reads in a row a waiting write goes next.
+    """
+
+    def __init__(
+        self,
+        *,
+        reads: int | None = None,
+        writes: int | None = None,
+        concurrency: int | None = 1,
+        read_burst: int | None = None,
+    ):
+        self.limits = {READ: settings.get(reads, "ADMISSION_READS"), WRITE: settings.get(writes, "ADMISSION_WRITES")}
+        self.concurrency = concurrency
+        self.read_burst = settings.get(read_burst, "ADMISSION_READ_BURST")
+        self.waiting = {lane: deque() for lane in LANES}
+        self.running = {lane: 0 for lane in LANES}
+        self.reads_in_row = 0
+        self.duration = 1.0
+        self.condition = threading.Condition()
+
+    def admit(self, lane: str) -> object:
+        """reserve a place in lane, returning the ticket to run with"""
+        with self.condition:
+            if len(self.waiting[lane]) + self.running[lane] >= self.limits[lane]:
+                raise Overloaded(lane, self._retry_after())
+            ticket = object()
+            self.waiting[lane].append(ticket)
+            return ticket
+
+    def _retry_after(self) -> int:
+        queued = sum(len(waiting) for waiting in self.waiting.values())
+        return max(1, math.ceil(self.duration * (queued + 1) / (self.concurrency or queued + 1)))
+
+    def _next(self) -> str | None:
+        if self.waiting[READ] and (not self.waiting[WRITE] or self.reads_in_row < self.read_burst):
+            return READ
+        if self.waiting[WRITE]:
+            return WRITE
+        return None
+
+    def _turn(self, lane: str, ticket: object) -> bool:
+        if self.concurrency is not None and sum(self.running.values()) >= self.concurrency:
+            return False
+        return self._next() == lane and self.waiting[lane][0] is ticket
+
+    def run(self, lane: str, ticket: object, func: Callable, *args, **kwargs) -> Any:
+        """wait for the ticket's turn within the calling thread's deadline, then call func"""
+        with self.condition:
+            while not self._turn(lane, ticket):
+                if ticket not in self.waiting[lane]:
+                    raise RequestTimeout(f"withdrawn from the {lane} queue")
+                remaining = deadlines.remaining()
+                if remaining == 0.0:
+                    self.waiting[lane].remove(ticket)
+                    self.condition.notify_all()
+                    raise RequestTimeout(f"deadline passed in the {lane} queue")
+                self.condition.wait(remaining)
+            self.waiting[lane].popleft()
+            self.running[lane] += 1
+            self.reads_in_row = self.reads_in_row + 1 if lane == READ else 0
+            self.condition.notify_all()
+        started = time.monotonic()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self.condition:
+                self.running[lane] -= 1
+                self.duration = 0.8 * self.duration + 0.2 * (time.monotonic() - started)
+                self.condition.notify_all()
+
+    def cancel(self, lane: str, ticket: object):
+        """withdraw a ticket that will not run, so the operations behind it can"""
+        with self.condition:
+            if ticket in self.waiting[lane]:
+                self.waiting[lane].remove(ticket)
+                self.condition.notify_all()
+
+    def status(self) -> Dict[str, Any]:
+        with self.condition:
+            return {lane: dict(waiting=len(self.waiting[lane]), running=self.running[lane]) for lane in LANES}
+
+
+class Admission:
+    """a gate for each backend session, sized by how many operations the backend runs at once"""
+
+    def __init__(self):
+        self.gates = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+
+    def gate(self, session) -> Gate:
+        with self.lock:
+            if session not in self.gates:
+                self.gates[session] = Gate(concurrency=session.concurrency)
+            return self.gates[session]
+
+    def admitted(self, session, lane: str, func: Callable) -> Callable:
+        """admit an operation now, returning func wrapped to wait for its turn; raises Overloaded
+
+        The caller must call the wrapper's cancel() if the wrapper may never be called; cancel() does
+        nothing once the wrapper has been called.
+        """
+        gate = self.gate(session)
+        ticket = gate.admit(lane)
+        called = threading.Event()
+
+        def wrapper(*args, **kwargs):
+            called.set()
+            return gate.run(lane, ticket, func, *args, **kwargs)
+
+        def cancel():
+            if not called.is_set():
+                gate.cancel(lane, ticket)
+
+        wrapper.cancel = cancel
+        return wrapper
+
+    def status(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [dict(target=session.target.name, **gate.status()) for session, gate in self.gates.items()]
@@ -1,15 +1,39 @@
+import asyncio
 import logging
 import os
+import re
 import signal
+import uuid
 from contextlib import asynccontextmanager
 
 import arrow
-from fastapi import BackgroundTasks, Depends, FastAPI, Header, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Request,
+)
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing_extensions import Annotated
 
-from . import settings
-from .browser import BrowserException, Session
+from . import settings, snapshots
+from .admission import READ, WRITE, Admission, Overloaded
+from .backend import Backend
+from .browser import VERIFY_MODES, BrowserException, RequestTimeout
+from .deadlines import bounded, expiry
+from .events import (
+    BOOK_ADDED,
+    BOOK_DELETED,
+    USER_ADDED,
+    USER_DELETED,
+    Events,
+    take_snapshot,
+)
+from .jobs import Job, Jobs, JobsFull, UnknownJob
 from .models import (
     Account,
     AddBookRequest,
@@ -21,120 +45,439 @@ from .models import (
     DeleteBookResponse,
     DeleteUserRequest,
     DeleteUserResponse,
+    HealthResponse,
     InitializeResponse,
+    JobResponse,
+    JobsResponse,
+    ListFilter,
+    ReadyResponse,
     ResetResponse,
     ShutdownResponse,
+    SnapshotsResponse,
     StatusResponse,
+    Target,
     UptimeResponse,
     UsersResponse,
 )
+from .reaper import reap
+from .targets import Sessions, UnknownTarget
 from .version import __version__
 
 log = logging.getLogger("uvicorn")
 
 
 async def required_headers(
-    x_admin_username: Annotated[str, Header()],
-    x_admin_password: Annotated[str, Header()],
     x_api_key: Annotated[str, Header()],
-):
+    x_admin_username: Annotated[str, Header()] = "",
+    x_admin_password: Annotated[str, Header()] = "",
+    x_baikal_target: Annotated[str, Header()] = "",
+) -> Account:
+    """the target's own admin credentials, or the request's when the target has none"""
     if x_api_key != app.state.api_key:
         raise HTTPException(status_code=401, detail="invalid API key")
+    try:
+        target = app.state.sessions.target(x_baikal_target)
+    except UnknownTarget as ex:
+        raise HTTPException(status_code=404, detail=str(ex))
+    if target.admin_username:
+        return Account(username=target.admin_username, password=target.admin_password)
     if not x_admin_username:
         raise HTTPException(status_code=401, detail="missing username")
     if not x_admin_password:
         raise HTTPException(status_code=401, detail="missing password")
-    app.state.account = Account(username=x_admin_username, password=x_admin_password)
+    return Account(username=x_admin_username, password=x_admin_password)
+
+
+AdminAccount = Annotated[Account, Depends(required_headers)]
+
+
+async def target_session(account: AdminAccount, x_baikal_target: Annotated[str, Header()] = "") -> Backend:
+    try:
+        return app.state.sessions.get(x_baikal_target, account)
+    except UnknownTarget as ex:
+        raise HTTPException(status_code=404, detail=str(ex))
+
+
+TargetSession = Annotated[Backend, Depends(target_session)]
+
+
+async def evict_idle_sessions():
+    while True:
+        await asyncio.sleep(max(settings.TARGET_IDLE_TIMEOUT / 10, 1))
+        await run_in_threadpool(app.state.sessions.evict_idle)
+
+
+async def reap_orphans():
+    while True:
+        await run_in_threadpool(reap)
+        if not settings.REAPER_INTERVAL:
+            break
+        await asyncio.sleep(settings.REAPER_INTERVAL)
+
+
+def server_account(target: Target) -> Account:
+    """the target's or the configured admin credentials, for work not made on behalf of a request"""
+    if target.admin_username:
+        return Account(username=target.admin_username, password=target.admin_password)
+    password = settings.get(None, "ADMIN_PASSWORD", settings.Get.DECODE_SECRET, settings.Get.OPTIONAL_READ_FILE)
+    return Account(username=settings.ADMIN_USERNAME, password=password)
+
+
+async def watch_changes():
+    """snapshot the users and books of the targets in use, publishing changes made outside bcc
+
+    Only targets with an active session are watched, and their sessions are not marked used, so the watcher
+    never starts a browser or keeps one from idle eviction. A session is read as the admin it is logged in
+    as, which spares it a login.
+    """
+    while settings.EVENT_POLL_INTERVAL:
+        await asyncio.sleep(settings.EVENT_POLL_INTERVAL)
+        for name, session in app.state.sessions.active().items():
+            account = getattr(session, "admin", None) or server_account(session.target)
+            started = app.state.events.last_id
+            try:
+                snapshot = await run_in_threadpool(take_snapshot, session, account)
+            except Exception as ex:
+                log.warning(f"change snapshot of target {name} failed: {ex!r}")
+                continue
+            app.state.events.diff(name, snapshot, started)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     log.setLevel(settings.LOG_LEVEL)
     log.info(f"bcc v{__version__} startup")
+    if settings.VERIFY not in VERIFY_MODES:
+        raise ValueError(f"unknown verification mode: {settings.VERIFY}; expected one of {list(VERIFY_MODES)}")
     app.state.api_key = str(settings.API_KEY)
     app.state.startup_time = arrow.now()
-    app.state.session = Session()
+    app.state.sessions = Sessions(logger=log)
+    app.state.jobs = Jobs(logger=log)
+    app.state.admission = Admission()
+    app.state.events = Events(logger=log)
+    app.state.events.attach(asyncio.get_running_loop())
+    evictor = asyncio.create_task(evict_idle_sessions())
+    reaper = asyncio.create_task(reap_orphans())
+    watcher = asyncio.create_task(watch_changes())
     yield
     log.info("shutdown")
-    app.state.session.shutdown()
+    evictor.cancel()
+    reaper.cancel()
+    watcher.cancel()
+    app.state.jobs.shutdown()
+    app.state.sessions.shutdown()
 
 
-app = FastAPI(dependencies=[Depends(required_headers)], lifespan=lifespan)
+app = FastAPI(lifespan=lifespan)
+api = APIRouter(dependencies=[Depends(required_headers)])
+
+
+@app.middleware("http")
+async def tag_request(request: Request, call_next):
+    """name each request for its page snapshots and logs, accepting a caller's X-Request-ID"""
+    request_id = re.sub("[^A-Za-z0-9_-]", "_", request.headers.get("x-request-id", ""))[:64] or uuid.uuid4().hex[:16]
+    request.state.request_id = request_id
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
 
 
 @app.exception_handler(BrowserException)
 async def browser_exception_handler(request: Request, exc: BrowserException):
     path = str(request.url)[len(str(request.base_url)) :]
+    snapshots.ring.dump(request.state.request_id)
     return JSONResponse(
-        status_code=500,
+        status_code=504 if isinstance(exc, RequestTimeout) else 500,
         content=dict(
             success=False, request=request.method + " /" + path, message=exc.__class__.__name__, detail=exc.args
         ),
     )
 
 
-@app.middleware("http")
-async def logout_after_request(request: Request, call_next):
-    response = await call_next(request)
-    app.state.session.logout()
-    return response
+def respond_async(request: Request) -> bool:
+    return "respond-async" in request.headers.get("prefer", "")
 
 
-@app.get("/status/")
-async def get_status() -> StatusResponse:
-    return StatusResponse(request="status", status=app.state.session.status(app.state.account))
+def accepts_ndjson(request: Request) -> bool:
+    return "application/x-ndjson" in request.headers.get("accept", "")
 
 
-@app.post("/reset/")
-async def post_reset() -> ResetResponse:
-    return app.state.session.reset(app.state.account)
+LISTINGS = {UsersResponse: "users", BooksResponse: "books"}
 
 
-@app.post("/initialize/")
-async def post_initialize() -> InitializeResponse:
-    return app.state.session.initialize(app.state.account)
+def ndjson_response(result) -> StreamingResponse:
+    """stream the records of a listing one JSON object per line, passing the next page cursor in a header"""
+    records = getattr(result, LISTINGS[type(result)])
+    return StreamingResponse(
+        (record.model_dump_json() + "\n" for record in records),
+        media_type="application/x-ndjson",
+        headers={"X-Next-Cursor": result.cursor},
+    )
 
 
-@app.get("/users/")
-async def get_users() -> UsersResponse:
-    return UsersResponse(users=app.state.session.users(app.state.account))
+def request_deadline(request: Request, default: float | None = None) -> float | None:
+    """the monotonic time the request must finish by, from the X-Request-Timeout header in seconds"""
+    timeout = request.headers.get("x-request-timeout")
+    if timeout is None:
+        return expiry(settings.get(default, "REQUEST_TIMEOUT"))
+    try:
+        return expiry(float(timeout))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"invalid X-Request-Timeout: {timeout}")
+
+
+def admitted(request: Request, session: Backend, func):
+    """queue func in the session's read or write lane, or answer 429 when the lane is full"""
+    lane = READ if request.method == "GET" else WRITE
+    try:
+        return app.state.admission.admitted(session, lane, func)
+    except Overloaded as ex:
+        raise HTTPException(status_code=429, detail=str(ex), headers={"Retry-After": str(ex.retry_after)})
+
+
+async def perform(request: Request, session: Backend, name: str, func) -> Response:
+    """run func(job) off the event loop, returning its already validated response model without revalidation;
+    with 'Prefer: respond-async' return a job status instead of waiting"""
+    background = respond_async(request)
+    expires = request_deadline(request, default=0 if background else None)
+    # admit last: a ticket taken before a failing step would block its lane
+    func = queued = admitted(request, session, func)
+    func = bounded(expires, func)
+    if background:
+        try:
+            func = app.state.sessions.track(session.target.name, snapshots.tagged(request.state.request_id, func))
+            job = app.state.jobs.submit(name, func, cancel=queued.cancel)
+        except JobsFull as ex:
+            queued.cancel()
+            raise HTTPException(status_code=429, detail=str(ex), headers={"Retry-After": "1"})
+        except BaseException:
+            queued.cancel()
+            raise
+        return Response(
+            status_code=202,
+            content=JobResponse(job=job.status()).model_dump_json(),
+            media_type="application/json",
+            headers={"Location": str(request.url_for("get_job", job_id=job.id))},
+        )
+    func = app.state.sessions.track(session.target.name, snapshots.tagged(request.state.request_id, func))
+    try:
+        result = await run_in_threadpool(func, None)
+    finally:
+        queued.cancel()
+    if type(result) in LISTINGS and accepts_ndjson(request):
+        return ndjson_response(result)
+    return Response(content=result.model_dump_json(), media_type="application/json")
+
+
+@api.get("/status/")
+async def get_status(request: Request, session: TargetSession, account: AdminAccount) -> StatusResponse:
+    status = bounded(request_deadline(request), session.status)
+    status = await run_in_threadpool(snapshots.tagged(request.state.request_id, status), account)
+    status["targets"] = repr(app.state.sessions.status())
+    status["jobs"] = repr(app.state.jobs.status())
+    status["admission"] = repr(app.state.admission.status())
+    return StatusResponse(request="status", status=status)
+
+
+@api.post("/reset/", response_model=ResetResponse)
+async def post_reset(request: Request, session: TargetSession, account: AdminAccount) -> Response:
+    return await perform(request, session, "reset", lambda job: ResetResponse(**session.reset(account)))
+
+
+@api.post("/initialize/", response_model=InitializeResponse)
+async def post_initialize(request: Request, session: TargetSession, account: AdminAccount) -> Response:
+    return await perform(request, session, "initialize", lambda job: InitializeResponse(**session.initialize(account)))
+
+
+@api.get("/users/", response_model=UsersResponse)
+async def get_users(
+    request: Request,
+    session: TargetSession,
+    account: AdminAccount,
+    username: str = "",
+    match: str = "",
+    limit: int = 0,
+    cursor: str = "",
+) -> Response:
+    query = ListFilter(username=username, match=match, limit=limit, cursor=cursor)
+
+    def list_users(job):
+        users = session.users(account, query)
+        return UsersResponse.model_construct(users=users, cursor=query.next_cursor([user.username for user in users]))
+
+    return await perform(request, session, "list users", list_users)
+
+
+@api.post("/user/", response_model=AddUserResponse)
+async def post_user(request: Request, session: TargetSession, account: AdminAccount, user: AddUserRequest) -> Response:
+
+    def add_user(job):
+        added = session.add_user(account, user)
+        publish(session, USER_ADDED, added.username)
+        return AddUserResponse(user=added)
+
+    return await perform(request, session, "add user", add_user)
+
+
+@api.delete("/user/", response_model=DeleteUserResponse)
+async def delete_user(
+    request: Request, session: TargetSession, account: AdminAccount, user: DeleteUserRequest
+) -> Response:
+
+    def remove_user(job):
+        deleted = session.delete_user(account, user)
+        publish(session, USER_DELETED, user.username)
+        return DeleteUserResponse(**deleted)
+
+    return await perform(request, session, "delete user", remove_user)
+
+
+def publish(session: Backend, type: str, username: str, token: str | None = None):
+    app.state.events.publish(type, session.target.name, username, token)
+
+
+def book_key(book):
+    return f"{book.username}/{book.token}"
+
+
+def list_books(session: Backend, account: Account, query: ListFilter, job: Job | None = None) -> BooksResponse:
+    cursor_username, _, cursor_token = query.cursor.partition("/")
+    usernames = session.usernames(account, ListFilter(username=query.username, match=query.match))
+    usernames = [name for name in usernames if name >= cursor_username]
+    books = []
+    chunk = session.read_concurrency
+    for start in range(0, len(usernames), chunk):
+        names = usernames[start : start + chunk]
+        if len(names) == 1:
+            user_books = {names[0]: session.books(account, names[0])}
+        else:
+            user_books = session.user_books(account, names)
+        for name in names:
+            user_query = ListFilter(
+                cursor=cursor_token if name == cursor_username else "",
+                limit=query.limit - len(books) if query.limit else 0,
+            )
+            by_token = {book.token: book for book in user_books[name]}
+            books.extend(by_token[token] for token in user_query.page(list(by_token.keys())))
+        if job:
+            job.update(users=start + len(names), total=len(usernames), books=len(books))
+        if query.limit and len(books) >= query.limit:
+            books = books[: query.limit]
+            break
+    return BooksResponse.model_construct(books=books, cursor=query.next_cursor([book_key(book) for book in books]))
+
+
+@api.get("/books/", response_model=BooksResponse)
+async def get_addressbooks_all(
+    request: Request,
+    session: TargetSession,
+    account: AdminAccount,
+    username: str = "",
+    match: str = "",
+    limit: int = 0,
+    cursor: str = "",
+) -> Response:
+    query = ListFilter(username=username, match=match, limit=limit, cursor=cursor)
+    return await perform(request, session, "list books", lambda job: list_books(session, account, query, job))
+
+
+@api.get("/books/{username}/", response_model=BooksResponse)
+async def get_addressbooks_user(
+    request: Request, session: TargetSession, account: AdminAccount, username: str, limit: int = 0, cursor: str = ""
+) -> Response:
+    query = ListFilter(limit=limit, cursor=cursor.rpartition("/")[2])
+
+    def list_user_books(job):
+        books = session.books(account, username, query)
+        return BooksResponse.model_construct(books=books, cursor=query.next_cursor([book_key(book) for book in books]))
+
+    return await perform(request, session, f"list books {username}", list_user_books)
+
+
+@api.post("/book/", response_model=AddBookResponse)
+async def post_address_book(
+    request: Request, session: TargetSession, account: AdminAccount, book: AddBookRequest
+) -> Response:
+
+    def add_book(job):
+        added = session.add_book(account, book)
+        publish(session, BOOK_ADDED, added.username, added.token)
+        return AddBookResponse(book=added)
+
+    return await perform(request, session, "add address book", add_book)
+
+
+@api.delete("/book/", response_model=DeleteBookResponse)
+async def delete_book(
+    request: Request, session: TargetSession, account: AdminAccount, book: DeleteBookRequest
+) -> Response:
+
+    def remove_book(job):
+        deleted = session.delete_book(account, book)
+        publish(session, BOOK_DELETED, book.username, book.token)
+        return DeleteBookResponse(**deleted)
+
+    return await perform(request, session, "delete address book", remove_book)
+
+
+@api.get("/events/")
+async def get_events(
+    since: int | None = None, last_event_id: Annotated[int | None, Header()] = None
+) -> StreamingResponse:
+    """stream change events; resume after an event id with ?since= or the Last-Event-ID header"""
+    return StreamingResponse(
+        app.state.events.subscribe(since if since is not None else last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
 
-@app.post("/user/")
-async def post_user(request: AddUserRequest) -> AddUserResponse:
-    return AddUserResponse(user=app.state.session.add_user(app.state.account, request))
+@api.get("/jobs/")
+async def get_jobs() -> JobsResponse:
+    return JobsResponse(jobs=[job.status() for job in app.state.jobs.all()])
 
 
-@app.delete("/user/")
-async def delete_user(request: DeleteUserRequest) -> DeleteUserResponse:
-    return app.state.session.delete_user(app.state.account, request)
+@api.get("/jobs/{job_id}/")
+async def get_job(job_id: str) -> JobResponse:
+    try:
+        return JobResponse(job=app.state.jobs.get(job_id).status())
+    except UnknownJob as ex:
+        raise HTTPException(status_code=404, detail=str(ex))
 
 
-@app.get("/books/")
-async def get_addressbooks_all() -> BooksResponse:
-    users = app.state.session.users(app.state.account)
-    books = []
-    for user in users:
-        books.extend(app.state.session.books(app.state.account, user.username))
-    return BooksResponse(books=books)
+def snapshot_ring() -> snapshots.Snapshots:
+    if not snapshots.ring.enabled:
+        raise HTTPException(status_code=404, detail="page snapshots disabled; set SNAPSHOTS")
+    return snapshots.ring
 
 
-@app.get("/books/{username}/")
-async def get_addressbooks_user(username: str) -> BooksResponse:
-    return BooksResponse(books=app.state.session.books(app.state.account, username))
+@api.get("/debug/snapshots/")
+async def get_snapshots(request_id: str | None = None) -> SnapshotsResponse:
+    """the retained page snapshots, oldest first, optionally those of one request"""
+    return SnapshotsResponse(snapshots=snapshot_ring().index(request_id))
 
 
-@app.post("/book/")
-async def post_address_book(request: AddBookRequest) -> AddBookResponse:
-    return AddBookResponse(book=app.state.session.add_book(app.state.account, request))
+@api.get("/debug/snapshots/{snapshot_id}/")
+async def get_snapshot(snapshot_id: int) -> Response:
+    try:
+        source = snapshot_ring().source(snapshot_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"snapshot not retained: {snapshot_id}")
+    return Response(content=source, media_type="text/html")
 
 
-@app.delete("/book/")
-async def delete_book(request: DeleteBookRequest) -> DeleteBookResponse:
-    return app.state.session.delete_book(app.state.account, request)
+@api.get("/debug/snapshots/{snapshot_id}/screenshot")
+async def get_snapshot_screenshot(snapshot_id: int) -> Response:
+    try:
+        screenshot = snapshot_ring().screenshot(snapshot_id)
+    except KeyError:
+        screenshot = None
+    if screenshot is None:
+        raise HTTPException(status_code=404, detail=f"no screenshot retained: {snapshot_id}")
+    return Response(content=screenshot, media_type="image/png")
 
 
-@app.post("/shutdown/")
+@api.post("/shutdown/")
 async def shutdown(background_tasks: BackgroundTasks) -> ShutdownResponse:
     log.warning("received shutdown request")
     background_tasks.add_task(shutdown_app)
@@ -146,6 +489,24 @@ def shutdown_app():
     os.kill(os.getpid(), signal.SIGINT)
 
 
-@app.get("/uptime/")
+@api.get("/uptime/")
 async def uptime() -> UptimeResponse:
     return dict(message="started " + app.state.startup_time.humanize(arrow.now()))
+
+
+@app.get("/healthz")
+async def healthz() -> HealthResponse:
+    """liveness: the server answers; no credentials or browser work"""
+    return HealthResponse(uptime=app.state.startup_time.humanize(arrow.now()))
+
+
+@app.get("/readyz", response_model=ReadyResponse)
+async def readyz() -> JSONResponse:
+    """readiness from in-memory state: browser liveness, last successful operation and queued operations"""
+    targets = app.state.sessions.health()
+    ready = all(target["ready"] for target in targets.values())
+    response = ReadyResponse(success=ready, targets=targets, jobs=app.state.jobs.status())
+    return JSONResponse(status_code=200 if ready else 503, content=response.model_dump())
+
+
+app.include_router(api)
@@ -0,0 +1,246 @@
+# export and import of the user and address book inventory
+
+import io
+import json
+import secrets
+import sys
+import tarfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+
+from .models import VALID_TOKEN_CHARS
+from .version import __version__
+
+ARCHIVE_FORMATS = ("ndjson", "tar")
+
+Entry = Tuple[Dict[str, Any], List[Dict[str, Any]]]
+
+
+def archive_format(filename: str, fmt: str | None = None) -> str:
+    """the archive format named, or implied by the filename suffix"""
+    if fmt:
+        return fmt
+    return "tar" if filename.endswith(".tar") else "ndjson"
+
+
+def book_token(username: str, bookname: str) -> str:
+    """the token add_book gives a book; an imported book's original token may differ"""
+    return "".join([c if c in VALID_TOKEN_CHARS else "-" for c in username + "-" + bookname])
+
+
+class Writer:
+    """append user entries to an NDJSON or tar archive, reporting the offset after each entry"""
+
+    def __init__(self, ofp: BinaryIO, fmt: str, stream: bool = False):
+        self.ofp = ofp
+        self.fmt = fmt
+        self.tar = None
+        if fmt == "tar":
+            self.tar = tarfile.open(fileobj=ofp, mode="w|" if stream else "w")
+
+    def header(self):
+        if self.fmt == "ndjson":
+            self._line(dict(type="export", version=__version__, time=time.time()))
+
+    def _line(self, record: Dict[str, Any]):
+        self.ofp.write((json.dumps(record) + "\n").encode())
+
+    def write(self, user: Dict[str, Any], books: List[Dict[str, Any]]) -> int:
+        if self.tar:
+            data = json.dumps(dict(user=user, books=books), indent=2).encode()
+            info = tarfile.TarInfo(f"users/{user['username']}.json")
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self.tar.addfile(info, io.BytesIO(data))
+            offset = self.tar.offset
+        else:
+            self._line(dict(type="user", **user))
+            for book in books:
+                self._line(dict(type="book", **book))
+            offset = None
+        self.ofp.flush()
+        if offset is None:
+            offset = self.ofp.tell() if self.ofp.seekable() else 0
+        return offset
+
+    def close(self):
+        if self.tar:
+            self.tar.close()
+        self.ofp.flush()
+
+
+class Export:
+    """stream users and their address books to an archive one page of users at a time
+
+    Books for a page are read with bounded concurrency. After each user the archive offset and the last
+    username are saved to ARCHIVE.checkpoint; an export finding a checkpoint truncates the archive to the
+    offset and continues after that user. The checkpoint is removed when the export completes.
+    """
+
+    def __init__(
+        self,
+        api,
+        archive: str,
+        *,
+        fmt: str | None = None,
+        page_size: int = 100,
+        concurrency: int = 4,
+        restart: bool = False,
+    ):
+        self.api = api
+        self.archive = archive
+        self.fmt = archive_format(archive, fmt)
+        self.page_size = page_size
+        self.concurrency = max(concurrency, 1)
+        self.checkpoint = None if archive == "-" else Path(archive + ".checkpoint")
+        self.state = dict(cursor="", offset=0, users=0, books=0)
+        if self.checkpoint and self.checkpoint.exists() and not restart:
+            self.state.update(json.loads(self.checkpoint.read_text()))
+
+    def _open(self) -> Tuple[BinaryIO, bool]:
+        if self.archive == "-":
+            return sys.stdout.buffer, True
+        if self.state["cursor"]:
+            ofp = open(self.archive, "r+b")
+            ofp.truncate(self.state["offset"])
+            ofp.seek(self.state["offset"])
+            return ofp, False
+        return open(self.archive, "wb"), False
+
+    def _save(self, username: str, offset: int, books: int):
+        self.state["cursor"] = username
+        self.state["offset"] = offset
+        self.state["users"] += 1
+        self.state["books"] += books
+        if self.checkpoint:
+            temp = self.checkpoint.with_suffix(".tmp")
+            temp.write_text(json.dumps(self.state))
+            temp.replace(self.checkpoint)
+
+    def _pages(self) -> Iterator[List[Any]]:
+        cursor = self.state["cursor"]
+        while True:
+            users = self.api.users(cursor=cursor, limit=self.page_size)
+            if users:
+                yield users
+            if len(users) < self.page_size:
+                return
+            cursor = users[-1].username
+
+    def run(self) -> Dict[str, Any]:
+        resumed = bool(self.state["cursor"])
+        ofp, stream = self._open()
+        writer = Writer(ofp, self.fmt, stream=stream)
+        try:
+            if not resumed:
+                writer.header()
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="export") as executor:
+                for users in self._pages():
+                    pages = executor.map(self.api.books, [user.username for user in users])
+                    for user, books in zip(users, pages):
+                        books = [book.model_dump(mode="json") for book in books]
+                        offset = writer.write(user.model_dump(mode="json"), books)
+                        self._save(user.username, offset, len(books))
+            writer.close()
+        finally:
+            if ofp is not sys.stdout.buffer:
+                ofp.close()
+        if self.checkpoint:
+            self.checkpoint.unlink(missing_ok=True)
+        return dict(users=self.state["users"], books=self.state["books"], resumed=resumed)
+
+
+def read_archive(ifp: BinaryIO, fmt: str) -> Iterator[Entry]:
+    """yield each user with its books, reading the archive as a stream"""
+    if fmt == "tar":
+        with tarfile.open(fileobj=ifp, mode="r|") as tar:
+            for member in tar:
+                if member.isfile() and member.name.endswith(".json"):
+                    entry = json.load(tar.extractfile(member))
+                    yield entry["user"], entry["books"]
+        return
+    user, books = None, []
+    for number, line in enumerate(ifp, start=1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        kind = record.pop("type", None)
+        if kind == "user":
+            if user:
+                yield user, books
+            user, books = record, []
+        elif kind == "book":
+            if not user or record["username"] != user["username"]:
+                raise ValueError(f"line {number}: book {record.get('token')} outside its user's entry")
+            books.append(record)
+        elif kind != "export":
+            raise ValueError(f"line {number}: unknown record type {kind!r}")
+    if user:
+        yield user, books
+
+
+class Import:
+    """restore archive entries with bounded concurrency, skipping users and books that already exist
+
+    Each user is restored by one task, which adds the user if missing and then its missing books. Created
+    users get password, or a random password returned with the result. Entries are read as tasks finish,
+    so the archive is never held in memory; rerunning an interrupted import resumes it.
+    """
+
+    def __init__(self, api, concurrency: int = 4, password: str | None = None):
+        self.api = api
+        self.concurrency = max(concurrency, 1)
+        self.password = password
+        self.counts = dict(users_added=0, users_skipped=0, books_added=0, books_skipped=0, failed=0)
+
+    def _restore(self, number: int, user: Dict[str, Any], books: List[Dict[str, Any]]) -> Dict[str, Any]:
+        username = user["username"]
+        ret = dict(entry=number, username=username, success=True, user="skipped", books_added=0, books_skipped=0)
+        try:
+            existing = set()
+            if self.api.users(username=username):
+                existing = {book.token for book in self.api.books(username)}
+            else:
+                password = self.password or secrets.token_urlsafe(12)
+                self.api.add_user(username, user.get("displayname") or "", password)
+                ret["user"] = "added"
+                if not self.password:
+                    ret["password"] = password
+            for book in books:
+                if existing & {book["token"], book_token(username, book["bookname"])}:
+                    ret["books_skipped"] += 1
+                    continue
+                self.api.add_book(username, book["bookname"], book.get("description") or "")
+                ret["books_added"] += 1
+        except Exception as ex:
+            ret.update(success=False, error=str(ex))
+        return ret
+
+    def _count(self, ret: Dict[str, Any]) -> Dict[str, Any]:
+        if ret["user"] == "added":
+            self.counts["users_added"] += 1
+        elif ret["success"]:
+            self.counts["users_skipped"] += 1
+        self.counts["books_added"] += ret["books_added"]
+        self.counts["books_skipped"] += ret["books_skipped"]
+        if not ret["success"]:
+            self.counts["failed"] += 1
+        return ret
+
+    def run(self, entries: Iterator[Entry]) -> Iterator[Dict[str, Any]]:
+        """yield one result per user as each completes"""
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="import") as executor:
+            pending = set()
+            for number, (user, books) in enumerate(entries, start=1):
+                if len(pending) >= self.concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield self._count(future.result())
+                pending.add(executor.submit(self._restore, number, user, books))
+            for future in pending:
+                yield self._count(future.result())
+
+    def summary(self) -> Dict[str, Any]:
+        return dict(self.counts)
@@ -0,0 +1,101 @@
+# backend interface for the operations the API performs against a baikal target
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List
+
+from .models import (
+    Account,
+    AddBookRequest,
+    AddUserRequest,
+    Book,
+    DeleteBookRequest,
+    DeleteUserRequest,
+    ListFilter,
+    Target,
+    User,
+)
+
+
+class Backend(ABC):
+    """a baikal target as seen by the API routes
+
+    browser.Session drives the admin UI; memory.MemoryBackend keeps users and books in process for
+    measuring the API layer without Firefox or Baikal. The BACKEND setting selects the implementation.
+    """
+
+    target: Target
+    url: str
+    # True when each admin credential gets its own instance, which stays logged in between requests
+    per_admin = False
+    # how many operations admission control lets run at once; None for no limit
+    concurrency: int | None = 1
+
+    @property
+    @abstractmethod
+    def active(self) -> bool:
+        """True while the backend holds resources, such as a running browser, that idle eviction releases"""
+
+    def health(self) -> Dict[str, Any]:
+        """liveness and readiness from in-memory state only; probes call this often"""
+        return dict(alive=True, ready=True)
+
+    @abstractmethod
+    def login(self, admin: Account):
+        pass
+
+    @abstractmethod
+    def logout(self):
+        pass
+
+    @abstractmethod
+    def initialize(self, admin: Account) -> Dict[str, str]:
+        pass
+
+    @abstractmethod
+    def users(self, admin: Account, query: ListFilter | None = None) -> List[User]:
+        pass
+
+    @abstractmethod
+    def usernames(self, admin: Account, query: ListFilter | None = None) -> List[str]:
+        pass
+
+    @abstractmethod
+    def add_user(self, admin: Account, request: AddUserRequest) -> User:
+        pass
+
+    @abstractmethod
+    def delete_user(self, admin: Account, request: DeleteUserRequest) -> Dict[str, str]:
+        pass
+
+    @abstractmethod
+    def books(self, admin: Account, username: str, query: ListFilter | None = None) -> List[Book]:
+        pass
+
+    def user_books(self, admin: Account, usernames: List[str]) -> Dict[str, List[Book]]:
+        """the unpaged address books of several users; backends that can read concurrently override this"""
+        return {username: self.books(admin, username) for username in usernames}
+
+    @property
+    def read_concurrency(self) -> int:
+        """how many users user_books reads at once"""
+        return 1
+
+    @abstractmethod
+    def add_book(self, admin: Account, request: AddBookRequest) -> Book:
+        pass
+
+    @abstractmethod
+    def delete_book(self, admin: Account, request: DeleteBookRequest) -> Dict[str, str]:
+        pass
+
+    @abstractmethod
+    def reset(self, admin: Account) -> Dict[str, str]:
+        pass
+
+    @abstractmethod
+    def status(self, admin: Account) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    def shutdown(self):
+        pass
@@ -0,0 +1,113 @@
+# batch operations
+
+import csv
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Any, Dict, Iterable, Iterator, Set, Tuple
+
+from pydantic import ValidationError
+
+from .models import AddBookRequest, AddUserRequest, DeleteBookRequest, DeleteUserRequest
+
+OPERATIONS = {
+    "mkuser": (AddUserRequest, lambda api, r: api.add_user(r.username, r.displayname, r.password)),
+    "rmuser": (DeleteUserRequest, lambda api, r: api.delete_user(r.username)),
+    "mkbook": (AddBookRequest, lambda api, r: api.add_book(r.username, r.bookname, r.description or "")),
+    "rmbook": (DeleteBookRequest, lambda api, r: api.delete_book(r.username, r.token)),
+}
+
+
+def read_ndjson(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield number, line
+
+
+def read_csv(lines: Iterable[str], delimiter: str = ",") -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """read rows with a header line naming the fields; line numbers count the header as line 1"""
+    reader = csv.DictReader(lines, delimiter=delimiter)
+    for row in reader:
+        yield reader.line_num, {k: v for k, v in row.items() if k and v not in (None, "")}
+
+
+def parse(number: int, operation: str | Dict[str, Any]) -> Tuple[str, Any]:
+    """validate an operation locally, returning the op name and its request model"""
+    if isinstance(operation, str):
+        operation = json.loads(operation)
+    if not isinstance(operation, dict):
+        raise ValueError(f"line {number}: expected an object, got {operation!r}")
+    operation = dict(operation)
+    op = operation.pop("op", None)
+    if op not in OPERATIONS:
+        raise ValueError(f"line {number}: unknown op {op!r}; expected one of {list(OPERATIONS)}")
+    model, _ = OPERATIONS[op]
+    return op, model(**operation)
+
+
+def result(number: int, op: str | None, success: bool, **kwargs) -> Dict[str, Any]:
+    return dict(line=number, op=op, success=success, **kwargs)
+
+
+class Batch:
+    """run operations concurrently, keeping each user's operations in their original order
+
+    resume_from skips the lines before it, all of which succeeded when it is the resume_from of a summary;
+    lines after it run again whether or not they succeeded. The summary also lists the failed lines, which
+    can be run again by themselves by passing them as lines.
+    """
+
+    def __init__(self, api, concurrency: int = 1, resume_from: int = 1, lines: Set[int] | None = None):
+        self.api = api
+        self.concurrency = max(concurrency, 1)
+        self.resume_from = resume_from
+        self.lines = lines
+        self.counts = dict(succeeded=0, failed=0, skipped=0)
+        self.failed_lines = []
+
+    def _execute(self, number, op, request):
+        _, func = OPERATIONS[op]
+        try:
+            response = func(self.api, request)
+        except Exception as ex:
+            return result(number, op, False, username=request.username, error=str(ex))
+        if hasattr(response, "model_dump"):
+            response = response.model_dump(mode="json")
+        return result(number, op, True, username=request.username, result=response)
+
+    def _count(self, ret):
+        if ret["success"]:
+            self.counts["succeeded"] += 1
+        else:
+            self.counts["failed"] += 1
+            self.failed_lines.append(ret["line"])
+        return ret
+
+    def run(self, operations: Iterable[Tuple[int, str | Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+        """yield one result per operation as each completes"""
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as executor:
+            pending = {}
+            for number, operation in operations:
+                if number < self.resume_from or (self.lines is not None and number not in self.lines):
+                    self.counts["skipped"] += 1
+                    continue
+                try:
+                    op, request = parse(number, operation)
+                except (ValueError, ValidationError) as ex:
+                    yield self._count(result(number, None, False, error=str(ex)))
+                    continue
+                while len(pending) >= self.concurrency or request.username in pending.values():
+                    done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.pop(future)
+                        yield self._count(future.result())
+                pending[executor.submit(self._execute, number, op, request)] = request.username
+            for future in as_completed(pending.keys()):
+                yield self._count(future.result())
+
+    def summary(self) -> Dict[str, Any]:
+        ret = dict(self.counts)
+        if self.failed_lines:
+            ret["resume_from"] = min(self.failed_lines)
+            ret["failed_lines"] = sorted(self.failed_lines)
+        return ret
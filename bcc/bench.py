@@ -0,0 +1,243 @@
+# load generator driving a mix of operations through the API client
+
+import itertools
+import math
+import random
+import secrets
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+OPERATIONS = ("users", "books", "mkuser", "mkbook", "rmbook", "rmuser")
+DEFAULT_MIX = "mkuser=2,mkbook=4,users=1,books=2,rmbook=2,rmuser=1"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """operation weights from a string like mkuser=2,mkbook=4"""
+    weights = {}
+    for item in [item.strip() for item in mix.split(",") if item.strip()]:
+        op, _, weight = item.partition("=")
+        if op not in OPERATIONS:
+            raise ValueError(f"unknown operation {op!r}; expected one of {list(OPERATIONS)}")
+        weights[op] = float(weight or 1)
+        if weights[op] < 0:
+            raise ValueError(f"negative weight for {op}")
+    if not any(weights.values()):
+        raise ValueError("empty operation mix")
+    return weights
+
+
+def percentile(values: List[float], p: float) -> float:
+    """nearest-rank percentile of sorted values"""
+    return values[min(len(values), max(1, math.ceil(p / 100 * len(values)))) - 1]
+
+
+def summarize(latencies: List[float]) -> Dict[str, Any]:
+    values = sorted(latencies)
+    if not values:
+        return dict(count=0)
+    ms = {p: round(percentile(values, p) * 1000, 1) for p in (50, 95, 99)}
+    return dict(count=len(values), p50=ms[50], p95=ms[95], p99=ms[99], max=round(values[-1] * 1000, 1))
+
+
+class Bench:
+    """drive a weighted mix of operations at a fixed concurrency or a fixed arrival rate, then clean up
+
+    At a fixed concurrency, each of concurrency threads sends its next operation when the last one
+    returns. At a fixed rate, operations start every 1/rate seconds on up to concurrency threads, and
+    latency counts from the scheduled start, so time spent queued behind a slow server is included.
+
+    Users are named PREFIX-N@DOMAIN. An operation on a user claims it until it returns, so operations on
+    one user never overlap; an operation with nothing to act on, such as rmbook before any book exists,
+    creates what it needs instead. Every user created is deleted afterwards, taking its books with it.
+    """
+
+    def __init__(
+        self,
+        api,
+        mix: str | Dict[str, float] = DEFAULT_MIX,
+        *,
+        concurrency: int = 4,
+        rate: float | None = None,
+        operations: int | None = None,
+        duration: float | None = None,
+        prefix: str | None = None,
+        domain: str = "bench.example.org",
+        seed: int | None = None,
+    ):
+        self.api = api
+        self.mix = parse_mix(mix) if isinstance(mix, str) else dict(mix)
+        self.concurrency = max(concurrency, 1)
+        self.rate = rate
+        self.operations = operations if operations or duration else 100
+        self.duration = duration
+        self.prefix = prefix or "bench-" + secrets.token_hex(4)
+        self.domain = domain
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.serial = 0
+        self.issued = 0
+        self.deadline = None
+        self.idle: List[str] = []
+        self.books: Dict[str, List[str]] = {}
+        self.created = set()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+
+    def _next_name(self) -> int:
+        self.serial += 1
+        return self.serial
+
+    def _claim(self, with_books: bool = False) -> str | None:
+        candidates = [i for i, username in enumerate(self.idle) if self.books[username] or not with_books]
+        if not candidates:
+            return None
+        i = self.random.choice(candidates)
+        self.idle[i], self.idle[-1] = self.idle[-1], self.idle[i]
+        return self.idle.pop()
+
+    def _plan(self) -> Tuple[str, str | None, str | None] | None:
+        """the next operation with the user it claims and a name or token, or None when done"""
+        with self.lock:
+            if self.operations and self.issued >= self.operations:
+                return None
+            if self.deadline and time.monotonic() >= self.deadline:
+                return None
+            self.issued += 1
+            op = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+            if op == "users":
+                return op, None, None
+            username = self._claim(with_books=op == "rmbook")
+            if username is None and op == "rmbook":
+                op = "mkbook"
+                username = self._claim()
+            if username is None:
+                op, username = "mkuser", f"{self.prefix}-{self._next_name()}@{self.domain}"
+                self.created.add(username)
+                self.books[username] = []
+                return op, username, None
+            if op == "mkbook":
+                return op, username, f"book {self._next_name()}"
+            if op == "rmbook":
+                books = self.books[username]
+                return op, username, books.pop(self.random.randrange(len(books)))
+            return op, username, None
+
+    def _call(self, op: str, username: str | None, arg: str | None):
+        if op == "users":
+            return self.api.users(match=self.prefix, limit=100)
+        if op == "books":
+            return self.api.books(username)
+        if op == "mkuser":
+            return self.api.add_user(username, "bench user", secrets.token_urlsafe(12))
+        if op == "mkbook":
+            return self.api.add_book(username, arg, "bench book")
+        if op == "rmbook":
+            return self.api.delete_book(username, arg)
+        return self.api.delete_user(username)
+
+    def _run(self, op: str, username: str | None, arg: str | None, started: float):
+        try:
+            result = self._call(op, username, arg)
+        except Exception as ex:
+            self._record(op, started, f"{type(ex).__name__}: {str(ex)[:200]}")
+            ok = False
+        else:
+            self._record(op, started)
+            ok = True
+        with self.lock:
+            if op == "mkbook" and ok:
+                self.books[username].append(result.token)
+            if op == "rmbook" and not ok:
+                # the book may still exist; keep it for another rmbook
+                self.books[username].append(arg)
+            if op == "rmuser" and ok:
+                self.created.discard(username)
+                del self.books[username]
+            elif username is not None and (ok or op != "mkuser"):
+                self.idle.append(username)
+
+    def _record(self, op: str, started: float, error: str | None = None):
+        elapsed = time.monotonic() - started
+        with self.lock:
+            if error:
+                self.errors[op][error] += 1
+            else:
+                self.latencies[op].append(elapsed)
+
+    def _worker(self):
+        while (planned := self._plan()) is not None:
+            self._run(*planned, time.monotonic())
+
+    def _schedule(self, executor: ThreadPoolExecutor):
+        interval = 1 / self.rate
+        start = time.monotonic()
+        for n in itertools.count():
+            scheduled = start + n * interval
+            time.sleep(max(0.0, scheduled - time.monotonic()))
+            planned = self._plan()
+            if planned is None:
+                return
+            executor.submit(self._run, *planned, scheduled)
+
+    def cleanup(self) -> Dict[str, int]:
+        """delete the users still left from the run"""
+        with self.lock:
+            usernames = sorted(self.created)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bench") as executor:
+            results = list(executor.map(self._delete, usernames))
+        return dict(users=results.count(True), failed=results.count(False))
+
+    def _delete(self, username: str) -> bool:
+        try:
+            self.api.delete_user(username)
+        except Exception:
+            # a user whose creation failed may not exist
+            try:
+                if self.api.users(username=username):
+                    return False
+            except Exception:
+                return False
+        with self.lock:
+            self.created.discard(username)
+        return True
+
+    def run(self) -> Dict[str, Any]:
+        """run the load, clean up and return the report"""
+        started = time.monotonic()
+        if self.duration:
+            self.deadline = started + self.duration
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bench") as executor:
+                if self.rate:
+                    self._schedule(executor)
+                else:
+                    for _ in range(self.concurrency):
+                        executor.submit(self._worker)
+            elapsed = time.monotonic() - started
+        finally:
+            cleanup = self.cleanup()
+        return self.report(elapsed, cleanup)
+
+    def report(self, elapsed: float, cleanup: Dict[str, int]) -> Dict[str, Any]:
+        succeeded = sum(len(latencies) for latencies in self.latencies.values())
+        failed = sum(sum(errors.values()) for errors in self.errors.values())
+        latency = {op: summarize(self.latencies[op]) for op in OPERATIONS if op in self.latencies}
+        latency["all"] = summarize([value for values in self.latencies.values() for value in values])
+        return dict(
+            mode="rate" if self.rate else "concurrency",
+            concurrency=self.concurrency,
+            rate=self.rate,
+            prefix=self.prefix,
+            elapsed=round(elapsed, 3),
+            operations=succeeded + failed,
+            succeeded=succeeded,
+            failed=failed,
+            throughput=round((succeeded + failed) / elapsed, 2) if elapsed else None,
+            users_per_minute=round(len(self.latencies.get("mkuser", [])) * 60 / elapsed, 1) if elapsed else None,
+            latency_ms=latency,
+            errors={op: dict(errors) for op, errors in self.errors.items()},
+            cleanup=cleanup,
+        )
@@ -1,21 +1,37 @@
 # baikal controller browser puppeteer
 
+import functools
 import logging
-from typing import Any, Dict, List, Tuple
-from pathlib import Path
 import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from pprint import pformat
+from typing import Any, Callable, Dict, List, Tuple
 
 import arrow
 from bs4 import BeautifulSoup
 from pydantic import validate_call
 from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException, WebDriverException
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    StaleElementReferenceException,
+    TimeoutException,
+    WebDriverException,
+)
 from selenium.webdriver.common.by import By
+from selenium.webdriver.common.timeouts import Timeouts
 from selenium.webdriver.support.ui import Select
 
-from . import settings
+from . import deadlines, settings, snapshots
+from .backend import Backend
+from .carddav import ERRORS as CARDDAV_ERRORS
+from .carddav import CardDAV
+from .database import BaikalDatabase, book_uri
 from .firefox_profile import Profile
+from .locks import locked, user_lock
 from .models import (
     VALID_TOKEN_CHARS,
     Account,
@@ -24,11 +40,22 @@ from .models import (
     Book,
     DeleteBookRequest,
     DeleteUserRequest,
+    ListFilter,
+    Target,
     User,
+    credential,
 )
+from .pages import ADMIN, USERS, Pages, books_page
+from .process import Supervised, Supervisor, SupervisorBackoff
+from .reaper import mark_directory, marked_env
+from .retry import retry
 from .version import __version__
 
-LOG_SOUP = False
+PAGE_LOAD_TIMEOUT = 300
+SCRIPT_TIMEOUT = 30
+DEADLINE_GRACE = 0.05
+LOGIN_FORM = 'body form input[id="login"]'
+VERIFY_MODES = ("full", "trust", "async")
 
 
 class BrowserException(Exception):
@@ -39,6 +66,10 @@ class BrowserInterfaceFailure(BrowserException):
     pass
 
 
+class BrowserUnavailable(BrowserInterfaceFailure):
+    """a page load failed or the browser is down; worth another attempt, unlike a page that is not as expected"""
+
+
 class InitFailed(BrowserException):
     pass
 
@@ -55,9 +86,114 @@ class UnexpectedServerResponse(BrowserException):
     pass
 
 
-class Session:
+class RequestTimeout(BrowserException):
+    pass
+
+
+TRANSIENT = (StaleElementReferenceException, WebDriverException, BrowserUnavailable)
+
+
+def user_locked(method):
+    """hold the lock of the request's user while the method mutates it"""
+
+    @functools.wraps(method)
+    def wrapper(self, admin, request, *args, **kwargs):
+        with user_lock(request.username, self.url):
+            return method(self, admin, request, *args, **kwargs)
+
+    return wrapper
+
+
+def default_target():
+    return Target(
+        name="default",
+        url=settings.CALDAV_URL,
+        client_cert=settings.CLIENT_CERT,
+        client_key=settings.CLIENT_KEY,
+        database=settings.BAIKAL_DB,
+    )
+
+
+def serialized(method):
+    """hold the session lock while the method drives the browser; one operation runs at a time
+
+    Waiting for the lock and driver timeouts are bounded by the calling thread's deadline.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        remaining = deadlines.remaining()
+        if remaining == 0.0 or not self.lock.acquire(timeout=-1 if remaining is None else remaining):
+            raise RequestTimeout(f"{method.__name__}: deadline passed waiting for the browser")
+        try:
+            return method(self, *args, **kwargs)
+        except TimeoutException as ex:
+            if deadlines.expired():
+                self._abandon(method.__name__)
+                raise RequestTimeout(f"{method.__name__}: deadline passed: {ex.msg}")
+            raise
+        except BrowserException as ex:
+            # the innermost serialized method sees the page the failure left
+            if not getattr(ex, "captured", False):
+                snapshots.ring.capture(self.driver, f"{method.__name__} failed: {ex!r}", self.target.name)
+                ex.captured = True
+            raise
+        finally:
+            self.lock.release()
+
+    return wrapper
+
+
+def database_read(method):
+    """answer a listing from the baikal database when the target has one, without the browser or its lock
+
+    The admin credential is still checked: one that has not logged in on this session logs in first.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, admin, *args, **kwargs):
+        if self.database:
+            self._authenticate(admin)
+            return getattr(self.database, method.__name__)(*args, **kwargs)
+        return method(self, admin, *args, **kwargs)
+
+    return wrapper
+
+
+def carddav_read(method):
+    """list address books over carddav when enabled, without the browser or its lock
 
-    def __init__(self, logger=None):
+    The admin credential is checked as for database reads.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, admin, *args, **kwargs):
+        if self.carddav:
+            self._authenticate(admin)
+            try:
+                return getattr(self.carddav, method.__name__)(*args, **kwargs)
+            except CARDDAV_ERRORS as ex:
+                raise BrowserInterfaceFailure(f"carddav {method.__name__} failed: {ex!r}")
+        return method(self, admin, *args, **kwargs)
+
+    return wrapper
+
+
+def retried(method):
+    """retry an idempotent read step after transient failures; the step navigates to its own page"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self._retry(method.__name__, functools.partial(method, self, *args, **kwargs))
+
+    return wrapper
+
+
+class Session(Backend):
+
+    per_admin = True
+
+    def __init__(self, logger=None, profile_dir=None, target=None):
 
         if isinstance(logger, str):
             self.logger = logging.getLogger(logger)
@@ -70,40 +206,169 @@ class Session:
 
         self.logger.info("startup")
         self.driver = None
+        self.profile_copy = None
+        self.timeouts = None
         self.logged_in = False
+        self.admin = None
+        self.authenticated = {}
+        self.login_result = (float("-inf"), "never", None)
+        self.certificates = (float("-inf"), None)
+        self.retrying = False
+        self.pages = Pages()
+        self.verify = settings.VERIFY
+        self.verifier = None
+        self.verification = dict(pending=0, verified=0, mismatched=0, failed=0)
+        self.lock = threading.RLock()
         self.startup_time = arrow.now()
         self.reset_time = None
+        self.target = target or default_target()
+        self.url = self.target.url
+        self.database = BaikalDatabase(self.target.database, self.url) if self.target.database else None
+        self.carddav = None
+        if settings.CARDDAV_BOOKS:
+            self.carddav = CardDAV(
+                self.url,
+                cert=(self.target.client_cert, self.target.client_key),
+                username=self.target.carddav_username or None,
+                password=self.target.carddav_password or None,
+            )
+
+        self.supervisor = Supervisor(
+            "browser", self._launch_driver, self._quit_driver, lock=self.lock, logger=self.logger
+        )
 
-        self.profile = Profile(logger=logger)
-        self.profile.AddCert(settings.CLIENT_CERT, settings.CLIENT_KEY)
+        with locked("profile"):
+            self.profile = Profile(logger=logger)
+        if settings.PROFILE_DIRECT and not profile_dir:
+            profile_dir = settings.PROFILE_DIR + ".direct"
+        if profile_dir:
+            self.profile = self.profile.clone(profile_dir, slim=settings.PROFILE_DIRECT)
+        self.profile.AddCert(self.target.client_cert, self.target.client_key)
 
-    def _load_driver(self):
+    @property
+    def active(self) -> bool:
+        return self.driver is not None
+
+    def health(self) -> Dict[str, Any]:
+        return dict(alive=self.supervisor.alive(), ready=self.supervisor.state != "dead", browser=self.supervisor.state)
+
+    @property
+    def read_concurrency(self) -> int:
+        return self.carddav.concurrency if self.carddav and not self.database else 1
 
-        if not self.driver:
-            options = webdriver.FirefoxOptions()
-            if settings.FIREFOX_BIN:
-                options.binary_location=settings.FIREFOX_BIN
-                bindir=Path(settings.FIREFOX_BIN).parent
-                if str(bindir) not in os.environ['PATH'].split(':'):
-                    os.environ["PATH"] = str(bindir) + ":" + os.environ['PATH']
-            if settings.HEADLESS:
-                options.add_argument('--headless')
-            options.profile = webdriver.FirefoxProfile(settings.PROFILE_DIR)
+    def _load_driver(self):
+        try:
+            self.supervisor.ensure()
+        except SupervisorBackoff as ex:
+            raise BrowserUnavailable(f"browser unavailable: {ex}")
+
+    def _launch_driver(self) -> List[Supervised]:
+        options = webdriver.FirefoxOptions()
+        if settings.FIREFOX_BIN:
+            options.binary_location = settings.FIREFOX_BIN
+            bindir = Path(settings.FIREFOX_BIN).parent
+            if str(bindir) not in os.environ["PATH"].split(":"):
+                os.environ["PATH"] = str(bindir) + ":" + os.environ["PATH"]
+        if settings.HEADLESS:
+            options.add_argument("--headless")
+        if settings.PROFILE_DIRECT:
+            # run firefox on the session's own profile copy instead of having selenium copy and zip it;
+            # its lock files guard a firefox still running there, so slim it only once none is
+            running = Supervised.using(str(self.profile.dir))
+            if running:
+                raise BrowserInterfaceFailure(f"profile {self.profile.dir} in use by {running.name} pid {running.pid}")
+            self.profile.slim()
+            options.add_argument("-profile")
+            options.add_argument(str(self.profile.dir))
+            options.set_preference("security.default_personal_cert", "Select Automatically")
+        else:
+            self._remove_profile_copy()
+            options.profile = webdriver.FirefoxProfile(str(self.profile.dir))
             options.profile.set_preference("security.default_personal_cert", "Select Automatically")
-            kwargs={}
-            if settings.WEBDRIVER_BIN:
-                kwargs['executable_path'] = settings.WEBDRIVER_BIN
-            service = webdriver.FirefoxService(**kwargs)
-            self.driver = webdriver.Firefox(options=options, service=service)
-            self.logger.debug(pformat(self.driver.capabilities))
+            # selenium leaves its profile copy behind; remove it at quit, or the reaper does after a crash
+            self.profile_copy = Path(options.profile.path).parent
+            mark_directory(self.profile_copy)
+        kwargs = {}
+        if settings.WEBDRIVER_BIN:
+            kwargs["executable_path"] = settings.WEBDRIVER_BIN
+        service = webdriver.FirefoxService(env=marked_env(), **kwargs)
+        self.driver = webdriver.Firefox(options=options, service=service)
+        self.timeouts = None
+        self.logger.debug(pformat(self.driver.capabilities))
+        processes = [Supervised.attach("geckodriver", service.process)]
+        firefox_pid = self.driver.capabilities.get("moz:processID")
+        if firefox_pid:
+            processes.append(Supervised.attach("firefox", pid=firefox_pid))
+        return processes
+
+    def _quit_driver(self):
+        if self.driver:
+            try:
+                self.driver.quit()
+            except WebDriverException as ex:
+                self.logger.warning(f"driver quit failed: {ex.msg}")
+            self.driver = None
+        self._remove_profile_copy()
+        self.logged_in = False
+        self.pages.show(None)
+
+    def _remove_profile_copy(self):
+        if self.profile_copy:
+            shutil.rmtree(self.profile_copy, ignore_errors=True)
+            self.profile_copy = None
+
+    def _bound_timeouts(self):
+        """limit page loads, including those started by clicks, and scripts to the remaining deadline"""
+        remaining = deadlines.remaining()
+        if remaining is None:
+            timeouts = (PAGE_LOAD_TIMEOUT, SCRIPT_TIMEOUT)
+        else:
+            # fire just after the deadline so the timeout is recognized as expiry
+            timeouts = (remaining + DEADLINE_GRACE,) * 2
+        if timeouts != self.timeouts:
+            self.driver.timeouts = Timeouts(page_load=timeouts[0], script=timeouts[1])
+            self.timeouts = timeouts
+
+    def _check_deadline(self, step: str):
+        if deadlines.expired():
+            self._abandon(step)
+            raise RequestTimeout(f"{step}: deadline passed")
+
+    def _retry(self, name: str, func, landed=None):
+        """run a step under the retry budget; steps nested in a retried step are retried by it"""
+        if self.retrying:
+            return func()
+        self.retrying = True
+        try:
+            return retry(name, func, transient=TRANSIENT, recover=self._recover, landed=landed, logger=self.logger)
+        finally:
+            self.retrying = False
+
+    def _recover(self):
+        """relaunch the browser and log in again if it died or baikal expired the login; a live browser
+        just re-navigates"""
+        self.pages.show(None)
+        if not self.supervisor.alive():
+            self.logger.warning("browser died; relaunching")
+            self.supervisor.restart()
+            if self.admin:
+                self._login(self.admin)
+        elif self.logged_in and self.driver.find_elements(By.CSS_SELECTOR, LOGIN_FORM):
+            self.logger.warning("admin login expired; logging in again")
+            self.logged_in = False
+            self._login(self.admin)
+
+    def _abandon(self, step: str):
+        """the page state is unknown after an interrupted operation; restart the browser on next use"""
+        self.logger.warning(f"deadline passed during {step}; resetting browser")
+        self.supervisor.stop()
 
+    @serialized
     def shutdown(self):
         self.logger.info("shutdown")
-        if self.logged_in:
+        if self.logged_in and self.supervisor.alive():
             self.logout()
-        if self.driver:
-            self.driver.quit()
-            self.driver = None
+        self.supervisor.stop()
 
     @validate_call
     def _find_elements(
@@ -116,6 +381,7 @@ class Session:
         allow_none: bool | None = False,
         click: bool | None = False,
     ) -> List[Any]:
+        self._check_deadline(name)
         if parent is None:
             parent = self.driver
         try:
@@ -130,7 +396,7 @@ class Session:
                 elements = [element for element in elements if element.text == with_text]
             if elements:
                 if click:
-                    elements[0].click()
+                    self._click(elements[0])
                 return elements
             if allow_none:
                 return elements
@@ -146,6 +412,7 @@ class Session:
         with_text: str | None = None,
         with_classes: List[str] | None = [],
     ) -> Any:
+        self._check_deadline(name)
         if parent is None:
             parent = self.driver
         try:
@@ -172,7 +439,7 @@ class Session:
         if with_text is not None:
             self._find_elements(name, selector, parent=parent, with_text=with_text, click=True)
         else:
-            self._find_element(name, selector, parent=parent, with_text=with_text).click()
+            self._click(self._find_element(name, selector, parent=parent, with_text=with_text))
 
     @validate_call
     def _check_popups(self, require_none: bool | None = False) -> List[str]:
@@ -189,26 +456,62 @@ class Session:
         if text:
             element.send_keys(text)
 
+    def _click(self, element: Any):
+        """click an element that loads a page; callers that know which page it shows record it"""
+        self.pages.show(ADMIN)
+        element.click()
+
     @validate_call
     def _get(self, path: str):
+        self._check_deadline(f"GET {path}")
         self._load_driver()
-        url = settings.CALDAV_URL + path
+        self._bound_timeouts()
+        url = self.url + path
         self.logger.info(f"GET {url}")
+        self.pages.show(None)
         try:
             self.driver.get(url)
         except WebDriverException as ex:
-            raise BrowserInterfaceFailure(ex.msg)
-
-        if LOG_SOUP:
-            soup = BeautifulSoup(self.driver.page_source, "html.parser")
-            source = soup.prettify()
-            for line in source.split("\n"):
-                self.logger.debug(line)
+            if isinstance(ex, TimeoutException) and deadlines.expired():
+                raise
+            raise BrowserUnavailable(ex.msg)
+        snapshots.ring.capture(self.driver, f"GET {path}", self.target.name)
 
     @validate_call
+    @serialized
     def login(self, admin: Account):
-        if self.logged_in == admin.username:
+        # every operation starts by logging in; pages shown by earlier operations may be stale
+        self.pages.begin()
+        # a session handed to another credential must log in again, even for the same username
+        if self.logged_in == credential(admin):
             return
+        if self.logged_in:
+            self.logout()
+        self.admin = admin
+        try:
+            self._login(admin)
+        except Exception as ex:
+            self.login_result = (time.monotonic(), f"failed: {ex!r}", credential(admin))
+            self.authenticated.pop(credential(admin), None)
+            raise
+        self.login_result = (time.monotonic(), "success", credential(admin))
+        self.authenticated[credential(admin)] = time.monotonic()
+
+    def _authenticate(self, admin: Account):
+        """check an admin credential for reads that bypass the browser, logging in afresh when it has not
+        logged in within STATUS_CACHE_TTL seconds, so a changed or revoked password stops working"""
+        checked = self.authenticated.get(credential(admin))
+        if checked is None or time.monotonic() - checked > settings.STATUS_CACHE_TTL:
+            self._reauthenticate(admin)
+
+    @serialized
+    def _reauthenticate(self, admin: Account):
+        if self.logged_in == credential(admin):
+            self.logout()
+        self.login(admin)
+
+    @retried
+    def _login(self, admin: Account):
         self.logger.info("login")
 
         self._get("/admin/")
@@ -218,14 +521,16 @@ class Session:
 
         self.logger.info(f"connected to {self.driver.title}")
 
-        self._set_text("login username field", 'body form input[id="login"]', admin.username)
+        self._set_text("login username field", LOGIN_FORM, admin.username)
         self._set_text("login password field", 'body form input[id="password"]', admin.password)
         self._click_button("login authenticate button", "body form button", with_text="Authenticate")
         self._check_popups(require_none=True)
-        self.logged_in = admin.username
+        self.pages.show(ADMIN)
+        self.logged_in = credential(admin)
         self.logger.info(f"Successfull login as '{admin.username}'")
 
     @validate_call
+    @serialized
     def initialize(self, admin: Account) -> Dict[str, str]:
         self.logger.info("initialize")
 
@@ -274,21 +579,37 @@ class Session:
         BrowserInterfaceFailure("initialization failed")
 
     # new
+    @serialized
     def logout(self):
+        if self.logged_in and not self.supervisor.alive():
+            self.logged_in = False
         if self.logged_in:
             self.logger.info("logout")
-            self._get("/admin/")
+            if not self.pages.known:
+                self._get("/admin/")
             self._click_navbar_link("Logout")
+            self.pages.show(None)
             self.logged_in = False
 
     # new
     def _select_user_page(self):
-        self._get("/admin/")
-        self._click_navbar_link("Users and resources")
+        """show a current users page, loading it directly once its path is known"""
+        if self.pages.current(USERS):
+            return
+        route = self.pages.routes.get(USERS)
+        if route:
+            self._get(route)
+        else:
+            if not self.pages.known:
+                self._get("/admin/")
+            href = self._click_navbar_link("Users and resources")
+            if href and href.startswith(self.url):
+                self.pages.routes[USERS] = href[len(self.url) :]
+        self.pages.show(USERS)
 
     # new
     @validate_call
-    def _click_navbar_link(self, label: str):
+    def _click_navbar_link(self, label: str) -> str | None:
         navbars = self._find_elements("navbar", "div.navbar")
         if len(navbars) != 1:
             raise BrowserInterfaceFailure("multiple navbars located")
@@ -296,7 +617,9 @@ class Session:
         link = links.get(label, None)
         if label not in links:
             raise BrowserInterfaceFailure(f"navbar link not found: expected={label} links={list(links.keys())}")
-        link.click()
+        href = link.get_attribute("href")
+        self._click(link)
+        return href
 
     # new
     @validate_call
@@ -312,6 +635,13 @@ class Session:
                 raise BrowserInterfaceFailure(message)
         return rows
 
+    # new
+    @validate_call
+    def _row_username(self, row: Any) -> str:
+        col_username = self._find_element("user table row displayname column", "td.col-username", parent=row)
+        username, _, _ = col_username.text.partition("\n")
+        return username.strip().lower()
+
     # new
     @validate_call
     def _parse_user_row(self, row: Any) -> Dict[str, str]:
@@ -367,19 +697,56 @@ class Session:
 
     # new
     @validate_call
-    def users(self, admin: Account) -> List[User]:
+    @retried
+    def _filter_user_rows(self, query: ListFilter) -> List[Tuple[str, Any]]:
+        """return the (username, row) pairs selected by query without fully parsing the rows"""
+        self._select_user_page()
+        rows = {}
+        for row in self._table_rows("users"):
+            username = self._row_username(row)
+            if query.matches(username):
+                rows[username] = row
+        return [(username, rows[username]) for username in query.page(list(rows.keys()))]
+
+    # new
+    @validate_call
+    @database_read
+    @serialized
+    def users(self, admin: Account, query: ListFilter | None = None) -> List[User]:
         self.logger.info("list_users")
+        query = query or ListFilter()
         self.login(admin)
-        self._select_user_page()
-        rows = self._table_rows("users")
-        return [User(**self._parse_user_row(row)) for row in rows]
+        return self._read_users(query)
+
+    @retried
+    def _read_users(self, query: ListFilter) -> List[User]:
+        return User.validate_list([self._parse_user_row(row) for _, row in self._filter_user_rows(query)])
+
+    # new
+    @validate_call
+    @database_read
+    @serialized
+    def usernames(self, admin: Account, query: ListFilter | None = None) -> List[str]:
+        self.logger.info("list_usernames")
+        query = query or ListFilter()
+        self.login(admin)
+        return [username for username, _ in self._filter_user_rows(query)]
 
     # old
     @validate_call
+    @serialized
+    @user_locked
     def add_user(self, admin: Account, request: AddUserRequest) -> User:
         self.logger.info(f"add_user {request.username} {request.displayname} ************")
         user = User(**request.model_dump())
         self.login(admin)
+        return self._retry(
+            f"add_user {user.username}",
+            functools.partial(self._add_user, user, request),
+            landed=functools.partial(self._user_added, request),
+        )
+
+    def _add_user(self, user: User, request: AddUserRequest) -> User:
         self._select_user_page()
         self._click_button("add user button", "body .btn", with_text="+ Add user")
         self._set_text("add user username field", 'body form input[name="data[username]"]', user.username)
@@ -397,7 +764,13 @@ class Session:
             with_text="Save changes",
         )
         self._check_add_popups("user", f"User {user.username} has been created.")
-        _, parsed = self._find_user_row(user.username, allow_none=False)
+        trusted = User(username=user.username, displayname=user.displayname, uri=f"principals/{user.username}")
+        return self._verify(
+            f"add_user {user.username}", user.username, trusted, functools.partial(self._read_back_user, request)
+        )
+
+    def _read_back_user(self, request: AddUserRequest) -> User:
+        _, parsed = self._find_user_row(request.username, allow_none=False)
         added = User(**parsed)
         if added.username == request.username and added.displayname == request.displayname:
             return added
@@ -405,6 +778,15 @@ class Session:
             f"added user mismatches request: added={repr(added.model_dump())} request={repr(request.model_dump())}"
         )
 
+    def _user_added(self, request: AddUserRequest) -> User | None:
+        """read back an add interrupted by a transient failure, returning the user if it was created"""
+        _, parsed = self._find_user_row(request.username)
+        if parsed:
+            added = User(**parsed)
+            if added.displayname == request.displayname:
+                return added
+        return None
+
     @validate_call
     def _check_add_popups(self, name: str, expected: str):
         popups = self._check_popups()
@@ -420,17 +802,26 @@ class Session:
 
     # old
     @validate_call
+    @serialized
+    @user_locked
     def delete_user(self, admin: Account, request: DeleteUserRequest) -> Dict[str, str]:
         username = request.username
         self.logger.info(f"delete_user {username}")
         self.login(admin)
+        return self._retry(
+            f"delete_user {username}",
+            functools.partial(self._delete_user, username),
+            landed=functools.partial(self._user_deleted, username),
+        )
+
+    def _delete_user(self, username: str) -> Dict[str, str]:
         actions = self._find_user_actions(username)
         if not actions:
             raise DeleteFailed(f"user not found: {username=}")
         button = actions.get("Delete", None)
         if not button:
             raise BrowserInterfaceFailure("failed to locate Delete button")
-        button.click()
+        self._click(button)
         self._find_elements(
             "user delete confirmation button",
             "div.alert .btn-danger",
@@ -439,8 +830,13 @@ class Session:
         )
         return dict(message=f"deleted user: {username}")
 
+    def _user_deleted(self, username: str) -> Dict[str, str] | None:
+        row, _ = self._find_user_row(username)
+        return None if row else dict(message=f"deleted user: {username}")
+
     # new
     @validate_call
+    @retried
     def _find_user_row(self, username: str, allow_none: bool | None = True) -> Tuple[Any | None, Any | None]:
         self._select_user_page()
         rows = self._table_rows("users", allow_none=allow_none)
@@ -464,14 +860,18 @@ class Session:
     # new
     @validate_call
     def _select_user_address_books(self, username: str, allow_none: bool | None = True):
+        if self.pages.current(books_page(username)):
+            return True
         buttons = self._find_user_actions(username, allow_none=allow_none)
         if buttons:
-            buttons["Address Books"].click()
+            self._click(buttons["Address Books"])
+            self.pages.show(books_page(username))
             return True
         return None
 
     # new
     @validate_call
+    @retried
     def _find_book_row(
         self, username: str, token: str, allow_none: bool | None = True
     ) -> Tuple[Any | None, Dict[str, Any] | None]:
@@ -495,17 +895,32 @@ class Session:
 
     # new
     @validate_call
-    def books(self, admin: Account, username: str) -> List[Book]:
+    @database_read
+    @carddav_read
+    @serialized
+    def books(self, admin: Account, username: str, query: ListFilter | None = None) -> List[Book]:
+        """list address books for username; query cursor and limit apply to the book tokens"""
         self.logger.info(f"list_address_books {username}")
+        query = query or ListFilter()
         self.login(admin)
+        books = {book.token: book for book in self._read_books(username)}
+        return [books[token] for token in query.page(list(books.keys()))]
+
+    @database_read
+    @carddav_read
+    def user_books(self, admin: Account, usernames: List[str]) -> Dict[str, List[Book]]:
+        return super().user_books(admin, usernames)
+
+    @retried
+    def _read_books(self, username: str) -> List[Book]:
         if not self._select_user_address_books(username):
             return []
-        rows = self._table_rows("addressbooks")
-        ret = [Book(**self._parse_book_row(row)) for row in rows]
-        return ret
+        return Book.validate_list([self._parse_book_row(row) for row in self._table_rows("addressbooks")])
 
     # old
     @validate_call
+    @serialized
+    @user_locked
     def add_book(self, admin: Account, request: AddBookRequest) -> Book:
         self.logger.info(f"add_address_book {request.username} {request.bookname} {request.description}")
         self.login(admin)
@@ -518,6 +933,13 @@ class Session:
         if row is not None:
             raise AddFailed(f"address book exists: username={book.username} token={book.token}")
 
+        return self._retry(
+            f"add_book {book.token}",
+            functools.partial(self._add_book, book, request),
+            landed=functools.partial(self._book_added, book, request),
+        )
+
+    def _add_book(self, book: Book, request: AddBookRequest) -> Book:
         self._select_user_address_books(book.username)
         self._click_button("add address book button", "body .btn", with_text="+ Add address book")
         self._set_text("add book token field", 'body form input[name="data[uri]"]', book.token)
@@ -525,26 +947,82 @@ class Session:
         self._set_text("add book description field", 'body form input[name="data[description]"]', book.description)
         self._click_button("add book save changes button", "body form .btn", with_text="Save changes")
         self._check_add_popups("addressbook", f"Address Book {book.bookname} has been created.")
-        _, parsed = self._find_book_row(request.username, token, allow_none=False)
+        trusted = book.model_copy(update=dict(contacts=0, uri=book_uri(self.url, book.username, book.token)))
+        return self._verify(
+            f"add_book {book.token}", book.username, trusted, functools.partial(self._read_back_book, book, request)
+        )
+
+    def _read_back_book(self, book: Book, request: AddBookRequest) -> Book:
+        _, parsed = self._find_book_row(request.username, book.token, allow_none=False)
         added = Book(**parsed)
         if (
             added.username == request.username
             and added.bookname == request.bookname
             and added.description == request.description
-            and added.token == token
+            and added.token == book.token
         ):
             return added
         raise AddFailed(
             f"added book mismatches request: added={repr(added.model_dump())} request={repr(request.model_dump())}"
         )
 
+    def _book_added(self, book: Book, request: AddBookRequest) -> Book | None:
+        """read back an add interrupted by a transient failure, returning the book if it was created"""
+        _, parsed = self._find_book_row(request.username, book.token)
+        if parsed:
+            added = Book(**parsed)
+            if added.bookname == request.bookname and added.description == request.description:
+                return added
+        return None
+
+    def _verify(self, name: str, username: str, trusted: Any, read_back: Callable[[], Any]) -> Any:
+        """check a write the success popup reported, per the VERIFY policy
+
+        full returns what read_back() finds on the page, raising AddFailed on a mismatch; trust returns the
+        result expected from the request; async returns that too and leaves read_back() to a background thread,
+        logged in as the admin making the write.
+        """
+        if self.verify == "full":
+            return read_back()
+        if self.verify == "async":
+            if self.verifier is None:
+                self.verifier = ThreadPoolExecutor(max_workers=1, thread_name_prefix="verify")
+            self.verification["pending"] += 1
+            self.verifier.submit(self._verify_later, name, self.admin, username, read_back)
+        return trusted
+
+    @serialized
+    def _verify_later(self, name: str, admin: Account, username: str, read_back: Callable[[], Any]):
+        try:
+            with user_lock(username, self.url):
+                self.login(admin)
+                read_back()
+            self.verification["verified"] += 1
+        except AddFailed as ex:
+            self.verification["mismatched"] += 1
+            self.logger.error(f"{name}: verification failed: {ex}")
+        except Exception as ex:
+            self.verification["failed"] += 1
+            self.logger.warning(f"{name}: verification not completed: {ex!r}")
+        finally:
+            self.verification["pending"] -= 1
+
     @validate_call
+    @serialized
+    @user_locked
     def delete_book(self, admin: Account, request: DeleteBookRequest) -> Dict[str, str]:
         self.logger.info(f"delete_address_book {request.username} {request.token}")
         self.login(admin)
         user_row, _ = self._find_user_row(request.username)
         if user_row is None:
             raise DeleteFailed(f"user not found: username={request.username}")
+        return self._retry(
+            f"delete_book {request.token}",
+            functools.partial(self._delete_book, request),
+            landed=functools.partial(self._book_deleted, request),
+        )
+
+    def _delete_book(self, request: DeleteBookRequest) -> Dict[str, str]:
         row, book = self._find_book_row(request.username, request.token)
         if not row:
             raise DeleteFailed(f"book not found: username={request.username} token={request.token}")
@@ -552,7 +1030,7 @@ class Session:
         button = actions.get("Delete", None)
         if not button:
             raise BrowserInterfaceFailure("failed to locate address book Delete button")
-        button.click()
+        self._click(button)
         self._find_elements(
             "book delete confirmation button",
             "div.alert .btn-danger",
@@ -561,7 +1039,12 @@ class Session:
         )
         return dict(message=f"deleted_book: {request.token}")
 
+    def _book_deleted(self, request: DeleteBookRequest) -> Dict[str, str] | None:
+        row, _ = self._find_book_row(request.username, request.token)
+        return None if row else dict(message=f"deleted_book: {request.token}")
+
     @validate_call
+    @serialized
     def reset(self, admin: Account) -> Dict[str, str]:
         self.logger.info("reset")
         self.shutdown()
@@ -569,25 +1052,40 @@ class Session:
         self.reset_time = arrow.now()
         return dict(message="server reset")
 
+    def _certificates(self) -> List[str] | None:
+        checked, certificates = self.certificates
+        if self.profile and time.monotonic() - checked > settings.STATUS_CACHE_TTL:
+            certificates = list(self.profile.ListCerts().keys())
+            self.certificates = (time.monotonic(), certificates)
+        return certificates
+
     @validate_call
-    def status(self, admin: Account) -> Dict[str, str]:
+    @serialized
+    def status(self, admin: Account) -> Dict[str, Any]:
         self.logger.info("status")
 
-        try:
-            self.login(admin)
-            login = "success"
-        except Exception as e:
-            login = f"failed: {repr(e)}"
+        # the cached login result only answers for the credential it was found with
+        checked, login, key = self.login_result
+        if key != credential(admin) or time.monotonic() - checked > settings.STATUS_CACHE_TTL:
+            try:
+                self.login(admin)
+            except Exception:
+                pass
+            _, login, _ = self.login_result
 
         return dict(
             name="bcc",
             version=__version__,
             driver=repr(self.driver),
-            url=settings.CALDAV_URL,
+            browser=self.supervisor.status(),
+            target=self.target.name,
+            url=self.url,
             uptime=self.startup_time.humanize(),
             reset=self.reset_time.humanize() if self.reset_time else "never",
             profile_dir=settings.PROFILE_NAME if self.profile else None,
-            certificates=repr(list(self.profile.ListCerts().keys()) if self.profile else None),
-            certificate_loaded=settings.CLIENT_CERT,
+            certificates=repr(self._certificates()),
+            certificate_loaded=self.target.client_cert,
             login=login,
+            verify=self.verify,
+            verification=dict(self.verification),
         )
@@ -0,0 +1,162 @@
+# address book listings from the baikal carddav endpoint
+
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from urllib.parse import quote, unquote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import settings
+from .database import book_uri
+from .models import Book, ListFilter
+
+NS = {"d": "DAV:", "card": "urn:ietf:params:xml:ns:carddav"}
+
+BOOKS_PROPFIND = """<?xml version="1.0" encoding="utf-8"?>
+<d:propfind xmlns:d="DAV:" xmlns:card="urn:ietf:params:xml:ns:carddav">
+  <d:prop><d:resourcetype/><d:displayname/><card:addressbook-description/><d:sync-token/></d:prop>
+</d:propfind>"""
+
+CARDS_PROPFIND = """<?xml version="1.0" encoding="utf-8"?>
+<d:propfind xmlns:d="DAV:"><d:prop><d:resourcetype/><d:getetag/></d:prop></d:propfind>"""
+
+CARDS_SYNC = """<?xml version="1.0" encoding="utf-8"?>
+<d:sync-collection xmlns:d="DAV:">
+  <d:sync-token>{token}</d:sync-token><d:sync-level>1</d:sync-level><d:prop><d:getetag/></d:prop>
+</d:sync-collection>"""
+
+
+class CardDAVFailure(Exception):
+    pass
+
+
+ERRORS = (requests.RequestException, CardDAVFailure, ET.ParseError)
+
+
+class CardDAV:
+    """list address books with PROPFIND requests over a pool of keep-alive connections
+
+    One Depth 1 PROPFIND on a user's address book home returns the books with their sync tokens. Card
+    counts are kept with the token they were counted at, so an unchanged book costs no further request;
+    a changed book is brought up to date with a sync-collection REPORT returning only the cards changed
+    since. Books of a server without sync tokens are counted with a Depth 1 PROPFIND. Listings for several
+    users run concurrently.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        cert: Tuple[str, str] | None = None,
+        username: str | None = None,
+        password: str | None = None,
+        concurrency: int | None = None,
+    ):
+        self.url = url.rstrip("/")
+        self.concurrency = settings.get(concurrency, "CARDDAV_CONCURRENCY")
+        self.session = requests.Session()
+        self.session.cert = cert
+        username = settings.get(username, "CARDDAV_USERNAME")
+        if username:
+            self.session.auth = (username, settings.get(password, "CARDDAV_PASSWORD", settings.Get.DECODE_SECRET))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # book path: (sync token, hrefs of its cards at that token)
+        self.cards: Dict[str, Tuple[str, frozenset]] = {}
+        self.lock = threading.Lock()
+
+    def _request(self, method: str, path: str, body: str, depth: str):
+        return self.session.request(
+            method,
+            self.url + path,
+            data=body,
+            headers={"Depth": depth, "Content-Type": "application/xml; charset=utf-8"},
+        )
+
+    def _propfind(self, path: str, body: str) -> List[ET.Element]:
+        response = self._request("PROPFIND", path, body, "1")
+        if response.status_code == 404:
+            return []
+        if response.status_code != 207:
+            raise CardDAVFailure(f"PROPFIND {path}: {response.status_code} {response.reason}")
+        return ET.fromstring(response.content).findall("d:response", NS)
+
+    def _sync(self, path: str, token: str) -> ET.Element | None:
+        """the cards changed since token, or None when the server no longer accepts the token"""
+        response = self._request("REPORT", path, CARDS_SYNC.format(token=token), "0")
+        if response.status_code in (403, 409) and token:
+            return None
+        if response.status_code != 207:
+            raise CardDAVFailure(f"REPORT {path}: {response.status_code} {response.reason}")
+        return ET.fromstring(response.content)
+
+    def _props(self, response: ET.Element) -> ET.Element:
+        """merge the properties of the successful propstat elements of a response"""
+        props = ET.Element("prop")
+        for propstat in response.findall("d:propstat", NS):
+            prop = propstat.find("d:prop", NS)
+            if prop is not None and " 200 " in propstat.findtext("d:status", "", NS):
+                props.extend(prop)
+        return props
+
+    def _home(self, username: str) -> str:
+        return f"/dav.php/addressbooks/{quote(username, safe='@')}/"
+
+    def _contacts(self, path: str, token: str) -> int:
+        if not token:
+            responses = self._propfind(path, CARDS_PROPFIND)
+            return len([r for r in responses if self._props(r).find("d:resourcetype/d:collection", NS) is None])
+        with self.lock:
+            cached = self.cards.get(path)
+        if cached and cached[0] == token:
+            return len(cached[1])
+        hrefs = set(cached[1]) if cached else set()
+        changes = self._sync(path, cached[0]) if cached else None
+        if changes is None:
+            hrefs = set()
+            changes = self._sync(path, "")
+        for response in changes.findall("d:response", NS):
+            href = unquote(response.findtext("d:href", "", NS))
+            if href.endswith("/"):
+                continue
+            if " 404 " in response.findtext("d:status", "", NS):
+                hrefs.discard(href)
+            else:
+                hrefs.add(href)
+        with self.lock:
+            self.cards[path] = (changes.findtext("d:sync-token", "", NS) or token, frozenset(hrefs))
+        return len(hrefs)
+
+    def books(self, username: str, query: ListFilter | None = None) -> List[Book]:
+        query = query or ListFilter()
+        home = self._home(username)
+        found, sync_tokens = {}, {}
+        for response in self._propfind(home, BOOKS_PROPFIND):
+            prop = self._props(response)
+            if prop.find("d:resourcetype/card:addressbook", NS) is None:
+                continue
+            token = unquote(response.findtext("d:href", "", NS)).rstrip("/").split("/")[-1]
+            found[token] = dict(
+                token=token,
+                username=username,
+                bookname=prop.findtext("d:displayname", "", NS),
+                description=prop.findtext("card:addressbook-description", "", NS),
+                uri=book_uri(self.url, username, token),
+            )
+            sync_tokens[token] = prop.findtext("d:sync-token", "", NS)
+        with self.lock:
+            for path in [path for path in self.cards if path.startswith(home)]:
+                if unquote(path[len(home) :]).rstrip("/") not in found:
+                    del self.cards[path]
+        rows = [found[token] for token in query.page(list(found.keys()))]
+        for row in rows:
+            row["contacts"] = self._contacts(home + quote(row["token"]) + "/", sync_tokens[row["token"]])
+        return Book.validate_list(rows)
+
+    def user_books(self, usernames: List[str]) -> Dict[str, List[Book]]:
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="carddav") as executor:
+            return dict(zip(usernames, executor.map(self.books, usernames)))
@@ -1,5 +1,7 @@
 """bcc cli"""
 
+import csv
+import io
 import json
 import logging
 import sys
@@ -9,6 +11,9 @@ import click
 import uvicorn
 
 from . import settings
+from .archive import ARCHIVE_FORMATS, Export, Import, archive_format, read_archive
+from .batch import Batch, read_csv, read_ndjson
+from .bench import DEFAULT_MIX, Bench, parse_mix
 from .client import API
 from .exception_handler import ExceptionHandler
 from .shell import _shell_completion
@@ -25,17 +30,81 @@ def _ehandler(ctx, option, debug):
     return debug
 
 
-def render(obj):
-    if hasattr(obj, "model_dump_json"):
-        return json.loads(obj.model_dump_json())
-    if isinstance(obj, Iterable) and not (isinstance(obj, (str, bytes, dict))):
-        return [render(o) for o in obj]
-    else:
-        return obj
+def render(obj, fields=None):
+    """convert obj to plain data, selecting fields from records"""
+    if hasattr(obj, "model_dump"):
+        obj = obj.model_dump(mode="json")
+    if fields and isinstance(obj, dict):
+        obj = {field: obj.get(field) for field in fields}
+    return obj
+
+
+def is_records(obj):
+    return isinstance(obj, Iterable) and not (isinstance(obj, (str, bytes, dict)))
+
+
+def _cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return "" if value is None else value
+
+
+def _output_json(records):
+    """stream records in the layout of json.dumps(list, indent=2), one record at a time"""
+    sep = "[\n"
+    for record in records:
+        click.echo(sep + "\n".join("  " + line for line in json.dumps(record, indent=2).split("\n")), nl=False)
+        sep = ",\n"
+    click.echo("[]" if sep == "[\n" else "\n]")
+
+
+def _output_table(records, fields, delimiter):
+    buffer = io.StringIO()
+    writer = None
+    for record in records:
+        if not isinstance(record, dict):
+            record = dict(value=record)
+        if writer is None:
+            writer = csv.DictWriter(buffer, fields or list(record), delimiter=delimiter, lineterminator="\n")
+            writer.writeheader()
+        writer.writerow({k: _cell(v) for k, v in record.items()})
+        click.echo(buffer.getvalue(), nl=False)
+        buffer.seek(0)
+        buffer.truncate()
 
 
 def output(obj):
-    click.echo(json.dumps(render(obj), indent=2))
+    fmt = settings.OUTPUT_FORMAT
+    fields = [field.strip() for field in settings.OUTPUT_FIELDS.split(",") if field.strip()]
+    if is_records(obj):
+        records = (render(o, fields) for o in obj)
+    elif fmt == "json":
+        click.echo(json.dumps(render(obj, fields), indent=2))
+        return
+    else:
+        records = [render(obj, fields)]
+    if fmt == "json":
+        _output_json(records)
+    elif fmt == "ndjson":
+        for record in records:
+            click.echo(json.dumps(record))
+    elif fmt in ["csv", "tsv"]:
+        _output_table(records, fields, "," if fmt == "csv" else "\t")
+    else:
+        raise ValueError(f"unknown output format: {fmt}")
+
+
+def output_cursor(api):
+    """show the cursor of the next page on stderr, keeping the listing on stdout intact"""
+    if api.next_cursor:
+        click.echo(f"next cursor: {api.next_cursor}", err=True)
+
+
+def _override(options, names):
+    """set each setting named in names from its command line option, when the option was given"""
+    for option, name in names.items():
+        if options[option] is not None:
+            setattr(settings, name, options[option])
 
 
 @click.group("bcc")
@@ -43,12 +112,18 @@ def output(obj):
 @click.option("-d", "--debug", is_eager=True, envvar="DEBUG", is_flag=True, callback=_ehandler, help="debug mode")
 @click.option("-u", "--username", help="username (default: admin)")
 @click.option("-p", "--password", help="password")
-@click.option("--caldav-url", help="caldav server URL")
+@click.option("--caldav-url", help="caldav server URL, or comma separated URLs to spread requests across")
 @click.option("--bcc-url", help="bcc server URL")
 @click.option("-l", "--log-level", help="server log level (default: WARNING)")
 @click.option("-c", "--cert", help="cient certificate file")
 @click.option("-k", "--key", help="client certificate key file")
 @click.option("-a", "--api-key", help="bcc API key")
+@click.option(
+    "-f", "--format", "output_format", type=click.Choice(["json", "ndjson", "csv", "tsv"]), help="output format"
+)
+@click.option("--fields", help="comma separated output fields, ex: username,token")
+@click.option("-t", "--target", help="named baikal target (default: default)")
+@click.option("--request-timeout", type=float, help="seconds before the server abandons a request (0: no limit)")
 @click.option(
     "--shell-completion",
     is_flag=False,
@@ -57,27 +132,44 @@ def output(obj):
     help="configure shell completion",
 )
 @click.pass_context
-def bcc(ctx, debug, username, password, caldav_url, bcc_url, cert, key, api_key, log_level, shell_completion):
+def bcc(
+    ctx,
+    debug,
+    username,
+    password,
+    caldav_url,
+    bcc_url,
+    cert,
+    key,
+    api_key,
+    output_format,
+    fields,
+    target,
+    request_timeout,
+    log_level,
+    shell_completion,
+):
     """bcc - bcc control console"""
 
     if debug is not None:
         settings.DEBUG = True
-    if username is not None:
-        settings.USERNAME = username
-    if password is not None:
-        settings.PASSWORD = password
-    if caldav_url is not None:
-        settings.CALDAV_URL = caldav_url
-    if bcc_url is not None:
-        settings.BCC_URL = bcc_url
-    if cert is not None:
-        settings.CLIENT_CERT = cert
-    if key is not None:
-        settings.CLIENT_KEY = key
-    if api_key is not None:
-        settings.API_KEY = api_key
-    if log_level is not None:
-        settings.LOG_LEVEL = log_level
+    _override(
+        locals(),
+        dict(
+            username="USERNAME",
+            password="PASSWORD",
+            caldav_url="CALDAV_URL",
+            bcc_url="BCC_URL",
+            cert="CLIENT_CERT",
+            key="CLIENT_KEY",
+            api_key="API_KEY",
+            output_format="OUTPUT_FORMAT",
+            fields="OUTPUT_FIELDS",
+            target="TARGET",
+            request_timeout="REQUEST_TIMEOUT",
+            log_level="LOG_LEVEL",
+        ),
+    )
 
     logging.basicConfig(level=log_level)
 
@@ -95,10 +187,19 @@ def config(ctx, insecure):
 
 
 @bcc.command
+@click.option("--username", help="select exact username")
+@click.option("-m", "--match", help="select usernames by prefix or glob pattern")
+@click.option("--limit", type=int, help="return at most LIMIT users")
+@click.option("--cursor", help="return users following CURSOR, shown on stderr after the previous page")
+@click.option("-b", "--background", is_flag=True, help="run as a background job and output the job status")
 @click.pass_obj
-def users(ctx):
+def users(ctx, username, match, limit, cursor, background):
     """list users"""
-    output(ctx.users())
+    if background:
+        output(ctx.users(username=username, match=match, limit=limit, cursor=cursor, background=True))
+    else:
+        output(ctx.iter_users(username=username, match=match, limit=limit, cursor=cursor))
+        output_cursor(ctx)
 
 
 @bcc.command
@@ -121,10 +222,18 @@ def rmuser(ctx, username):
 
 @bcc.command
 @click.argument("username", required=False)
+@click.option("-m", "--match", help="select users by prefix or glob pattern")
+@click.option("--limit", type=int, help="return at most LIMIT address books")
+@click.option("--cursor", help="return books following CURSOR, shown on stderr after the previous page")
+@click.option("-b", "--background", is_flag=True, help="run as a background job and output the job status")
 @click.pass_obj
-def books(ctx, username):
+def books(ctx, username, match, limit, cursor, background):
     """list address books for user"""
-    output(ctx.books(username))
+    if background:
+        output(ctx.books(username, match=match, limit=limit, cursor=cursor, background=True))
+    else:
+        output(ctx.iter_books(username, match=match, limit=limit, cursor=cursor))
+        output_cursor(ctx)
 
 
 @bcc.command
@@ -146,6 +255,126 @@ def rmbook(ctx, username, token):
     output(ctx.delete_book(username, token))
 
 
+@bcc.command
+@click.argument("file", type=click.File("r"), default="-")
+@click.option("-i", "--input-format", type=click.Choice(["ndjson", "csv"]), help="input format (default: from suffix)")
+@click.option("-j", "--concurrency", type=int, default=1, show_default=True, help="concurrent requests")
+@click.option("-r", "--resume-from", type=int, default=1, help="skip operations before this input line")
+@click.option("-L", "--lines", help="run only these comma separated input lines, ex: the failed_lines of a summary")
+@click.pass_obj
+def batch(ctx, file, input_format, concurrency, resume_from, lines):
+    """run mkuser, rmuser, mkbook and rmbook operations from FILE (default: stdin)
+
+    \b
+    NDJSON: one object per line, ex: {"op": "mkuser", "username": ..., "displayname": ..., "password": ...}
+    CSV: a header line naming op and the operation fields, then one operation per line
+
+    The summary lists failed_lines, and resume_from, the first of them. --resume-from runs every line from
+    there again, including lines that succeeded; --lines runs just the failed ones.
+    """
+    if lines is not None:
+        try:
+            lines = {int(line) for line in lines.split(",") if line.strip()}
+        except ValueError:
+            raise click.BadParameter(f"not a list of line numbers: {lines}", param_hint="--lines")
+    if input_format is None:
+        input_format = "csv" if file.name.endswith(".csv") else "ndjson"
+    operations = read_csv(file) if input_format == "csv" else read_ndjson(file)
+    ctx.set_pool_size(concurrency)
+    runner = Batch(ctx, concurrency=concurrency, resume_from=resume_from, lines=lines)
+    for result in runner.run(operations):
+        click.echo(json.dumps(result))
+    summary = runner.summary()
+    click.echo(json.dumps(summary), err=True)
+    if summary["failed"]:
+        sys.exit(1)
+
+
+@bcc.command("export")
+@click.argument("archive", default="-")
+@click.option(
+    "-F", "--archive-format", "fmt", type=click.Choice(ARCHIVE_FORMATS), help="archive format (default: from suffix)"
+)
+@click.option("-j", "--concurrency", type=int, default=4, show_default=True, help="concurrent requests")
+@click.option("--page-size", type=int, default=100, show_default=True, help="users listed per request")
+@click.option("--restart", is_flag=True, help="ignore the checkpoint of an interrupted export and start over")
+@click.pass_obj
+def export_archive(ctx, archive, fmt, concurrency, page_size, restart):
+    """write all users and address books to ARCHIVE (default: stdout)
+
+    An interrupted export to a file resumes from ARCHIVE.checkpoint when run again.
+    """
+    ctx.set_pool_size(concurrency)
+    exporter = Export(ctx, archive, fmt=fmt, page_size=page_size, concurrency=concurrency, restart=restart)
+    click.echo(json.dumps(exporter.run()), err=True)
+
+
+@bcc.command("import")
+@click.argument("archive", type=click.File("rb"), default="-")
+@click.option(
+    "-F", "--archive-format", "fmt", type=click.Choice(ARCHIVE_FORMATS), help="archive format (default: from suffix)"
+)
+@click.option("-j", "--concurrency", type=int, default=4, show_default=True, help="users restored at once")
+@click.option("--password", help="password for added users (default: random, output with each result)")
+@click.pass_obj
+def import_archive(ctx, archive, fmt, concurrency, password):
+    """restore users and address books from ARCHIVE (default: stdin), skipping those that exist"""
+    ctx.set_pool_size(concurrency)
+    importer = Import(ctx, concurrency=concurrency, password=password)
+    for result in importer.run(read_archive(archive, archive_format(archive.name, fmt))):
+        click.echo(json.dumps(result))
+    summary = importer.summary()
+    click.echo(json.dumps(summary), err=True)
+    if summary["failed"]:
+        sys.exit(1)
+
+
+def _mix(ctx, param, value):
+    try:
+        return parse_mix(value)
+    except ValueError as ex:
+        raise click.BadParameter(str(ex))
+
+
+@bcc.command
+@click.option("-m", "--mix", default=DEFAULT_MIX, show_default=True, callback=_mix, help="operation weights")
+@click.option("-j", "--concurrency", type=int, default=4, show_default=True, help="concurrent requests")
+@click.option(
+    "-r",
+    "--rate",
+    type=float,
+    help="start this many operations per second, up to -j at once (default: -j back to back)",
+)
+@click.option("-n", "--operations", type=int, help="operations to run (default: 100 without --duration)")
+@click.option("-D", "--duration", type=float, help="seconds to run")
+@click.option("--prefix", help="username prefix (default: random)")
+@click.option("--domain", default="bench.example.org", show_default=True, help="username domain")
+@click.option("--seed", type=int, help="random seed for the operation sequence")
+@click.pass_obj
+def bench(ctx, mix, concurrency, rate, operations, duration, prefix, domain, seed):
+    """run a generated load of users, books, mkuser, mkbook, rmbook and rmuser operations
+
+    Outputs throughput, latency percentiles and errors per operation as JSON, after deleting every user
+    the run created.
+    """
+    ctx.set_pool_size(concurrency)
+    runner = Bench(
+        ctx,
+        mix,
+        concurrency=concurrency,
+        rate=rate,
+        operations=operations,
+        duration=duration,
+        prefix=prefix,
+        domain=domain,
+        seed=seed,
+    )
+    report = runner.run()
+    click.echo(json.dumps(report, indent=2))
+    if report["cleanup"]["failed"]:
+        sys.exit(1)
+
+
 @bcc.command
 @click.pass_obj
 def reset(ctx):
@@ -154,10 +383,40 @@ def reset(ctx):
 
 
 @bcc.command
+@click.option("-b", "--background", is_flag=True, help="run as a background job and output the job status")
 @click.pass_obj
-def initialize(ctx):
+def initialize(ctx, background):
     """initialize freshly installed server"""
-    output(ctx.initialize())
+    output(ctx.initialize(background=background))
+
+
+@bcc.command
+@click.argument("job-id")
+@click.option("-w", "--wait", is_flag=True, help="wait for the job to finish and output its result")
+@click.option("--timeout", type=float, help="seconds to wait before giving up")
+@click.pass_obj
+def job(ctx, job_id, wait, timeout):
+    """output background job status"""
+    if wait:
+        output(ctx.wait(job_id, timeout=timeout))
+    else:
+        output(ctx.job(job_id))
+
+
+@bcc.command
+@click.pass_obj
+def jobs(ctx):
+    """list background jobs"""
+    output(ctx.jobs())
+
+
+@bcc.command
+@click.option("--since", type=int, help="resume after event id SINCE")
+@click.pass_obj
+def events(ctx, since):
+    """follow user and address book change events, one JSON object per line"""
+    for event in ctx.events(since=since):
+        click.echo(json.dumps(event))
 
 
 @bcc.command
@@ -189,15 +448,47 @@ def uptime(ctx):
 
 
 @bcc.command
+@click.option("-w", "--workers", type=int, help="number of worker processes, each with its own browser")
+@click.option("--loop", type=click.Choice(["auto", "asyncio", "uvloop"]), help="event loop implementation")
+@click.option("--http", type=click.Choice(["auto", "h11", "httptools"]), help="HTTP protocol implementation")
+@click.option("--backend", type=click.Choice(["browser", "memory"]), help="backend implementation (default: browser)")
+@click.option(
+    "--verify",
+    type=click.Choice(["full", "trust", "async"]),
+    help="read back added users and books before responding, trust the success message, or check in the background",
+)
+@click.option(
+    "--profile-direct/--profile-copy",
+    default=None,
+    help="run each browser on its own slimmed profile copy, or on a copy selenium makes at every launch",
+)
 @click.pass_context
-def server(ctx):
+def server(ctx, workers, loop, http, backend, verify, profile_direct):
     """API server"""
 
+    _override(
+        locals(),
+        dict(
+            workers="WORKERS",
+            loop="LOOP",
+            http="HTTP",
+            backend="BACKEND",
+            verify="VERIFY",
+            profile_direct="PROFILE_DIRECT",
+        ),
+    )
+
+    if settings.WORKERS > 1:
+        settings.export()
+
     uvicorn.run(
         "bcc:app",
         host=settings.ADDRESS,
         port=settings.PORT,
         log_level=settings.LOG_LEVEL.lower(),
+        workers=settings.WORKERS,
+        loop=settings.LOOP,
+        http=settings.HTTP,
     )
 
 
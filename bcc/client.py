@@ -1,9 +1,14 @@
 # bcc API client
 
-from typing import Dict, List
+import itertools
+import json
+import random
+import time
+from typing import Any, Dict, Iterator, List
 
 import requests
 from pydantic import validate_call
+from requests.adapters import HTTPAdapter
 from requests.exceptions import JSONDecodeError
 
 from . import settings
@@ -13,16 +18,28 @@ from .models import (
     AddUserRequest,
     AddUserResponse,
     Book,
-    BooksResponse,
     DeleteBookRequest,
     DeleteUserRequest,
     StatusResponse,
     User,
-    UsersResponse,
 )
+from .shards import Endpoint, Shards
+
+# responses meaning the server, rather than the request, failed
+UNAVAILABLE = (502, 503)
 
 
 class API:
+    """bcc API client
+
+    url may list several bcc servers, comma separated. Writes for a user go to the server chosen by a
+    consistent hash of the username, reads go to the server with the fewest requests in flight and move to
+    another server when a connection fails, and servers that keep failing are ejected for a while. A
+    background job is followed on the server that runs it; events are followed on the first server.
+
+    After a listing, next_cursor holds the cursor of the following page, or is empty after the last page.
+    """
+
     @validate_call
     def __init__(
         self,
@@ -33,8 +50,18 @@ class API:
         client_cert: str | None = None,
         client_key: str | None = None,
         api_key: str | None = None,
+        target: str | None = None,
+        pool_size: int | None = None,
+        request_timeout: float | None = None,
+        overload_retries: int | None = None,
+        overload_backoff: float | None = None,
     ):
-        self.url = settings.get(url, "CALDAV_URL").strip("/")
+        self.shards = Shards(settings.get(url, "CALDAV_URL"))
+        self.url = self.shards.endpoints[0].url
+        self.job_endpoints: Dict[str, Endpoint] = {}
+        self.next_cursor = ""
+        self.overload_retries = settings.get(overload_retries, "OVERLOAD_RETRIES")
+        self.overload_backoff = settings.get(overload_backoff, "OVERLOAD_BACKOFF")
 
         self.session = requests.Session()
         self.session.cert = (
@@ -48,6 +75,16 @@ class API:
         self.session.headers["X-Api-Key"] = settings.get(
             api_key, "API_KEY", settings.Get.DECODE_SECRET, settings.Get.OPTIONAL_READ_FILE
         )
+        self.session.headers["X-Baikal-Target"] = settings.get(target, "TARGET")
+        self.session.headers["X-Request-Timeout"] = str(settings.get(request_timeout, "REQUEST_TIMEOUT"))
+        if pool_size:
+            self.set_pool_size(pool_size)
+
+    def set_pool_size(self, size: int):
+        """keep up to size connections open for concurrent requests"""
+        adapter = HTTPAdapter(pool_connections=len(self.shards), pool_maxsize=size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     def _parse_response(self, response):
         if response.ok:
@@ -58,8 +95,59 @@ class API:
             message = f"{str(response)} {response.reason}"
         raise RuntimeError(message)
 
-    def _request(self, func, path, **kwargs):
-        return self._parse_response(func(f"{self.url}/{path.strip('/')}/", **kwargs))
+    def _retry_delay(self, response, attempt: int) -> float:
+        """the server's Retry-After, or exponential backoff without one, plus random jitter"""
+        window = self.overload_backoff * 2**attempt
+        try:
+            delay = float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            delay = window
+        return delay + random.uniform(0, window)
+
+    def _send(self, func, url, **kwargs):
+        """send a request, waiting and sending it again while the server answers 429 Too Many Requests"""
+        for attempt in itertools.count():
+            response = func(url, **kwargs)
+            if response.status_code != 429 or attempt >= self.overload_retries:
+                return response
+            response.close()
+            time.sleep(self._retry_delay(response, attempt))
+
+    def _route(self, func, path, key, exclude) -> Endpoint:
+        if func == self.session.get:
+            return self.shards.least_loaded(exclude)
+        return self.shards.hashed(key or path, exclude)
+
+    def _dispatch(self, func, path, key=None, endpoint=None, **kwargs):
+        """send a request to a routed server, or to endpoint, returning the server and the response
+
+        A read whose connection fails is sent to the next server; a write is not, as it may have landed.
+        """
+        tried = []
+        while True:
+            chosen = endpoint or self._route(func, path, key, tried)
+            try:
+                with self.shards.track(chosen):
+                    response = self._send(func, f"{chosen.url}/{path.strip('/')}/", **kwargs)
+            except requests.RequestException as ex:
+                self.shards.report(chosen, False)
+                tried.append(chosen)
+                retry = isinstance(ex, requests.ConnectionError) and func == self.session.get
+                if endpoint or not retry or len(tried) >= len(self.shards):
+                    raise
+                continue
+            self.shards.report(chosen, response.status_code not in UNAVAILABLE)
+            return chosen, response
+
+    def _request(self, func, path, background=False, **kwargs):
+        if background:
+            headers = {"Prefer": "respond-async", "X-Request-Timeout": None}
+            kwargs["headers"] = dict(kwargs.get("headers", {}), **headers)
+            endpoint, response = self._dispatch(func, path, **kwargs)
+            job = self._parse_response(response)["job"]
+            self.job_endpoints[job["id"]] = endpoint
+            return job
+        return self._parse_response(self._dispatch(func, path, **kwargs)[1])
 
     def _get(self, path, **kwargs):
         return self._request(self.session.get, path, **kwargs)
@@ -76,48 +164,173 @@ class API:
         return response.status
 
     @validate_call
-    def initialize(self) -> Dict[str, str]:
-        return self._post("initialize")
+    def initialize(self, background: bool = False) -> Dict[str, Any]:
+        return self._post("initialize", background=background)
 
     @validate_call
     def reset(self) -> Dict[str, str]:
         return self._post("reset")
 
+    def _list_params(self, **kwargs):
+        return {k: v for k, v in kwargs.items() if v}
+
+    @validate_call
+    def users(
+        self,
+        *,
+        username: str | None = None,
+        match: str | None = None,
+        limit: int | None = None,
+        cursor: str | None = None,
+        background: bool = False,
+    ) -> List[User] | Dict[str, Any]:
+        params = self._list_params(username=username, match=match, limit=limit, cursor=cursor)
+        if background:
+            return self._get("users", params=params, background=True)
+        response = self._get("users", params=params)
+        self.next_cursor = response.get("cursor") or ""
+        return User.trusted_list(response["users"])
+
+    def _iter_records(self, path, model, params):
+        """stream a listing as NDJSON, constructing one record per line"""
+        headers = {"Accept": "application/x-ndjson"}
+        endpoint, response = self._dispatch(self.session.get, path, params=params, headers=headers, stream=True)
+        # the body is still in flight while it streams
+        with self.shards.track(endpoint), response:
+            if not response.ok:
+                self._parse_response(response)
+            self.next_cursor = response.headers.get("X-Next-Cursor", "")
+            for line in response.iter_lines():
+                if line:
+                    yield model.trusted(json.loads(line))
+
     @validate_call
-    def users(self) -> List[User]:
-        response = UsersResponse(**self._get("users"))
-        return response.users
+    def iter_users(
+        self,
+        *,
+        username: str | None = None,
+        match: str | None = None,
+        limit: int | None = None,
+        cursor: str | None = None,
+    ) -> Iterator[User]:
+        params = self._list_params(username=username, match=match, limit=limit, cursor=cursor)
+        return self._iter_records("users", User, params)
 
     @validate_call
     def add_user(self, username: str, displayname: str, password: str) -> User:
         request = AddUserRequest(username=username, displayname=displayname, password=password)
-        response = AddUserResponse(**self._post("user", data=request.model_dump_json()))
+        response = AddUserResponse(**self._post("user", data=request.model_dump_json(), key=username))
         return response.user
 
     @validate_call
     def delete_user(self, username: str) -> Dict[str, str]:
         request = DeleteUserRequest(username=username)
-        return self._delete("user", data=request.model_dump_json())
+        return self._delete("user", data=request.model_dump_json(), key=username)
 
     @validate_call
-    def books(self, username: str | None = None) -> List[Book]:
+    def books(
+        self,
+        username: str | None = None,
+        *,
+        match: str | None = None,
+        limit: int | None = None,
+        cursor: str | None = None,
+        background: bool = False,
+    ) -> List[Book] | Dict[str, Any]:
         if username:
             path = f"books/{username}"
+            params = self._list_params(limit=limit, cursor=cursor)
         else:
             path = "books"
-        result = BooksResponse(**self._get(path))
-        return result.books
+            params = self._list_params(match=match, limit=limit, cursor=cursor)
+        if background:
+            return self._get(path, params=params, background=True)
+        response = self._get(path, params=params)
+        self.next_cursor = response.get("cursor") or ""
+        return Book.trusted_list(response["books"])
+
+    @validate_call
+    def iter_books(
+        self,
+        username: str | None = None,
+        *,
+        match: str | None = None,
+        limit: int | None = None,
+        cursor: str | None = None,
+    ) -> Iterator[Book]:
+        if username:
+            return self._iter_records(f"books/{username}", Book, self._list_params(limit=limit, cursor=cursor))
+        return self._iter_records("books", Book, self._list_params(match=match, limit=limit, cursor=cursor))
 
     @validate_call
     def add_book(self, username: str, bookname: str, description: str) -> Book:
         request = AddBookRequest(username=username, bookname=bookname, description=description)
-        response = AddBookResponse(**self._post("book", data=request.model_dump_json()))
+        response = AddBookResponse(**self._post("book", data=request.model_dump_json(), key=username))
         return response.book
 
     @validate_call
     def delete_book(self, username: str, token: str) -> Dict[str, str]:
         request = DeleteBookRequest(username=username, token=token)
-        return self._delete("book", data=request.model_dump_json())
+        return self._delete("book", data=request.model_dump_json(), key=username)
+
+    def events(self, since: int | None = None) -> Iterator[Dict[str, Any]]:
+        """follow the server-sent change events, yielding each event's data with its type"""
+        params = {} if since is None else dict(since=since)
+        url = f"{self.url}/events/"
+        with self.session.get(url, params=params, headers={"Accept": "text/event-stream"}, stream=True) as response:
+            if not response.ok:
+                self._parse_response(response)
+            event, data = None, []
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if not line:
+                    if data:
+                        yield dict(json.loads("\n".join(data)), type=event or "message")
+                    event, data = None, []
+                elif line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+
+    @validate_call
+    def job(self, job_id: str) -> Dict[str, Any]:
+        endpoint = self.job_endpoints.get(job_id)
+        if endpoint or len(self.shards) == 1:
+            return self._get(f"jobs/{job_id}", endpoint=endpoint)["job"]
+        return self._find_job(job_id)
+
+    def _find_job(self, job_id: str) -> Dict[str, Any]:
+        """ask each server for a job this client did not start, remembering the one that knows it"""
+        response = None
+        for endpoint in self.shards.endpoints:
+            try:
+                _, response = self._dispatch(self.session.get, f"jobs/{job_id}", endpoint=endpoint)
+            except requests.RequestException:
+                continue
+            if response.status_code != 404:
+                self.job_endpoints[job_id] = endpoint
+                break
+        if response is None:
+            raise RuntimeError(f"no server answered for job {job_id}")
+        return self._parse_response(response)["job"]
+
+    @validate_call
+    def jobs(self) -> List[Dict[str, Any]]:
+        return [job for endpoint in self.shards.endpoints for job in self._get("jobs", endpoint=endpoint)["jobs"]]
+
+    @validate_call
+    def wait(self, job_id: str, timeout: float | None = None, interval: float | None = None) -> Dict[str, Any]:
+        """poll a background job until it finishes, returning its result"""
+        interval = settings.get(interval, "JOB_POLL_INTERVAL")
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            job = self.job(job_id)
+            if job["state"] == "succeeded":
+                return job["result"]
+            if job["state"] == "failed":
+                raise RuntimeError(job["error"])
+            if deadline and time.time() > deadline:
+                raise TimeoutError(f"timeout waiting for job {job_id}: {job['state']} {job['progress']}")
+            time.sleep(interval)
 
     def shutdown(self):
         return self._post("shutdown")
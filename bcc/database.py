@@ -0,0 +1,69 @@
+# read-only listings from the baikal sqlite database
+
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List
+
+from .models import Book, ListFilter, User
+
+USERS = """
+SELECT u.username AS username, p.displayname AS displayname, p.uri AS uri
+FROM users u LEFT JOIN principals p ON p.uri = 'principals/' || u.username
+ORDER BY u.username
+"""
+
+BOOKS = """
+SELECT a.uri AS token, a.displayname AS bookname, a.description AS description, COUNT(c.id) AS contacts
+FROM addressbooks a LEFT JOIN cards c ON c.addressbookid = a.id
+WHERE lower(a.principaluri) = ?
+GROUP BY a.id
+ORDER BY a.uri
+"""
+
+
+def book_uri(url: str, username: str, token: str) -> str:
+    return f"{url}/dav.php/addressbooks/{username}/{token}/"
+
+
+class BaikalDatabase:
+    """answer user and address book listings with queries instead of scraping the admin UI
+
+    The database is opened read-only for each listing; all writes still go through the admin UI.
+    """
+
+    def __init__(self, path: str, url: str):
+        self.path = Path(path).expanduser()
+        self.url = url
+
+    def _query(self, sql: str, *params: Any) -> List[Dict[str, Any]]:
+        with closing(sqlite3.connect(self.path.resolve().as_uri() + "?mode=ro", uri=True)) as connection:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(sql, params)]
+
+    def _user_rows(self, query: ListFilter) -> Dict[str, Dict[str, Any]]:
+        rows = {}
+        for row in self._query(USERS):
+            username = row["username"].strip().lower()
+            if query.matches(username):
+                rows[username] = row
+        return {username: rows[username] for username in query.page(list(rows.keys()))}
+
+    def users(self, query: ListFilter | None = None) -> List[User]:
+        return User.validate_list(list(self._user_rows(query or ListFilter()).values()))
+
+    def usernames(self, query: ListFilter | None = None) -> List[str]:
+        return list(self._user_rows(query or ListFilter()).keys())
+
+    def user_books(self, usernames: List[str]) -> Dict[str, List[Book]]:
+        return {username: self.books(username) for username in usernames}
+
+    def books(self, username: str, query: ListFilter | None = None) -> List[Book]:
+        query = query or ListFilter()
+        rows = {row["token"]: row for row in self._query(BOOKS, f"principals/{username}".lower())}
+        return Book.validate_list(
+            [
+                dict(rows[token], username=username, uri=book_uri(self.url, username, token))
+                for token in query.page(list(rows.keys()))
+            ]
+        )
@@ -0,0 +1,47 @@
+# per-request deadlines for browser operations
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+def expiry(seconds: float | None) -> float | None:
+    """the monotonic time seconds from now; None or 0 means no deadline"""
+    return time.monotonic() + seconds if seconds else None
+
+
+@contextmanager
+def deadline(expires: float | None):
+    """bound the browser operations run by this thread until the monotonic time expires"""
+    previous = getattr(_local, "expires", None)
+    _local.expires = expires
+    try:
+        yield
+    finally:
+        _local.expires = previous
+
+
+def bounded(expires: float | None, func):
+    """wrap func to run under a deadline in whichever thread calls it"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with deadline(expires):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def remaining() -> float | None:
+    """seconds left before this thread's deadline, or None when it has none"""
+    expires = getattr(_local, "expires", None)
+    if expires is None:
+        return None
+    return max(expires - time.monotonic(), 0.0)
+
+
+def expired() -> bool:
+    return remaining() == 0.0
@@ -0,0 +1,131 @@
+# change events for server-sent event subscribers
+
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import AsyncIterator, Dict, List, Set, Tuple
+
+import arrow
+
+from . import settings
+from .models import Account, ChangeEvent
+
+USER_ADDED = "user_added"
+USER_DELETED = "user_deleted"
+BOOK_ADDED = "book_added"
+BOOK_DELETED = "book_deleted"
+
+Snapshot = Dict[str, Set[str]]
+
+
+class Events:
+    """number change events in order, keeping the most recent for subscribers resuming from an event id
+
+    Publishing is thread safe; subscribers are async generators on the event loop.
+    """
+
+    def __init__(self, *, retention: int | None = None, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.events = deque(maxlen=settings.get(retention, "EVENT_RETENTION"))
+        self.last_id = 0
+        self.lock = threading.Lock()
+        self.loop = None
+        self.changed = None
+        self.snapshots: Dict[str, Snapshot] = {}
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.changed = asyncio.Event()
+
+    def publish(self, type: str, target: str, username: str, token: str | None = None) -> ChangeEvent:
+        with self.lock:
+            self.last_id += 1
+            event = ChangeEvent(
+                id=self.last_id, type=type, target=target, username=username, token=token, time=str(arrow.now())
+            )
+            self.events.append(event)
+            snapshot = self.snapshots.get(target)
+            if snapshot is not None:
+                apply(snapshot, event)
+        self.logger.info(f"event {event.id} {type} {target} {username} {token or ''}")
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._wake)
+        return event
+
+    def _wake(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def since(self, last_id: int) -> Tuple[List[ChangeEvent], bool]:
+        """the events following last_id, and whether some were already discarded"""
+        with self.lock:
+            events = [event for event in self.events if event.id > last_id]
+            missed = last_id < self.last_id and (not events or events[0].id > last_id + 1)
+            return events, missed
+
+    async def subscribe(self, last_id: int | None = None, keepalive: float | None = None) -> AsyncIterator[str]:
+        """yield server-sent event messages from last_id on, or from now when last_id is None"""
+        keepalive = settings.get(keepalive, "EVENT_KEEPALIVE")
+        if last_id is None:
+            last_id = self.last_id
+        while True:
+            changed = self.changed
+            events, missed = self.since(last_id)
+            if missed:
+                yield f'event: resync\ndata: {{"id": {last_id}}}\n\n'
+            for event in events:
+                yield f"id: {event.id}\nevent: {event.type}\ndata: {event.model_dump_json()}\n\n"
+                last_id = event.id
+            try:
+                await asyncio.wait_for(changed.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+
+    def diff(self, target: str, snapshot: Snapshot, started: int):
+        """publish the changes between the last snapshot of target and a new one taken since event started
+
+        A snapshot overlapping one of bcc's own writes to the target is discarded, since it may predate it.
+        """
+        with self.lock:
+            previous = self.snapshots.get(target)
+            if any(event.id > started and event.target == target for event in self.events):
+                return
+            self.snapshots[target] = snapshot
+        if previous is None:
+            return
+        changes = []
+        for username in sorted(previous.keys() - snapshot.keys()):
+            changes.extend((BOOK_DELETED, username, token) for token in sorted(previous[username]))
+            changes.append((USER_DELETED, username, None))
+        for username in sorted(snapshot.keys() - previous.keys()):
+            changes.append((USER_ADDED, username, None))
+            changes.extend((BOOK_ADDED, username, token) for token in sorted(snapshot[username]))
+        for username in sorted(snapshot.keys() & previous.keys()):
+            changes.extend((BOOK_DELETED, username, token) for token in sorted(previous[username] - snapshot[username]))
+            changes.extend((BOOK_ADDED, username, token) for token in sorted(snapshot[username] - previous[username]))
+        for type, username, token in changes:
+            self.publish(type, target, username, token)
+
+
+def apply(snapshot: Snapshot, event: ChangeEvent):
+    if event.type == USER_ADDED:
+        snapshot.setdefault(event.username, set())
+    elif event.type == USER_DELETED:
+        snapshot.pop(event.username, None)
+    elif event.type == BOOK_ADDED:
+        snapshot.setdefault(event.username, set()).add(event.token)
+    elif event.type == BOOK_DELETED:
+        snapshot.get(event.username, set()).discard(event.token)
+
+
+def take_snapshot(session, admin: Account) -> Snapshot:
+    """the usernames and book tokens of a backend"""
+    usernames = session.usernames(admin)
+    snapshot = {}
+    chunk = session.read_concurrency
+    for start in range(0, len(usernames), chunk):
+        user_books = session.user_books(admin, usernames[start : start + chunk])
+        for username, books in user_books.items():
+            snapshot[username] = {book.token for book in books}
+    return snapshot
@@ -3,6 +3,7 @@
 import logging
 import os
 import shlex
+import shutil
 import subprocess
 import tempfile
 import time
@@ -15,6 +16,25 @@ from pydantic import validate_call
 
 from . import settings
 
+# entries firefox recreates as needed: caches, crash and telemetry reports, browsing state and stale locks
+VOLATILE = (
+    "cache2",
+    "startupCache",
+    "shader-cache",
+    "thumbnails",
+    "safebrowsing",
+    "crashes",
+    "minidumps",
+    "datareporting",
+    "saved-telemetry-pings",
+    "sessionstore-backups",
+    "sessionstore.jsonlz4",
+    "cookies.sqlite*",
+    "storage",
+    "lock",
+    ".parentlock",
+)
+
 
 def countFiles(dir):
     dir = Path(dir)
@@ -94,7 +114,6 @@ class Profile:
 
     def create(self):
         self.logger.info("Creating profile...")
-        breakpoint()
         run(f"{settings.FIREFOX_BIN} --headless --createprofile '{self.name} {self.dir}'", env=self.mkenv())
 
         proc = subprocess.Popen(
@@ -119,6 +138,25 @@ class Profile:
         proc.wait()
         self.logger.info(f"Profile {self.name} written to {self.dir}")
 
+    def clone(self, dir, slim=False):
+        """copy this profile into dir and return the copy; a slim copy leaves out the volatile entries"""
+        self.logger.info(f"Cloning profile {self.dir} to {dir}...")
+        ignore = shutil.ignore_patterns(*VOLATILE) if slim else shutil.ignore_patterns("lock", ".parentlock")
+        shutil.copytree(self.dir, dir, dirs_exist_ok=True, ignore=ignore)
+        profile = Profile(name=self.name, dir=str(dir), logger=self.logger)
+        if slim:
+            profile.slim()
+        return profile
+
+    def slim(self):
+        """remove the volatile entries while no firefox runs on this profile"""
+        for pattern in VOLATILE:
+            for path in self.dir.glob(pattern):
+                if path.is_dir() and not path.is_symlink():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink(missing_ok=True)
+
     def ListCerts(self):
         certlist = mklist(subprocess.check_output(shlex.split(f"certutil -L -d sql:{str(self.dir)}")))
         certs = {}
@@ -0,0 +1,136 @@
+# background jobs for long-running operations
+
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+import arrow
+
+from . import settings
+from .models import JobStatus
+
+
+class UnknownJob(Exception):
+    pass
+
+
+class JobsFull(Exception):
+    pass
+
+
+class Job:
+
+    def __init__(self, name: str, func: Callable, cancel: Callable | None = None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.func = func
+        self.cancel = cancel
+        self.state = "pending"
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created = arrow.now()
+        self.finished = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in ["succeeded", "failed"]
+
+    def update(self, **progress: Any):
+        """record progress, for example update(users=10, total=200)"""
+        self.progress.update(progress)
+
+    def run(self):
+        self.state = "running"
+        try:
+            result = self.func(self)
+            self.result = result.model_dump(mode="json") if hasattr(result, "model_dump") else result
+            state = "succeeded"
+        except Exception as ex:
+            self.error = f"{ex.__class__.__name__}: {ex}"
+            state = "failed"
+        self.finished = arrow.now()
+        self.state = state
+
+    def status(self) -> JobStatus:
+        return JobStatus(
+            id=self.id,
+            name=self.name,
+            state=self.state,
+            progress=self.progress,
+            result=self.result,
+            error=self.error,
+            created=str(self.created),
+            finished=str(self.finished) if self.finished else None,
+        )
+
+
+class Jobs:
+    """run submitted functions on a thread pool, retaining a bounded number of finished jobs
+
+    At most pending_limit jobs wait for a worker; submit() raises JobsFull past that.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int | None = None,
+        retention: int | None = None,
+        ttl: int | None = None,
+        pending_limit: int | None = None,
+        logger=None,
+    ):
+        self.logger = logger or logging.getLogger(__name__)
+        self.retention = settings.get(retention, "JOB_RETENTION")
+        self.ttl = settings.get(ttl, "JOB_TTL")
+        self.pending_limit = settings.get(pending_limit, "JOB_PENDING_LIMIT")
+        self.executor = ThreadPoolExecutor(max_workers=settings.get(workers, "JOB_WORKERS"), thread_name_prefix="job")
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, name: str, func: Callable, cancel: Callable | None = None) -> Job:
+        """run func(job) in the background; cancel() is called instead if the job is dropped before it runs"""
+        job = Job(name, func, cancel)
+        with self.lock:
+            self._prune()
+            pending = sum(1 for queued in self.jobs.values() if queued.state == "pending")
+            if pending >= self.pending_limit:
+                raise JobsFull(f"{pending} jobs pending")
+            self.jobs[job.id] = job
+        self.logger.info(f"job {job.id} submitted: {name}")
+        self.executor.submit(job.run)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        with self.lock:
+            self._prune()
+            if job_id not in self.jobs:
+                raise UnknownJob(f"unknown job: {job_id}")
+            return self.jobs[job_id]
+
+    def all(self) -> List[Job]:
+        with self.lock:
+            self._prune()
+            return list(self.jobs.values())
+
+    def _prune(self):
+        cutoff = arrow.now().shift(seconds=-self.ttl)
+        finished = sorted([job for job in self.jobs.values() if job.done], key=lambda job: job.finished)
+        expired = [job for job in finished if job.finished < cutoff]
+        excess = finished[: max(len(finished) - self.retention, 0)]
+        for job in expired + excess:
+            self.jobs.pop(job.id, None)
+
+    def status(self) -> Dict[str, int]:
+        states = [job.state for job in self.all()]
+        return {state: states.count(state) for state in ["pending", "running", "succeeded", "failed"]}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            dropped = [job for job in self.jobs.values() if job.state == "pending"]
+        for job in dropped:
+            if job.cancel:
+                job.cancel()
@@ -0,0 +1,30 @@
+# cross-process locks
+
+import fcntl
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import settings
+
+
+def lock_file(name: str) -> Path:
+    lock_dir = Path(settings.LOCK_DIR)
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    return lock_dir / (re.sub("[^a-zA-Z0-9@._-]", "_", name) + ".lock")
+
+
+@contextmanager
+def locked(name: str):
+    """hold an exclusive lock on name, shared by all bcc processes and threads on this host"""
+    with lock_file(name).open("a") as ofp:
+        fcntl.flock(ofp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(ofp, fcntl.LOCK_UN)
+
+
+def user_lock(username: str, url: str = ""):
+    """serialize mutations of one baikal user across server workers"""
+    return locked("-".join(["user", url, username]) if url else "user-" + username)
@@ -0,0 +1,163 @@
+# in-memory backend for exercising the API layer without a browser
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List
+
+import arrow
+
+from . import deadlines, settings
+from .backend import Backend
+from .browser import AddFailed, DeleteFailed, InitFailed, RequestTimeout, default_target
+from .database import book_uri
+from .models import (
+    VALID_TOKEN_CHARS,
+    Account,
+    AddBookRequest,
+    AddUserRequest,
+    Book,
+    DeleteBookRequest,
+    DeleteUserRequest,
+    ListFilter,
+    User,
+)
+from .version import __version__
+
+
+class MemoryBackend(Backend):
+    """users and books held in dictionaries, with an optional fixed latency per operation
+
+    Results and errors mirror the browser session, so clients see the same responses; any admin
+    credentials are accepted.
+    """
+
+    concurrency = None
+
+    def __init__(self, logger=None, profile_dir=None, target=None, latency: float | None = None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.target = target or default_target()
+        self.url = self.target.url
+        self.latency = settings.get(latency, "MEMORY_LATENCY")
+        self.lock = threading.Lock()
+        self.directory = {}
+        self.addressbooks = {}
+        self.logged_in = False
+        self.startup_time = arrow.now()
+        self.reset_time = None
+
+    @property
+    def active(self) -> bool:
+        return False
+
+    def _delay(self):
+        if self.latency:
+            remaining = deadlines.remaining()
+            if remaining is not None and remaining < self.latency:
+                time.sleep(remaining)
+                raise RequestTimeout("deadline passed")
+            time.sleep(self.latency)
+
+    def login(self, admin: Account):
+        self.logged_in = admin.username
+
+    def logout(self):
+        self.logged_in = False
+
+    def initialize(self, admin: Account) -> Dict[str, str]:
+        self._delay()
+        raise InitFailed("already initialized")
+
+    def users(self, admin: Account, query: ListFilter | None = None) -> List[User]:
+        query = query or ListFilter()
+        self._delay()
+        with self.lock:
+            return [self.directory[username] for username in self._usernames(query)]
+
+    def _usernames(self, query: ListFilter) -> List[str]:
+        return query.page([username for username in self.directory if query.matches(username)])
+
+    def usernames(self, admin: Account, query: ListFilter | None = None) -> List[str]:
+        self._delay()
+        with self.lock:
+            return self._usernames(query or ListFilter())
+
+    def add_user(self, admin: Account, request: AddUserRequest) -> User:
+        self._delay()
+        with self.lock:
+            if request.username in self.directory:
+                raise AddFailed(f"user exists: {request.username}")
+            user = User(
+                username=request.username, displayname=request.displayname, uri=f"principals/{request.username}"
+            )
+            self.directory[user.username] = user
+            self.addressbooks[user.username] = {}
+        return user
+
+    def delete_user(self, admin: Account, request: DeleteUserRequest) -> Dict[str, str]:
+        self._delay()
+        with self.lock:
+            if request.username not in self.directory:
+                raise DeleteFailed(f"user not found: username={request.username}")
+            del self.directory[request.username]
+            del self.addressbooks[request.username]
+        return dict(message=f"deleted user: {request.username}")
+
+    def books(self, admin: Account, username: str, query: ListFilter | None = None) -> List[Book]:
+        query = query or ListFilter()
+        self._delay()
+        with self.lock:
+            books = self.addressbooks.get(username, {})
+            return [books[token] for token in query.page(list(books.keys()))]
+
+    def add_book(self, admin: Account, request: AddBookRequest) -> Book:
+        token = request.username + "-" + request.bookname
+        token = "".join([c if c in VALID_TOKEN_CHARS else "-" for c in token])
+        self._delay()
+        with self.lock:
+            if request.username not in self.directory:
+                raise AddFailed(f"user not found: username={request.username}")
+            if token in self.addressbooks[request.username]:
+                raise AddFailed(f"address book exists: username={request.username} token={token}")
+            book = Book(
+                token=token,
+                username=request.username,
+                bookname=request.bookname,
+                description=request.description,
+                uri=book_uri(self.url, request.username, token),
+            )
+            self.addressbooks[request.username][token] = book
+        return book
+
+    def delete_book(self, admin: Account, request: DeleteBookRequest) -> Dict[str, str]:
+        self._delay()
+        with self.lock:
+            if request.username not in self.directory:
+                raise DeleteFailed(f"user not found: username={request.username}")
+            if request.token not in self.addressbooks[request.username]:
+                raise DeleteFailed(f"book not found: username={request.username} token={request.token}")
+            del self.addressbooks[request.username][request.token]
+        return dict(message=f"deleted_book: {request.token}")
+
+    def reset(self, admin: Account) -> Dict[str, str]:
+        self.reset_time = arrow.now()
+        return dict(message="server reset")
+
+    def status(self, admin: Account) -> Dict[str, Any]:
+        with self.lock:
+            counts = dict(users=len(self.directory), books=sum(len(books) for books in self.addressbooks.values()))
+        return dict(
+            name="bcc",
+            version=__version__,
+            backend="memory",
+            latency=self.latency,
+            target=self.target.name,
+            url=self.url,
+            uptime=self.startup_time.humanize(),
+            reset=self.reset_time.humanize() if self.reset_time else "never",
+            login="success",
+            **counts,
+        )
+
+    def shutdown(self):
+        self.logged_in = False
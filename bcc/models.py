@@ -1,9 +1,12 @@
 # models
 
+import hashlib
 import string
+from fnmatch import fnmatchcase
+from functools import lru_cache
 from typing import Any, Dict, List
 
-from pydantic import BaseModel, Field, ValidationInfo, model_validator
+from pydantic import BaseModel, Field, TypeAdapter, ValidationInfo, model_validator
 
 MIN_PASSWORD_LENGTH = 8
 VALID_TOKEN_CHARS = string.ascii_lowercase + string.digits + "-"
@@ -17,12 +20,16 @@ regex_description = "^[a-zA-Z][a-zA-Z0-9@\\._ -]*[a-zA-Z0-9]*$|^$"
 regex_password = "^\\S{" + str(MIN_PASSWORD_LENGTH) + ",}$"
 regex_token = "^[a-z0-9-]+$|^$"
 
+TRUSTED = dict(trusted=True)
+
 
 class Model(BaseModel):
 
     @model_validator(mode="before")
     @classmethod
     def normalize(cls, value: Any, info: ValidationInfo) -> Any:
+        if info.context and info.context.get("trusted"):
+            return value
         if isinstance(value, dict):
             fields = value.keys()
             for field in fields:
@@ -32,18 +39,42 @@ class Model(BaseModel):
                     value[field] = value[field].decode()
                 if isinstance(value[field], str) and field != "password":
                     value[field] = value[field].strip()
-                if field in ["username", "bookname", "token"]:
+                if field in ["username", "bookname", "token", "match"]:
                     value[field] = value[field].lower()
         else:
             raise RuntimeError(f"model_validator: unexpected value type {type(value)} {value=} {info=}")
         return value
 
+    @classmethod
+    def validate_list(cls, rows: List[Dict[str, Any]]) -> List[Any]:
+        """validate a list of rows in a single pass"""
+        return list_adapter(cls).validate_python(rows)
+
+    @classmethod
+    def trusted(cls, data: Dict[str, Any]) -> Any:
+        """construct from data already normalized by a bcc server, skipping normalization"""
+        return cls.model_validate(data, context=TRUSTED)
+
+    @classmethod
+    def trusted_list(cls, rows: List[Dict[str, Any]]) -> List[Any]:
+        return list_adapter(cls).validate_python(rows, context=TRUSTED)
+
+
+@lru_cache
+def list_adapter(cls):
+    return TypeAdapter(List[cls])
+
 
 class Account(Model):
     username: str = Field(..., pattern=regex_name)
     password: str = Field(..., pattern=regex_password)
 
 
+def credential(admin: Account) -> str:
+    """a stable key for an admin's username and password that does not retain the password"""
+    return hashlib.sha256(f"{admin.username}\0{admin.password}".encode()).hexdigest()[:16]
+
+
 class User(Model):
     username: str = Field(..., pattern=regex_email)
     displayname: str | None = Field("", pattern=regex_description)
@@ -62,6 +93,49 @@ class Book(BookBase):
     token: str = Field(None, pattern=regex_token)
 
 
+class ListFilter(Model):
+    username: str | None = Field("", pattern=regex_email + "|^$")
+    match: str | None = Field("")
+    limit: int | None = Field(0, ge=0)
+    cursor: str | None = Field("")
+
+    def matches(self, username: str) -> bool:
+        """exact match on username, then prefix or glob match on match"""
+        if self.username and username != self.username:
+            return False
+        if self.match:
+            if any(c in self.match for c in "*?["):
+                return fnmatchcase(username, self.match)
+            return username.startswith(self.match)
+        return True
+
+    def page(self, keys: List[str]) -> List[str]:
+        """return the sorted keys following cursor, truncated to limit"""
+        keys = sorted(key for key in keys if key > self.cursor)
+        if self.limit:
+            keys = keys[: self.limit]
+        return keys
+
+    def next_cursor(self, keys: List[str]) -> str:
+        if self.limit and len(keys) == self.limit:
+            return keys[-1]
+        return ""
+
+
+class Target(BaseModel):
+    name: str = Field(..., pattern="^[a-zA-Z0-9_-]+$")
+    url: str
+    client_cert: str
+    client_key: str
+    database: str = ""
+    # baikal admin credentials; empty uses those of each request
+    admin_username: str = ""
+    admin_password: str = ""
+    # carddav listing credentials; empty uses CARDDAV_USERNAME and CARDDAV_PASSWORD
+    carddav_username: str = ""
+    carddav_password: str = ""
+
+
 class Response(BaseModel):
     success: str | bool | None = Field(True)
     request: str | None = Field("")
@@ -109,12 +183,14 @@ class UsersResponse(Response):
     request: str | None = Field("list users")
     message: str | None = Field("user list")
     users: List[User]
+    cursor: str | None = Field("")
 
 
 class BooksResponse(Response):
     request: str | None = Field("list address books")
     message: str | None = Field("address book list")
     books: List[Book]
+    cursor: str | None = Field("")
 
 
 class StatusResponse(Response):
@@ -123,6 +199,19 @@ class StatusResponse(Response):
     status: Dict[str, Any]
 
 
+class HealthResponse(Response):
+    request: str | None = Field("healthz")
+    message: str | None = Field("alive")
+    uptime: str
+
+
+class ReadyResponse(Response):
+    request: str | None = Field("readyz")
+    message: str | None = Field("readiness")
+    targets: Dict[str, Dict[str, Any]]
+    jobs: Dict[str, int]
+
+
 class InitializeResponse(Response):
     request: str | None = Field("initialize")
 
@@ -139,6 +228,55 @@ class ResetResponse(Response):
     request: str | None = Field("reset")
 
 
+class JobStatus(BaseModel):
+    id: str
+    name: str
+    state: str
+    progress: Dict[str, Any] = Field({})
+    result: Any | None = Field(None)
+    error: str | None = Field(None)
+    created: str
+    finished: str | None = Field(None)
+
+
+class JobResponse(Response):
+    request: str | None = Field("job status")
+    message: str | None = Field("job status")
+    job: JobStatus
+
+
+class JobsResponse(Response):
+    request: str | None = Field("list jobs")
+    message: str | None = Field("job list")
+    jobs: List[JobStatus]
+
+
+class ChangeEvent(BaseModel):
+    id: int
+    type: str
+    target: str
+    username: str
+    token: str | None = Field(None)
+    time: str
+
+
+class SnapshotInfo(BaseModel):
+    id: int
+    request: str | None = Field(None)
+    target: str
+    step: str
+    url: str
+    time: str
+    size: int
+    screenshot: bool
+
+
+class SnapshotsResponse(Response):
+    request: str | None = Field("list snapshots")
+    message: str | None = Field("page snapshots")
+    snapshots: List[SnapshotInfo]
+
+
 class ErrorResponse(Response):
     success: bool | None = Field(False)
     message: str | None = Field("RequestFailed")
@@ -0,0 +1,41 @@
+# logical pages of the baikal admin UI shown by a browser session
+
+from typing import Dict
+
+ADMIN = "admin"
+USERS = "users"
+
+
+def books_page(username: str) -> str:
+    return "books/" + username
+
+
+class Pages:
+    """track the logical page the browser shows and the paths learned for loading pages directly
+
+    A page is current only when it was shown during the running operation; an operation reuses a current
+    page instead of loading it again. Pages shown by earlier operations may be stale and are reloaded.
+    ADMIN is any admin page whose content is not reused, such as a form or the page after a submit.
+    """
+
+    def __init__(self):
+        self.page = None
+        self.shown_in = 0
+        self.operation = 0
+        self.routes: Dict[str, str] = {}
+
+    def begin(self):
+        self.operation += 1
+
+    def show(self, page: str | None):
+        """record that the browser now shows page, or None when unknown"""
+        self.page = page
+        self.shown_in = self.operation
+
+    def current(self, page: str) -> bool:
+        return self.page == page and self.shown_in == self.operation
+
+    @property
+    def known(self) -> bool:
+        """True when the browser shows an admin page, which has the navbar"""
+        return self.page is not None
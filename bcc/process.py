@@ -1,54 +1,111 @@
+import logging
 import subprocess
+import threading
+import time
+from pathlib import Path
 
 import psutil
 
+from . import settings
+
 STOP_TIMEOUT = 5
 
 
 class Supervised:
+    """a process tracked by its Popen handle, its pid, or a pidfile"""
 
-    def __init__(self, name, *args):
+    def __init__(self, name, *args, pid=None, pidfile=None):
         self.name = name
         self.args = args
         self.proc = None
+        self.pid = pid
+        self.pidfile = Path(pidfile) if pidfile else None
+        self.create_time = None
+        if pid:
+            self._watch(pid)
 
-    def is_running(self):
-        if self.proc and self.proc.poll() is None:
-            self.pid = self.proc.pid
-            return True
+    @classmethod
+    def attach(cls, name, proc=None, *, pid=None):
+        """track a process started elsewhere, from its Popen handle or pid"""
+        supervised = cls(name, pid=pid or proc.pid)
+        supervised.proc = proc
+        return supervised
+
+    @classmethod
+    def find(cls, name):
+        """scan the process table once for a process named name, returning None if there is none"""
         for proc in psutil.process_iter(["pid", "name"]):
-            if proc.name() == self.name:
-                self.pid = proc.pid
-                return True
-        return False
+            if proc.info["name"] == name:
+                return cls(name, pid=proc.info["pid"])
+        return None
+
+    @classmethod
+    def using(cls, argument):
+        """scan the process table once for a process with argument in its command line, or None if there is none"""
+        for proc in psutil.process_iter(["pid", "name", "cmdline"]):
+            if argument in (proc.info["cmdline"] or []):
+                return cls(proc.info["name"], pid=proc.info["pid"])
+        return None
+
+    def _watch(self, pid):
+        self.pid = pid
+        try:
+            self.create_time = psutil.Process(pid).create_time()
+        except psutil.NoSuchProcess:
+            self.create_time = None
+
+    def _process(self):
+        if self.pid is None and self.pidfile and self.pidfile.is_file():
+            self._watch(int(self.pidfile.read_text().strip()))
+        if self.pid is None:
+            return None
+        try:
+            process = psutil.Process(self.pid)
+            if self.create_time is not None and process.create_time() != self.create_time:
+                return None
+            return process
+        except psutil.NoSuchProcess:
+            return None
+
+    def is_running(self):
+        if self.proc:
+            return self.proc.poll() is None
+        process = self._process()
+        if process is None:
+            return False
+        try:
+            return process.status() != psutil.STATUS_ZOMBIE
+        except psutil.NoSuchProcess:
+            return False
 
     def start(self):
         if self.is_running():
             return True
-        self.proc = subprocess.Popen(self.name, *self.args)
+        self.proc = subprocess.Popen([self.name, *self.args])
+        self._watch(self.proc.pid)
+        if self.pidfile:
+            self.pidfile.write_text(str(self.pid))
         if self.is_running():
             return True
         raise RuntimeError(f"Unexpected process termination: {self.name}")
 
     def stop(self, timeout=STOP_TIMEOUT):
-        breakpoint()
         if self.is_running():
-            if self.proc:
-                signal = "TERM"
-                while signal:
-                    if signal == "TERM":
-                        self.proc.terminate()
-                        signal = "KILL"
-                    elif signal == "KILL":
-                        self.proc.kill()
-                        signal = None
-                    try:
-                        self.proc.wait(timeout)
-                        self.proc = None
-                        return
-                    except subprocess.TimeoutExpired:
-                        if signal is None:
-                            raise RuntimeError(f"zombie process: {self.name}")
+            process = self.proc or self._process()
+            for signal in ["TERM", "KILL"]:
+                if signal == "TERM":
+                    process.terminate()
+                else:
+                    process.kill()
+                try:
+                    process.wait(timeout)
+                    break
+                except (subprocess.TimeoutExpired, psutil.TimeoutExpired):
+                    if signal == "KILL":
+                        raise RuntimeError(f"zombie process: {self.name}")
+        self.proc = None
+        if self.pidfile:
+            self.pidfile.unlink(missing_ok=True)
 
     def __enter__(self):
         self.start()
@@ -57,3 +114,141 @@ class Supervised:
     def __exit__(self, et, ex, tb):
         self.stop()
         return False
+
+
+class SupervisorBackoff(RuntimeError):
+    pass
+
+
+class Supervisor:
+    """launch a group of processes, probe them on a timer and relaunch them with exponential backoff
+
+    Launches and teardowns run under lock, which must be reentrant and may be shared with the processes'
+    users. State changes run under the supervisor's own state_lock, taken after lock when both are held, so
+    the probe notices a death while a user of the processes holds lock.
+    """
+
+    def __init__(
+        self,
+        name,
+        launch,
+        teardown,
+        *,
+        lock=None,
+        interval=None,
+        backoff=None,
+        backoff_max=None,
+        logger=None,
+    ):
+        self.name = name
+        self.launch = launch
+        self.teardown = teardown
+        self.lock = lock or threading.RLock()
+        self.state_lock = threading.RLock()
+        self.interval = settings.get(interval, "SUPERVISOR_INTERVAL")
+        self.backoff = settings.get(backoff, "SUPERVISOR_BACKOFF")
+        self.backoff_max = settings.get(backoff_max, "SUPERVISOR_BACKOFF_MAX")
+        self.logger = logger or logging.getLogger(__name__)
+        self.processes = []
+        self.state = "stopped"
+        self.failures = 0
+        self.restarts = 0
+        self.started = None
+        self.last_failure = None
+        self.next_restart = None
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def alive(self):
+        return bool(self.processes) and all(process.is_running() for process in self.processes)
+
+    def start(self):
+        with self.lock, self.state_lock:
+            self.processes = self.launch()
+            self.state = "running"
+            self.started = time.time()
+            if self.thread is None:
+                self.stopping = threading.Event()
+                self.thread = threading.Thread(target=self._probe, name=f"supervisor-{self.name}", daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        with self.lock, self.state_lock:
+            self.state = "stopped"
+            self.teardown()
+            self.processes = []
+            self.stopping.set()
+            self.thread = None
+
+    def ensure(self):
+        """make sure the processes are running, relaunching them now unless a backoff delay is pending"""
+        with self.lock, self.state_lock:
+            if self.state == "stopped":
+                self.start()
+                return
+            if self.state == "running" and self.alive():
+                return
+            if self.state == "running":
+                self._failed()
+            if self.state == "dead" and self.next_restart and time.time() < self.next_restart:
+                raise SupervisorBackoff(f"{self.name} restart pending in {self.next_restart - time.time():.1f}s")
+            self._restart()
+
+    def restart(self):
+        """relaunch dead processes now, without waiting out a pending backoff delay"""
+        with self.lock, self.state_lock:
+            if self.state == "running" and not self.alive():
+                self._failed()
+            self._restart()
+
+    def _failed(self):
+        """count a failure and schedule the restart; called with state_lock held"""
+        self.failures += 1
+        self.last_failure = time.time()
+        delay = min(self.backoff * 2 ** (self.failures - 1), self.backoff_max)
+        self.next_restart = self.last_failure + delay
+        self.state = "dead"
+        self.logger.warning(f"{self.name} processes died; restart in {delay}s")
+
+    def _restart(self):
+        with self.lock, self.state_lock:
+            if self.state == "running" and self.alive():
+                return
+            try:
+                self.teardown()
+                self.start()
+                self.restarts += 1
+                self.next_restart = None
+            except Exception as ex:
+                self.logger.error(f"{self.name} restart failed: {ex!r}")
+                self._failed()
+                raise
+
+    def _probe(self):
+        stopping = self.stopping
+        while not stopping.wait(self.interval):
+            with self.state_lock:
+                if stopping.is_set():
+                    return
+                if self.state == "running":
+                    if not self.alive():
+                        self._failed()
+                    elif self.failures and time.time() - self.started > self.backoff_max:
+                        self.failures = 0
+                due = self.state == "dead" and time.time() >= self.next_restart
+            if due:
+                # relaunch under lock, which waits for the processes' users
+                try:
+                    self._restart()
+                except Exception:
+                    pass
+
+    def status(self):
+        return dict(
+            state=self.state,
+            pids={process.name: process.pid for process in self.processes},
+            restarts=self.restarts,
+            failures=self.failures,
+            last_failure=self.last_failure,
+            next_restart=self.next_restart,
+        )
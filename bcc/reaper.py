@@ -0,0 +1,135 @@
+# orphaned browser process reaper
+
+import logging
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+import psutil
+
+from . import settings
+
+MARKER = "BCC_OWNER"
+# selenium's own profile copies are marked with a file holding the owner marker
+MARKER_FILE = ".bcc-owner"
+SELENIUM_PROFILE_COPY = "webdriver-py-profilecopy"
+STOP_TIMEOUT = 5
+
+logger = logging.getLogger(__name__)
+
+
+def owner_marker() -> str:
+    """identify this process, including its create time so a reused pid does not look alive"""
+    return f"{os.getpid()}:{psutil.Process().create_time()}"
+
+
+def marked_env() -> Dict[str, str]:
+    """environment for browser processes, marked with their owning bcc process"""
+    return dict(os.environ, **{MARKER: owner_marker()})
+
+
+def mark_directory(path: str | Path):
+    """mark a directory made for this process's browser, so the reaper can remove it after a crash"""
+    (Path(path) / MARKER_FILE).write_text(owner_marker())
+
+
+def owner_alive(marker: str) -> bool:
+    pid, _, create_time = marker.partition(":")
+    try:
+        return str(psutil.Process(int(pid)).create_time()) == create_time
+    except (ValueError, psutil.NoSuchProcess):
+        return False
+
+
+def profile_arg(cmdline: List[str]) -> str | None:
+    for flag, value in zip(cmdline, cmdline[1:]):
+        if flag in ["-profile", "--profile"]:
+            return value
+    return None
+
+
+def is_bcc_profile(path: str | None) -> bool:
+    return bool(path) and path.startswith(settings.PROFILE_DIR)
+
+
+def orphans() -> List[psutil.Process]:
+    """browser processes started by a bcc process that no longer exists
+
+    Processes are identified by the owner marker in their environment, or by running on a bcc profile
+    directory after their parent has exited. Other firefox and geckodriver processes are left alone.
+    """
+    ret = []
+    for process in psutil.process_iter(["pid", "ppid", "cmdline"]):
+        try:
+            marker = process.environ().get(MARKER)
+        except (psutil.AccessDenied, psutil.NoSuchProcess, psutil.ZombieProcess):
+            continue
+        if marker:
+            if not owner_alive(marker):
+                ret.append(process)
+        elif is_bcc_profile(profile_arg(process.info["cmdline"] or [])):
+            if process.info["ppid"] == 1 or not psutil.pid_exists(process.info["ppid"]):
+                ret.append(process)
+    return ret
+
+
+def temporary_profile(path: str | None) -> bool:
+    return bool(path) and Path(path).name.startswith("rust_mozprofile")
+
+
+def kill(processes: List[psutil.Process]) -> List[str]:
+    """terminate processes, returning the temporary profile directories they were using"""
+    profiles = []
+    for process in processes:
+        try:
+            path = profile_arg(process.cmdline())
+            logger.warning(f"reaping orphaned browser process {process.pid}: {process.name()}")
+            process.terminate()
+        except psutil.NoSuchProcess:
+            continue
+        if temporary_profile(path):
+            profiles.append(path)
+    _, alive = psutil.wait_procs(processes, timeout=STOP_TIMEOUT)
+    for process in alive:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+    return profiles
+
+
+def stale_profile_clones() -> List[Path]:
+    """worker profile copies whose worker process has exited"""
+    base = Path(settings.PROFILE_DIR)
+    ret = []
+    for path in base.parent.glob(base.name + ".*"):
+        match = re.search(r"\.worker-(\d+)$", path.name)
+        if match and path.is_dir() and not psutil.pid_exists(int(match.group(1))):
+            ret.append(path)
+    return ret
+
+
+def stale_selenium_copies() -> List[Path]:
+    """marked temporary directories holding selenium profile copies whose owner has exited"""
+    ret = []
+    for path in Path(tempfile.gettempdir()).glob(f"*/{SELENIUM_PROFILE_COPY}"):
+        marker = path.parent / MARKER_FILE
+        try:
+            if not owner_alive(marker.read_text().strip()):
+                ret.append(path.parent)
+        except OSError:
+            continue
+    return ret
+
+
+def reap() -> Dict[str, List[str]]:
+    """kill orphaned browser processes and remove the profile directories left behind"""
+    killed = orphans()
+    profiles = kill(killed) + [str(path) for path in stale_profile_clones() + stale_selenium_copies()]
+    for path in profiles:
+        logger.warning(f"removing stale profile directory {path}")
+        shutil.rmtree(path, ignore_errors=True)
+    return dict(processes=[str(process.pid) for process in killed], profiles=profiles)
@@ -0,0 +1,50 @@
+# retries of individual browser steps
+
+import itertools
+import logging
+import time
+from typing import Any, Callable, Tuple, Type
+
+from . import deadlines, settings
+
+
+def retry(
+    name: str,
+    func: Callable[[], Any],
+    *,
+    transient: Tuple[Type[Exception], ...] = (Exception,),
+    recover: Callable[[], None] | None = None,
+    landed: Callable[[], Any] | None = None,
+    attempts: int | None = None,
+    backoff: float | None = None,
+    backoff_max: float | None = None,
+    logger=None,
+) -> Any:
+    """call func, retrying transient failures with exponential backoff within the attempt budget
+
+    recover() runs before each retry. For writes, landed() reads back before each retry and returns the
+    result if the failed attempt took effect anyway, or None to attempt the write again. No retry is
+    started that the calling thread's deadline would cut short.
+    """
+    attempts = settings.get(attempts, "RETRY_ATTEMPTS")
+    delay = settings.get(backoff, "RETRY_BACKOFF")
+    backoff_max = settings.get(backoff_max, "RETRY_BACKOFF_MAX")
+    logger = logger or logging.getLogger(__name__)
+    for attempt in itertools.count(1):
+        try:
+            if attempt > 1:
+                if recover:
+                    recover()
+                if landed:
+                    result = landed()
+                    if result is not None:
+                        logger.info(f"{name}: attempt {attempt - 1} landed")
+                        return result
+            return func()
+        except transient as ex:
+            remaining = deadlines.remaining()
+            if attempt >= attempts or (remaining is not None and remaining <= delay):
+                raise
+            logger.warning(f"{name}: attempt {attempt} failed: {ex!r}; retrying in {delay:.2f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, backoff_max)
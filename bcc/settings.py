@@ -1,5 +1,6 @@
 # settings
 
+import os
 import re
 import socket
 import subprocess
@@ -45,10 +46,61 @@ PROFILE_NAME = config("PROFILE_NAME", cast=str, default="default")
 PROFILE_DIR = config("PROFILE_DIR", cast=str, default=str(Path.home() / ".cache" / "bcc" / "profile"))
 PROFILE_CREATE_TIMEOUT = config("PROFILE_CREATE_TIMEOUT", cast=int, default=30)
 PROFILE_STABILIZE_TIME = config("PROFILE_STABILIZE_TIME", cast=int, default=2)
+PROFILE_DIRECT = config("PROFILE_DIRECT", cast=bool, default=False)
 WEBDRIVER_BIN = config("WEBDRIVER_BIN", cast=str, default=default_webdriver_bin)
 FIREFOX_BIN = config("FIREFOX_BIN", cast=str, default=default_firefox_bin)
 
 
+WORKERS = config("WORKERS", cast=int, default=1)
+LOOP = config("LOOP", cast=str, default="auto")
+HTTP = config("HTTP", cast=str, default="auto")
+LOCK_DIR = config("LOCK_DIR", cast=str, default=str(Path.home() / ".cache" / "bcc" / "locks"))
+
+TARGET = config("TARGET", cast=str, default="default")
+TARGETS_FILE = config("TARGETS_FILE", cast=str, default="")
+TARGET_IDLE_TIMEOUT = config("TARGET_IDLE_TIMEOUT", cast=int, default=600)
+ADMIN_SESSIONS = config("ADMIN_SESSIONS", cast=int, default=2)
+
+JOB_WORKERS = config("JOB_WORKERS", cast=int, default=4)
+JOB_RETENTION = config("JOB_RETENTION", cast=int, default=100)
+JOB_TTL = config("JOB_TTL", cast=int, default=3600)
+JOB_PENDING_LIMIT = config("JOB_PENDING_LIMIT", cast=int, default=100)
+JOB_POLL_INTERVAL = config("JOB_POLL_INTERVAL", cast=float, default=2.0)
+OVERLOAD_RETRIES = config("OVERLOAD_RETRIES", cast=int, default=5)
+OVERLOAD_BACKOFF = config("OVERLOAD_BACKOFF", cast=float, default=0.5)
+SHARD_EJECT_FAILURES = config("SHARD_EJECT_FAILURES", cast=int, default=3)
+SHARD_EJECT_SECONDS = config("SHARD_EJECT_SECONDS", cast=float, default=30.0)
+
+OUTPUT_FORMAT = config("OUTPUT_FORMAT", cast=str, default="json")
+OUTPUT_FIELDS = config("OUTPUT_FIELDS", cast=str, default="")
+
+SUPERVISOR_INTERVAL = config("SUPERVISOR_INTERVAL", cast=float, default=1.0)
+SUPERVISOR_BACKOFF = config("SUPERVISOR_BACKOFF", cast=float, default=1.0)
+SUPERVISOR_BACKOFF_MAX = config("SUPERVISOR_BACKOFF_MAX", cast=float, default=60.0)
+BAIKAL_DB = config("BAIKAL_DB", cast=str, default="")
+CARDDAV_BOOKS = config("CARDDAV_BOOKS", cast=bool, default=False)
+CARDDAV_USERNAME = config("CARDDAV_USERNAME", cast=str, default="")
+CARDDAV_PASSWORD = config("CARDDAV_PASSWORD", cast=Secret, default="")
+CARDDAV_CONCURRENCY = config("CARDDAV_CONCURRENCY", cast=int, default=8)
+BACKEND = config("BACKEND", cast=str, default="browser")
+MEMORY_LATENCY = config("MEMORY_LATENCY", cast=float, default=0.0)
+EVENT_RETENTION = config("EVENT_RETENTION", cast=int, default=1000)
+EVENT_KEEPALIVE = config("EVENT_KEEPALIVE", cast=float, default=15.0)
+EVENT_POLL_INTERVAL = config("EVENT_POLL_INTERVAL", cast=int, default=0)
+STATUS_CACHE_TTL = config("STATUS_CACHE_TTL", cast=float, default=30.0)
+REAPER_INTERVAL = config("REAPER_INTERVAL", cast=int, default=300)
+REQUEST_TIMEOUT = config("REQUEST_TIMEOUT", cast=float, default=60.0)
+RETRY_ATTEMPTS = config("RETRY_ATTEMPTS", cast=int, default=3)
+RETRY_BACKOFF = config("RETRY_BACKOFF", cast=float, default=0.25)
+RETRY_BACKOFF_MAX = config("RETRY_BACKOFF_MAX", cast=float, default=2.0)
+ADMISSION_READS = config("ADMISSION_READS", cast=int, default=32)
+ADMISSION_WRITES = config("ADMISSION_WRITES", cast=int, default=32)
+ADMISSION_READ_BURST = config("ADMISSION_READ_BURST", cast=int, default=4)
+VERIFY = config("VERIFY", cast=str, default="full")
+SNAPSHOTS = config("SNAPSHOTS", cast=int, default=0)
+SNAPSHOT_SCREENSHOTS = config("SNAPSHOT_SCREENSHOTS", cast=bool, default=False)
+SNAPSHOT_DIR = config("SNAPSHOT_DIR", cast=str, default=str(Path.home() / ".cache" / "bcc" / "snapshots"))
+
 HEADLESS = config("HEADLESS", cast=bool, default=True)
 DEBUG = config("DEBUG", cast=bool, default=False)
 LOG_LEVEL = config("LOG_LEVEL", cast=str, default="WARNING")
@@ -79,6 +131,17 @@ def dotenv(reveal_passwords=False):
     return ret
 
 
+def export():
+    """copy the current settings into the environment, where spawned server workers read them"""
+    for key in [k for k in globals().keys() if re.match("^[A-Z][A-Z_]*$", k)]:
+        value = globals()[key]
+        if value is True:
+            value = "1"
+        elif value is False:
+            value = "0"
+        os.environ[key] = str(value)
+
+
 def read_secret(value):
     if isinstance(value, Secret):
         value = str(value)
@@ -0,0 +1,123 @@
+# routing of client requests across several bcc servers
+
+import bisect
+import contextlib
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+from . import settings
+
+
+def split_urls(urls: str | List[str]) -> List[str]:
+    """a list of server URLs from a list or a comma separated string"""
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    return [url.strip().strip("/") for url in urls if url.strip()]
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], "big")
+
+
+class Endpoint:
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def healthy(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+
+class Shards:
+    """choose a server for each request: by consistent hash of a key, or the least busy for reads
+
+    Each URL owns replicas points on a hash ring; a key is served by the first healthy endpoint at or after
+    its hash, so a user's writes keep reaching one server and only the users of an ejected server move.
+    An endpoint failing eject_after requests in a row is ejected for eject_seconds, then tried again. When
+    every endpoint is ejected, all are used rather than failing without sending.
+    """
+
+    def __init__(
+        self,
+        urls: str | List[str],
+        *,
+        replicas: int = 64,
+        eject_after: int | None = None,
+        eject_seconds: float | None = None,
+    ):
+        self.endpoints = [Endpoint(url) for url in split_urls(urls)]
+        if not self.endpoints:
+            raise ValueError("no server URL")
+        self.eject_after = settings.get(eject_after, "SHARD_EJECT_FAILURES")
+        self.eject_seconds = settings.get(eject_seconds, "SHARD_EJECT_SECONDS")
+        self.ring = sorted(
+            (_hash(f"{endpoint.url}#{replica}"), index)
+            for index, endpoint in enumerate(self.endpoints)
+            for replica in range(replicas)
+        )
+        self.points = [point for point, _ in self.ring]
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def _available(self, exclude=()) -> List[Endpoint]:
+        now = time.monotonic()
+        endpoints = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        return [endpoint for endpoint in endpoints if endpoint.healthy(now)] or endpoints
+
+    def hashed(self, key: str, exclude=()) -> Endpoint:
+        """the endpoint owning key on the ring, skipping ejected and excluded endpoints"""
+        with self.lock:
+            available = self._available(exclude) or self.endpoints
+            start = bisect.bisect(self.points, _hash(key))
+            for offset in range(len(self.ring)):
+                endpoint = self.endpoints[self.ring[(start + offset) % len(self.ring)][1]]
+                if endpoint in available:
+                    return endpoint
+            return available[0]
+
+    def least_loaded(self, exclude=()) -> Endpoint:
+        """the available endpoint with the fewest requests in flight"""
+        with self.lock:
+            available = self._available(exclude) or self.endpoints
+            return min(available, key=lambda endpoint: endpoint.outstanding)
+
+    @contextlib.contextmanager
+    def track(self, endpoint: Endpoint) -> Iterator[Endpoint]:
+        """count a request in flight on endpoint"""
+        with self.lock:
+            endpoint.outstanding += 1
+        try:
+            yield endpoint
+        finally:
+            with self.lock:
+                endpoint.outstanding -= 1
+
+    def report(self, endpoint: Endpoint, ok: bool):
+        """record a request's outcome, ejecting the endpoint after too many failures in a row"""
+        with self.lock:
+            if ok:
+                endpoint.failures = 0
+                return
+            endpoint.failures += 1
+            if endpoint.failures >= self.eject_after:
+                endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                endpoint.failures = 0
+
+    def status(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            now = time.monotonic()
+            return [
+                dict(
+                    url=endpoint.url,
+                    healthy=endpoint.healthy(now),
+                    outstanding=endpoint.outstanding,
+                    failures=endpoint.failures,
+                )
+                for endpoint in self.endpoints
+            ]
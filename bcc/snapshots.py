@@ -0,0 +1,122 @@
+# page snapshots for debugging browser operations
+
+import functools
+import itertools
+import logging
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List
+
+import arrow
+
+from . import settings
+
+_local = threading.local()
+
+
+def tagged(request_id: str, func):
+    """wrap func to tag the snapshots it captures with request_id in whichever thread calls it"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, "request_id", None)
+        _local.request_id = request_id
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.request_id = previous
+
+    return wrapper
+
+
+def current_request() -> str | None:
+    return getattr(_local, "request_id", None)
+
+
+class Snapshots:
+    """keep the most recent page sources, and optionally screenshots, compressed in a bounded ring
+
+    The request thread only reads the page from the driver; compression, storage and dumps to disk run on
+    a single background thread, in the order they were captured. A capacity of 0 disables capture.
+    """
+
+    def __init__(self, capacity: int | None = None, *, screenshots: bool | None = None, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.capacity = settings.get(capacity, "SNAPSHOTS")
+        self.screenshots = settings.get(screenshots, "SNAPSHOT_SCREENSHOTS")
+        self.snapshots = deque(maxlen=self.capacity or None)
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshots")
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def capture(self, driver, step: str, target: str = ""):
+        """record the page the driver shows after step, tagged with the current request"""
+        if not self.enabled or driver is None:
+            return
+        try:
+            url = driver.current_url
+            source = driver.page_source
+            screenshot = driver.get_screenshot_as_png() if self.screenshots else None
+        except Exception as ex:
+            self.logger.debug(f"snapshot of {step} failed: {ex!r}")
+            return
+        meta = dict(id=next(self.ids), request=current_request(), target=target, step=step, url=url)
+        meta["time"] = str(arrow.now())
+        self.executor.submit(self._store, meta, source, screenshot)
+
+    def _store(self, meta: Dict[str, Any], source: str, screenshot: bytes | None):
+        source = zlib.compress(source.encode(), 1)
+        meta.update(size=len(source), screenshot=screenshot is not None)
+        with self.lock:
+            self.snapshots.append((meta, source, screenshot))
+
+    def flush(self):
+        """wait for captures already made to be stored"""
+        self.executor.submit(lambda: None).result()
+
+    def index(self, request_id: str | None = None) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [dict(meta) for meta, _, _ in self.snapshots if request_id is None or meta["request"] == request_id]
+
+    def _find(self, snapshot_id: int):
+        with self.lock:
+            for snapshot in self.snapshots:
+                if snapshot[0]["id"] == snapshot_id:
+                    return snapshot
+        raise KeyError(snapshot_id)
+
+    def source(self, snapshot_id: int) -> str:
+        return zlib.decompress(self._find(snapshot_id)[1]).decode()
+
+    def screenshot(self, snapshot_id: int) -> bytes | None:
+        return self._find(snapshot_id)[2]
+
+    def dump(self, request_id: str, directory: str | None = None):
+        """write the snapshots of a request to files once its pending captures are stored"""
+        if self.enabled and request_id:
+            self.executor.submit(self._dump, request_id, Path(settings.get(directory, "SNAPSHOT_DIR")))
+
+    def _dump(self, request_id: str, directory: Path):
+        directory = directory / request_id
+        with self.lock:
+            snapshots = [snapshot for snapshot in self.snapshots if snapshot[0]["request"] == request_id]
+        if not snapshots:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        for meta, source, screenshot in snapshots:
+            name = f"{meta['id']:06d}"
+            (directory / (name + ".html")).write_bytes(zlib.decompress(source))
+            if screenshot:
+                (directory / (name + ".png")).write_bytes(screenshot)
+            self.logger.info(f"snapshot {meta['id']} {meta['step']} {meta['url']}")
+        self.logger.warning(f"request {request_id}: dumped {len(snapshots)} page snapshots to {directory}")
+
+
+ring = Snapshots()
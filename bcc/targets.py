@@ -0,0 +1,177 @@
+# baikal target registry and session allocation
+
+import functools
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Set
+
+import arrow
+import yaml
+
+from . import settings
+from .backend import Backend
+from .browser import Session, default_target
+from .memory import MemoryBackend
+from .models import Account, Target, credential
+
+
+class UnknownTarget(Exception):
+    pass
+
+
+def load_targets(filename: str | None = None) -> Dict[str, Target]:
+    """read named baikal targets from a YAML mapping of name -> url, client_cert, client_key and optional fields;
+    a password given as @FILE is read from FILE"""
+    targets = {"default": default_target()}
+    filename = settings.get(filename, "TARGETS_FILE")
+    if filename:
+        with Path(filename).expanduser().open("r") as ifp:
+            for name, config in (yaml.safe_load(ifp) or {}).items():
+                config = {k: os.path.expanduser(v) if k.startswith("client_") else v for k, v in config.items()}
+                config = {k: settings.read_secret(v) if k.endswith("_password") else v for k, v in config.items()}
+                targets[name] = Target(name=name, **config)
+    return targets
+
+
+def profile_dir(name: str, affinity: str = "") -> str | None:
+    """each target, admin session and server worker runs its browser on a private copy of the profile"""
+    suffix = ""
+    if name != "default":
+        suffix += f".{name}"
+    if affinity:
+        suffix += f".admin-{affinity}"
+    if settings.WORKERS > 1:
+        suffix += f".worker-{os.getpid()}"
+    if suffix:
+        return settings.PROFILE_DIR + suffix
+    return None
+
+
+BACKENDS = {"browser": Session, "memory": MemoryBackend}
+
+
+def backend_class(name: str | None = None):
+    name = settings.get(name, "BACKEND")
+    if name not in BACKENDS:
+        raise ValueError(f"unknown backend: {name}; expected one of {list(BACKENDS)}")
+    return BACKENDS[name]
+
+
+class Sessions:
+    """allocate backend sessions per target, starting browsers lazily and stopping idle ones
+
+    Backends with per_admin set get one session per admin credential, up to ADMIN_SESSIONS per target, so each
+    admin keeps its own logged in browser and cookie jar. Past the limit the least recently used session is
+    taken from its admin and handed over to the new one, which logs in again; set ADMIN_SESSIONS to at least
+    the number of admins in use to avoid that.
+    """
+
+    def __init__(self, targets: Dict[str, Target] | None = None, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.targets = targets if targets is not None else load_targets()
+        self.sessions = {}
+        self.last_used = {}
+        self.queued = {name: 0 for name in self.targets}
+        self.last_success = {}
+        self.lock = threading.Lock()
+
+    def target(self, name: str | None = None) -> Target:
+        name = name or settings.TARGET
+        if name not in self.targets:
+            raise UnknownTarget(f"unknown target: {name}")
+        return self.targets[name]
+
+    def get(self, name: str | None = None, admin: Account | None = None) -> Backend:
+        name = self.target(name).name
+        cls = backend_class()
+        key = (name, credential(admin) if admin and cls.per_admin else "")
+        with self.lock:
+            if key not in self.sessions:
+                self.sessions[key] = self._allocate(cls, *key)
+            self.last_used[key] = arrow.now()
+            return self.sessions[key]
+
+    def _allocate(self, cls, name: str, affinity: str) -> Backend:
+        keys = [key for key in self.sessions if key[0] == name]
+        if affinity and len(keys) >= settings.ADMIN_SESSIONS:
+            lru = min(keys, key=lambda key: self.last_used[key])
+            self.logger.info(f"target {name} session limit reached; handing over least recently used session")
+            self.last_used.pop(lru)
+            return self.sessions.pop(lru)
+        self.logger.info(f"allocating session for target {name} {affinity}")
+        return cls(logger=self.logger, profile_dir=profile_dir(name, affinity), target=self.targets[name])
+
+    def allocated(self) -> Set[str]:
+        return {name for name, _ in self.sessions}
+
+    def active(self) -> Dict[str, Backend]:
+        """an active session of each target that has one, without marking it used or allocating any"""
+        with self.lock:
+            ret = {}
+            for (name, _), session in self.sessions.items():
+                if session.active:
+                    ret.setdefault(name, session)
+            return ret
+
+    def _target_sessions(self, name: str) -> List[Backend]:
+        return [session for (target, _), session in self.sessions.items() if target == name]
+
+    def evict_idle(self, timeout: int | None = None):
+        """stop the browsers of sessions unused for timeout seconds; they restart on next use"""
+        timeout = settings.get(timeout, "TARGET_IDLE_TIMEOUT")
+        cutoff = arrow.now().shift(seconds=-timeout)
+        with self.lock:
+            idle = [(key, session) for key, session in self.sessions.items() if self.last_used[key] < cutoff]
+        for key, session in idle:
+            if session.active:
+                self.logger.info(f"stopping idle session for target {key[0]}")
+                session.shutdown()
+
+    def track(self, name: str, func: Callable) -> Callable:
+        """count func as queued on target name until it returns, recording when an operation last succeeded"""
+        with self.lock:
+            self.queued[name] += 1
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                result = func(*args, **kwargs)
+                self.last_success[name] = arrow.now()
+                return result
+            finally:
+                with self.lock:
+                    self.queued[name] -= 1
+
+        return wrapper
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        """per target state from memory only, without touching the browser"""
+        ret = {}
+        for name, state in self.status().items():
+            sessions = [session.health() for session in self._target_sessions(name)]
+            last_success = self.last_success.get(name)
+            ret[name] = dict(
+                alive=bool(sessions) and all(health["alive"] for health in sessions),
+                ready=all(health["ready"] for health in sessions),
+                sessions=sessions,
+                state=state,
+                queued=self.queued[name],
+                last_success=str(last_success) if last_success else None,
+            )
+        return ret
+
+    def status(self) -> Dict[str, str]:
+        ret = {}
+        for name in self.targets:
+            sessions = self._target_sessions(name)
+            if not sessions:
+                ret[name] = "unallocated"
+            else:
+                ret[name] = "active" if any(session.active for session in sessions) else "stopped"
+        return ret
+
+    def shutdown(self):
+        for session in self.sessions.values():
+            session.shutdown()
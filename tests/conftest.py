@@ -20,6 +20,19 @@ TEST_PORT = 8001
 TEST_API_KEY = os.environ.get("TEST_API_KEY", "test_api_key")
 
 
+def pytest_addoption(parser):
+    parser.addoption("--run_slow", action="store_true", help="run the tests marked slow, such as benchmarks")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run_slow"):
+        return
+    skip = pytest.mark.skip(reason="slow; run with --run_slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
+
+
 @pytest.fixture(scope="session", autouse=True)
 def test_env():
     env = os.environ
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from bcc import deadlines
+from bcc.admission import READ, WRITE, Gate, Overloaded
+from bcc.browser import RequestTimeout
+from bcc.client import API
+
+
+def test_admission_overloaded():
+    gate = Gate(reads=2, writes=1)
+    gate.admit(READ)
+    gate.admit(READ)
+    gate.admit(WRITE)
+    with pytest.raises(Overloaded) as raised:
+        gate.admit(READ)
+    assert raised.value.lane == READ
+    assert raised.value.retry_after >= 1
+    with pytest.raises(Overloaded):
+        gate.admit(WRITE)
+
+
+def test_admission_priority():
+    gate = Gate(reads=10, writes=10, read_burst=2)
+    order = []
+    release = threading.Event()
+    busy = gate.admit(WRITE)
+    blocker = threading.Thread(target=gate.run, args=(WRITE, busy, release.wait))
+    blocker.start()
+    tickets = [(WRITE, gate.admit(WRITE)), (WRITE, gate.admit(WRITE))]
+    tickets += [(READ, gate.admit(READ)) for _ in range(3)]
+    threads = [
+        threading.Thread(target=gate.run, args=(lane, ticket, order.append, f"{lane}{i}"))
+        for i, (lane, ticket) in enumerate(tickets)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [blocker, *threads]:
+        thread.join()
+    # reads first, but a waiting write goes after every read_burst reads
+    assert order == ["read2", "read3", "write0", "read4", "write1"]
+    assert gate.status() == dict(read=dict(waiting=0, running=0), write=dict(waiting=0, running=0))
+
+
+def test_admission_deadline():
+    gate = Gate()
+    release = threading.Event()
+    busy = gate.admit(READ)
+    blocker = threading.Thread(target=gate.run, args=(READ, busy, release.wait))
+    blocker.start()
+    ticket = gate.admit(WRITE)
+    with deadlines.deadline(deadlines.expiry(0.05)):
+        with pytest.raises(RequestTimeout):
+            gate.run(WRITE, ticket, lambda: None)
+    release.set()
+    blocker.join()
+    assert gate.status()[WRITE]["waiting"] == 0
+
+
+class Overload:
+    status_code = 429
+
+    def __init__(self, retry_after):
+        self.headers = {"Retry-After": retry_after}
+
+    def close(self):
+        pass
+
+
+def test_admission_client_retry_after(monkeypatch):
+    api = API.__new__(API)
+    api.overload_retries = 2
+    api.overload_backoff = 0.01
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    responses = [Overload("3"), Overload("soon"), Overload("3")]
+    assert api._send(lambda url: responses.pop(0), "/users/").status_code == 429
+    assert len(sleeps) == 2
+    assert 3 <= sleeps[0] <= 3.01
+    assert 0.02 <= sleeps[1] <= 0.04
+
+
+def test_admission_cancel():
+    gate = Gate()
+    withdrawn = gate.admit(READ)
+    ticket = gate.admit(READ)
+    gate.cancel(READ, withdrawn)
+    with deadlines.deadline(deadlines.expiry(1)):
+        assert gate.run(READ, ticket, lambda: "ran") == "ran"
+        with pytest.raises(RequestTimeout):
+            gate.run(READ, withdrawn, lambda: "ran")
@@ -0,0 +1,71 @@
+import pytest
+
+from bcc.archive import Export, Import, read_archive
+from bcc.models import Book, ListFilter, User
+
+
+class FakeAPI:
+    def __init__(self, users=0, fail_after=None):
+        self.directory = {}
+        self.addressbooks = {}
+        self.calls = 0
+        self.fail_after = fail_after
+        for i in range(users):
+            self.add_user(f"user{i:03d}@domain.ext", f"user {i}", "password")
+            self.add_book(f"user{i:03d}@domain.ext", "contacts", f"contacts {i}")
+
+    def users(self, username=None, cursor=None, limit=None):
+        query = ListFilter(username=username or "", cursor=cursor or "", limit=limit or 0)
+        return [self.directory[name] for name in query.page([name for name in self.directory if query.matches(name)])]
+
+    def books(self, username):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise ConnectionError("server went away")
+        return list(self.addressbooks[username].values())
+
+    def add_user(self, username, displayname, password):
+        self.directory[username] = User(username=username, displayname=displayname, uri=f"principals/{username}")
+        self.addressbooks[username] = {}
+        return self.directory[username]
+
+    def add_book(self, username, bookname, description):
+        token = username.replace("@", "-").replace(".", "-") + "-" + bookname
+        book = Book(username=username, bookname=bookname, description=description, token=token)
+        self.addressbooks[username][token] = book
+        return book
+
+
+@pytest.mark.parametrize("suffix", ["ndjson", "tar"])
+def test_archive_export_resume(tmp_path, suffix):
+    complete = tmp_path / f"complete.{suffix}"
+    assert Export(FakeAPI(25), str(complete), page_size=10).run() == dict(users=25, books=25, resumed=False)
+
+    archive = tmp_path / f"resumed.{suffix}"
+    with pytest.raises(ConnectionError):
+        Export(FakeAPI(25, fail_after=13), str(archive), page_size=10, concurrency=1).run()
+    assert (tmp_path / f"resumed.{suffix}.checkpoint").exists()
+    assert Export(FakeAPI(25), str(archive), page_size=10).run() == dict(users=25, books=25, resumed=True)
+    assert not (tmp_path / f"resumed.{suffix}.checkpoint").exists()
+
+    with complete.open("rb") as ifp:
+        expected = list(read_archive(ifp, suffix))
+    with archive.open("rb") as ifp:
+        assert list(read_archive(ifp, suffix)) == expected
+    assert [user["username"] for user, _ in expected] == [f"user{i:03d}@domain.ext" for i in range(25)]
+
+
+def test_archive_import(tmp_path):
+    archive = tmp_path / "tenant.ndjson"
+    Export(FakeAPI(5), str(archive)).run()
+    api = FakeAPI(2)
+    api.add_book("user001@domain.ext", "other", "not in the archive")
+    importer = Import(api, concurrency=2)
+    with archive.open("rb") as ifp:
+        results = sorted(importer.run(read_archive(ifp, "ndjson")), key=lambda result: result["entry"])
+    assert [result["user"] for result in results] == ["skipped", "skipped", "added", "added", "added"]
+    assert all(result["success"] for result in results)
+    assert "password" in results[2] and "password" not in results[0]
+    assert importer.summary() == dict(users_added=3, users_skipped=2, books_added=3, books_skipped=2, failed=0)
+    assert sorted(api.directory) == [f"user{i:03d}@domain.ext" for i in range(5)]
+    assert len(api.addressbooks["user001@domain.ext"]) == 2
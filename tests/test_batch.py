@@ -0,0 +1,85 @@
+import io
+import threading
+import time
+
+from bcc.batch import Batch, read_csv, read_ndjson
+
+NDJSON = """\
+{"op": "mkuser", "username": "one@domain.ext", "displayname": "user one", "password": "password1"}
+{"op": "mkbook", "username": "one@domain.ext", "bookname": "contacts", "description": "one contacts"}
+# comment lines and blank lines are skipped
+
+{"op": "mkuser", "username": "two@domain.ext", "displayname": "user two", "password": "short"}
+{"op": "frobnicate", "username": "two@domain.ext"}
+not json
+{"op": "rmbook", "username": "one@domain.ext", "token": "one-domain-ext-contacts"}
+"""
+
+CSV = """\
+op,username,displayname,password,bookname,description,token
+mkuser,one@domain.ext,user one,password1,,,
+rmuser,one@domain.ext,,,,,
+"""
+
+
+class FakeAPI:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _call(self, *args):
+        time.sleep(0.05)
+        with self.lock:
+            self.calls.append(args)
+        return dict(success=True)
+
+    def add_user(self, username, displayname, password):
+        return self._call("add_user", username)
+
+    def delete_user(self, username):
+        return self._call("delete_user", username)
+
+    def add_book(self, username, bookname, description):
+        # the client takes a description string, as API.add_book validates
+        assert isinstance(description, str)
+        return self._call("add_book", username, bookname, description)
+
+    def delete_book(self, username, token):
+        return self._call("delete_book", username, token)
+
+
+def test_batch_ndjson():
+    api = FakeAPI()
+    runner = Batch(api, concurrency=4)
+    results = {r["line"]: r for r in runner.run(read_ndjson(io.StringIO(NDJSON)))}
+    assert sorted(results.keys()) == [1, 2, 5, 6, 7, 8]
+    assert [line for line, r in results.items() if r["success"]] == [1, 2, 8]
+    assert "unknown op" in results[6]["error"]
+    assert runner.summary() == dict(succeeded=3, failed=3, skipped=0, resume_from=5, failed_lines=[5, 6, 7])
+    user_one = [call for call in api.calls if call[1] == "one@domain.ext"]
+    assert [call[0] for call in user_one] == ["add_user", "add_book", "delete_book"]
+
+
+def test_batch_book_without_description():
+    api = FakeAPI()
+    runner = Batch(api)
+    csv = "op,username,bookname\nmkbook,one@domain.ext,contacts\n"
+    results = list(runner.run(read_csv(io.StringIO(csv))))
+    assert [result["success"] for result in results] == [True]
+    assert api.calls == [("add_book", "one@domain.ext", "contacts", "")]
+
+
+def test_batch_csv_resume():
+    api = FakeAPI()
+    runner = Batch(api, concurrency=2, resume_from=3)
+    results = list(runner.run(read_csv(io.StringIO(CSV))))
+    assert results == [dict(line=3, op="rmuser", success=True, username="one@domain.ext", result=dict(success=True))]
+    assert runner.summary() == dict(succeeded=1, failed=0, skipped=1)
+
+
+def test_batch_failed_lines():
+    api = FakeAPI()
+    runner = Batch(api, concurrency=2, lines={2, 8})
+    results = list(runner.run(read_ndjson(io.StringIO(NDJSON))))
+    assert sorted(result["line"] for result in results) == [2, 8]
+    assert runner.summary() == dict(succeeded=2, failed=0, skipped=4)
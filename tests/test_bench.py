@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from bcc.bench import Bench, parse_mix, percentile
+from bcc.models import Book, User
+
+
+class FakeAPI:
+    """users and books kept in memory, noting operations on one user that overlap"""
+
+    def __init__(self, broken=()):
+        self.broken = set(broken)
+        self.directory = {}
+        self.lock = threading.Lock()
+        self.busy = set()
+        self.overlapped = False
+
+    def _operate(self, username, func):
+        with self.lock:
+            self.overlapped |= username in self.busy
+            self.busy.add(username)
+        try:
+            time.sleep(0.002)
+            with self.lock:
+                return func()
+        finally:
+            with self.lock:
+                self.busy.discard(username)
+
+    def users(self, username=None, match=None, limit=None):
+        with self.lock:
+            names = [name for name in self.directory if name == username or (match and name.startswith(match))]
+        return [User(username=name) for name in names][:limit]
+
+    def add_user(self, username, displayname, password):
+        self._operate(username, lambda: self.directory.setdefault(username, {}))
+        return User(username=username, displayname=displayname)
+
+    def delete_user(self, username):
+        self._operate(username, lambda: self.directory.pop(username))
+        return dict(message="deleted")
+
+    def books(self, username):
+        return self._operate(username, lambda: list(self.directory[username].values()))
+
+    def add_book(self, username, bookname, description):
+        if username in self.broken:
+            raise RuntimeError("add failed")
+        token = bookname.replace(" ", "-")
+        book = Book(username=username, bookname=bookname, token=token, description=description)
+        self._operate(username, lambda: self.directory[username].update({token: book}))
+        return book
+
+    def delete_book(self, username, token):
+        self._operate(username, lambda: self.directory[username].pop(token))
+        return dict(message="deleted")
+
+
+def test_bench_parse_mix():
+    assert parse_mix("mkuser=2, rmuser") == dict(mkuser=2.0, rmuser=1.0)
+    with pytest.raises(ValueError):
+        parse_mix("frobnicate=1")
+    with pytest.raises(ValueError):
+        parse_mix("mkuser=0")
+
+
+def test_bench_percentile():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([1.0], 95) == 1.0
+
+
+def test_bench_concurrency():
+    api = FakeAPI()
+    report = Bench(api, concurrency=8, operations=200, prefix="bench", seed=1).run()
+    assert report["mode"] == "concurrency"
+    assert report["operations"] == report["succeeded"] == 200
+    assert report["failed"] == 0
+    assert report["latency_ms"]["all"]["count"] == 200
+    assert set(report["latency_ms"]) <= {"users", "books", "mkuser", "mkbook", "rmbook", "rmuser", "all"}
+    assert report["latency_ms"]["mkuser"]["p50"] <= report["latency_ms"]["mkuser"]["p99"]
+    assert not api.overlapped
+    # everything the run created is gone
+    assert api.directory == {}
+    assert report["cleanup"]["failed"] == 0
+
+
+def test_bench_rate_errors():
+    api = FakeAPI()
+    bench = Bench(api, "mkuser=1,mkbook=3", concurrency=4, rate=200, operations=40, prefix="bench", seed=2)
+    api.broken = {"bench-1@bench.example.org"}
+    report = bench.run()
+    assert report["mode"] == "rate"
+    assert report["operations"] == 40
+    assert report["errors"]["mkbook"] == {"RuntimeError: add failed": report["failed"]}
+    assert report["failed"] > 0
+    assert api.directory == {}
+
+
+def test_bench_rmbook_failure_keeps_book():
+    bench = Bench(FakeAPI(), "rmbook=1", prefix="bench")
+    bench.books["missing@bench.example.org"] = []
+    bench._run("rmbook", "missing@bench.example.org", "book-1", time.monotonic())
+    assert bench.errors["rmbook"] == {"KeyError: 'missing@bench.example.org'": 1}
+    assert bench.books["missing@bench.example.org"] == ["book-1"]
@@ -0,0 +1,161 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import pytest
+
+from bcc.carddav import CardDAV
+
+BOOKS = {
+    f"user{i}@domain.ext": {f"user{i}-contacts": ("contacts", "my contacts", i), f"user{i}-work": ("work", "", 0)}
+    for i in range(4)
+}
+
+OK = "<d:status>HTTP/1.1 200 OK</d:status>"
+NOT_FOUND = "<d:status>HTTP/1.1 404 Not Found</d:status>"
+
+
+def multistatus(responses):
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<d:multistatus xmlns:d="DAV:" xmlns:card="urn:ietf:params:xml:ns:carddav">'
+        + "".join(responses)
+        + "</d:multistatus>"
+    )
+
+
+def response(href, props, missing=""):
+    ret = f"<d:response><d:href>{href}</d:href><d:propstat><d:prop>{props}</d:prop>{OK}</d:propstat>"
+    if missing:
+        ret += f"<d:propstat><d:prop>{missing}</d:prop>{NOT_FOUND}</d:propstat>"
+    return ret + "</d:response>"
+
+
+class Responder(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    inflight = 0
+    max_inflight = 0
+    sync = True
+    requests = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_PROPFIND(self):
+        with self.lock:
+            Responder.inflight += 1
+            Responder.max_inflight = max(Responder.max_inflight, Responder.inflight)
+        request = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        time.sleep(0.02)
+        parts = unquote(self.path).strip("/").split("/")
+        username, token = parts[3], parts[4] if len(parts) > 4 else None
+        home = f"/baikal/dav.php/addressbooks/{username}/"
+        Responder.requests.append((self.command, token))
+        if self.command == "REPORT":
+            status, body = self.report(home, username, token, request)
+        elif username not in BOOKS:
+            status, body = 404, b""
+        elif token is None:
+            responses = [response(home, "<d:resourcetype><d:collection/></d:resourcetype>")]
+            for name, (displayname, description, _) in BOOKS[username].items():
+                props = "<d:resourcetype><d:collection/><card:addressbook/></d:resourcetype>"
+                props += f"<d:displayname>{displayname}</d:displayname>"
+                if self.sync:
+                    props += f"<d:sync-token>sync-{BOOKS[username][name][2]}</d:sync-token>"
+                if description:
+                    props += f"<card:addressbook-description>{description}</card:addressbook-description>"
+                responses.append(
+                    response(home + name + "/", props, "" if description else "<card:addressbook-description/>")
+                )
+            status, body = 207, multistatus(responses).encode()
+        else:
+            count = BOOKS[username][token][2]
+            responses = [response(f"{home}{token}/", "<d:resourcetype><d:collection/></d:resourcetype>")]
+            responses += [
+                response(f"{home}{token}/{n}.vcf", '<d:resourcetype/><d:getetag>"1"</d:getetag>') for n in range(count)
+            ]
+            status, body = 207, multistatus(responses).encode()
+        with self.lock:
+            Responder.inflight -= 1
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_REPORT = do_PROPFIND
+
+    def report(self, home, username, token, request):
+        """sync-collection: cards numbered 0 to count - 1, where a book's sync token is its count"""
+        count = BOOKS[username][token][2]
+        since = request.split("<d:sync-token>")[1].split("</d:sync-token>")[0]
+        if since and not since.startswith("sync-"):
+            return 403, b""
+        since = int(since[5:]) if since else 0
+        added = [response(f"{home}{token}/{n}.vcf", '<d:getetag>"1"</d:getetag>') for n in range(since, count)]
+        removed = [
+            f"<d:response><d:href>{home}{token}/{n}.vcf</d:href>{NOT_FOUND}</d:response>" for n in range(count, since)
+        ]
+        body = multistatus(added + removed).replace("</d:multistatus>", f"<d:sync-token>sync-{count}</d:sync-token>")
+        return 207, (body + "</d:multistatus>").encode()
+
+
+@pytest.fixture(scope="module")
+def carddav():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Responder)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield CardDAV(f"http://127.0.0.1:{server.server_port}/baikal", concurrency=4)
+    finally:
+        server.shutdown()
+
+
+def test_carddav_books(carddav):
+    books = carddav.books("user2@domain.ext")
+    assert [book.token for book in books] == ["user2-contacts", "user2-work"]
+    assert books[0].bookname == "contacts"
+    assert books[0].description == "my contacts"
+    assert books[0].contacts == 2
+    assert books[0].uri == carddav.url + "/dav.php/addressbooks/user2@domain.ext/user2-contacts/"
+    assert books[1].description == ""
+    assert books[1].contacts == 0
+    assert carddav.books("nobody@domain.ext") == []
+
+
+def test_carddav_concurrent(carddav):
+    Responder.max_inflight = 0
+    user_books = carddav.user_books(list(BOOKS.keys()))
+    assert {username: len(books) for username, books in user_books.items()} == {username: 2 for username in BOOKS}
+    assert user_books["user3@domain.ext"][0].contacts == 3
+    assert Responder.max_inflight > 1
+
+
+def test_carddav_counts_changes_only(carddav):
+    username = "user1@domain.ext"
+    carddav.books(username)
+    Responder.requests = []
+    assert [book.contacts for book in carddav.books(username)] == [1, 0]
+    # unchanged books cost no request beyond the listing
+    assert Responder.requests == [("PROPFIND", None)]
+    saved = dict(BOOKS[username])
+    try:
+        BOOKS[username]["user1-contacts"] = ("contacts", "my contacts", 5)
+        Responder.requests = []
+        assert [book.contacts for book in carddav.books(username)] == [5, 0]
+        assert Responder.requests == [("PROPFIND", None), ("REPORT", "user1-contacts")]
+        BOOKS[username]["user1-contacts"] = ("contacts", "my contacts", 2)
+        assert [book.contacts for book in carddav.books(username)] == [2, 0]
+    finally:
+        BOOKS[username] = saved
+
+
+def test_carddav_without_sync_tokens(carddav):
+    Responder.sync = False
+    try:
+        Responder.requests = []
+        assert [book.contacts for book in carddav.books("user3@domain.ext")] == [3, 0]
+        assert [method for method, _ in Responder.requests] == ["PROPFIND"] * 3
+    finally:
+        Responder.sync = True
@@ -8,7 +8,8 @@ import pytest
 from click.testing import CliRunner
 
 import bcc as bcc_module
-from bcc import __version__, bcc
+from bcc import __version__, bcc, cli, settings
+from bcc.cli import output
 from bcc.models import Book, User
 
 
@@ -133,3 +134,66 @@ def test_cli_exit(run):
     assert result
     # with pytest.raises(AssertionError):
     #    run(["--help"], assert_exit=-1)
+
+
+class PagedAPI:
+    """lists users a page at a time, as the server does"""
+
+    usernames = ["one@domain.ext", "three@domain.ext", "two@domain.ext"]
+
+    def __init__(self):
+        self.next_cursor = ""
+
+    def iter_users(self, username=None, match=None, limit=None, cursor=None):
+        page = [name for name in self.usernames if name > (cursor or "")][:limit]
+        self.next_cursor = page[-1] if limit and len(page) == limit else ""
+        return iter(User(username=name) for name in page)
+
+
+def test_cli_users_pages(monkeypatch):
+    monkeypatch.setattr(cli, "API", PagedAPI)
+    monkeypatch.setattr(settings, "OUTPUT_FORMAT", "json")
+    monkeypatch.setattr(settings, "OUTPUT_FIELDS", "username")
+    runner = CliRunner()
+    first = runner.invoke(bcc, ["users", "--limit", "2"])
+    assert json.loads(first.stdout) == [dict(username="one@domain.ext"), dict(username="three@domain.ext")]
+    assert first.stderr == "next cursor: three@domain.ext\n"
+    second = runner.invoke(bcc, ["users", "--limit", "2", "--cursor", "three@domain.ext"])
+    assert json.loads(second.stdout) == [dict(username="two@domain.ext")]
+    assert second.stderr == ""
+
+
+def test_cli_output_formats(capsys, monkeypatch):
+    books = [
+        Book(username="one@domain.ext", bookname="contacts", description="one", token="one-contacts"),
+        Book(username="two@domain.ext", bookname="work", description="two words", token="two-work"),
+    ]
+    monkeypatch.setattr(settings, "OUTPUT_FIELDS", "")
+    monkeypatch.setattr(settings, "OUTPUT_FORMAT", "json")
+    output(iter(books))
+    assert json.loads(capsys.readouterr().out) == [book.model_dump(mode="json") for book in books]
+    output(iter([]))
+    assert json.loads(capsys.readouterr().out) == []
+
+    monkeypatch.setattr(settings, "OUTPUT_FORMAT", "ndjson")
+    monkeypatch.setattr(settings, "OUTPUT_FIELDS", "username,token")
+    output(iter(books))
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line) for line in lines] == [
+        dict(username="one@domain.ext", token="one-contacts"),
+        dict(username="two@domain.ext", token="two-work"),
+    ]
+
+    monkeypatch.setattr(settings, "OUTPUT_FORMAT", "csv")
+    monkeypatch.setattr(settings, "OUTPUT_FIELDS", "token,description")
+    output(iter(books))
+    assert capsys.readouterr().out.splitlines() == [
+        "token,description",
+        "one-contacts,one",
+        "two-work,two words",
+    ]
+
+    monkeypatch.setattr(settings, "OUTPUT_FORMAT", "tsv")
+    monkeypatch.setattr(settings, "OUTPUT_FIELDS", "")
+    output(dict(message="ok", detail=dict(a=1)))
+    assert capsys.readouterr().out.splitlines() == ["message\tdetail", 'ok\t"{""a"": 1}"']
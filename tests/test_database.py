@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+from bcc.database import BaikalDatabase
+from bcc.models import ListFilter
+
+URL = "https://caldav.domain.ext/baikal"
+USERS = 2000
+
+SCHEMA = """
+CREATE TABLE users (
+    id integer primary key asc NOT NULL, username TEXT NOT NULL, digesta1 TEXT NOT NULL, UNIQUE(username)
+);
+CREATE TABLE principals (
+    id INTEGER PRIMARY KEY ASC NOT NULL, uri TEXT NOT NULL, email TEXT, displayname TEXT, UNIQUE(uri)
+);
+CREATE TABLE addressbooks (
+    id integer primary key asc NOT NULL, principaluri text NOT NULL, displayname text, uri text NOT NULL,
+    description text, synctoken integer DEFAULT 1 NOT NULL
+);
+CREATE TABLE cards (
+    id integer primary key asc NOT NULL, addressbookid integer NOT NULL, carddata blob, uri text NOT NULL,
+    lastmodified integer, etag text, size integer
+);
+"""
+
+
+@pytest.fixture(scope="module")
+def baikal_db(tmp_path_factory):
+    path = tmp_path_factory.mktemp("baikal") / "db.sqlite"
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    for i in range(USERS):
+        username = f"user{i:04d}@domain.ext"
+        connection.execute("INSERT INTO users (username, digesta1) VALUES (?, 'x')", (username,))
+        connection.execute(
+            "INSERT INTO principals (uri, email, displayname) VALUES (?, ?, ?)",
+            (f"principals/{username}", username, f"user {i}"),
+        )
+        if i % 100 == 0:
+            cursor = connection.execute(
+                "INSERT INTO addressbooks (principaluri, displayname, uri, description) VALUES (?, ?, ?, ?)",
+                (f"principals/{username}", "contacts", f"user{i:04d}-contacts", "my contacts"),
+            )
+            for card in range(i // 100):
+                connection.execute(
+                    "INSERT INTO cards (addressbookid, carddata, uri) VALUES (?, 'BEGIN:VCARD', ?)",
+                    (cursor.lastrowid, f"{card}.vcf"),
+                )
+    connection.commit()
+    connection.close()
+    return BaikalDatabase(str(path), URL)
+
+
+def test_database_users(baikal_db):
+    users = baikal_db.users()
+    assert len(users) == USERS
+    assert users[1].username == "user0001@domain.ext"
+    assert users[1].displayname == "user 1"
+    assert users[1].uri == "principals/user0001@domain.ext"
+    assert baikal_db.usernames(ListFilter(match="user000*", limit=3, cursor="user0001@domain.ext")) == [
+        "user0002@domain.ext",
+        "user0003@domain.ext",
+        "user0004@domain.ext",
+    ]
+
+
+def test_database_books(baikal_db):
+    books = baikal_db.books("user0300@domain.ext")
+    assert len(books) == 1
+    assert books[0].token == "user0300-contacts"
+    assert books[0].bookname == "contacts"
+    assert books[0].contacts == 3
+    assert books[0].uri == f"{URL}/dav.php/addressbooks/user0300@domain.ext/user0300-contacts/"
+    assert [book.token for book in baikal_db.books("User0300@Domain.ext")] == ["user0300-contacts"]
+    assert baikal_db.books("user0001@domain.ext") == []
+    assert baikal_db.books("user0000@domain.ext")[0].contacts == 0
+
+
+def test_database_read_only(baikal_db):
+    with pytest.raises(sqlite3.OperationalError):
+        baikal_db._query("DELETE FROM users")
@@ -0,0 +1,40 @@
+import threading
+import time
+
+import pytest
+
+from bcc import deadlines
+from bcc.browser import RequestTimeout, serialized
+
+
+def test_deadline_remaining():
+    assert deadlines.remaining() is None
+    with deadlines.deadline(deadlines.expiry(10)):
+        assert 9 < deadlines.remaining() <= 10
+        with deadlines.deadline(deadlines.expiry(0.01)):
+            time.sleep(0.02)
+            assert deadlines.expired()
+        assert not deadlines.expired()
+    assert deadlines.remaining() is None
+    assert deadlines.expiry(0) is None
+
+
+class Busy:
+    def __init__(self):
+        self.lock = threading.RLock()
+
+    @serialized
+    def work(self, seconds):
+        time.sleep(seconds)
+        return seconds
+
+
+def test_deadline_serialized():
+    busy = Busy()
+    worker = threading.Thread(target=busy.work, args=(0.5,))
+    worker.start()
+    time.sleep(0.05)
+    with pytest.raises(RequestTimeout):
+        deadlines.bounded(deadlines.expiry(0.1), busy.work)(0)
+    worker.join()
+    assert deadlines.bounded(deadlines.expiry(0.1), busy.work)(0) == 0
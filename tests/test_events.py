@@ -0,0 +1,49 @@
+import asyncio
+
+from bcc.events import BOOK_ADDED, USER_ADDED, USER_DELETED, Events
+
+
+def test_events_since():
+    events = Events(retention=2)
+    for i in range(3):
+        events.publish(USER_ADDED, "default", f"user{i}@domain.ext")
+    retained, missed = events.since(1)
+    assert [event.id for event in retained] == [2, 3]
+    assert not missed
+    retained, missed = events.since(0)
+    assert missed
+    assert events.since(3) == ([], False)
+
+
+def test_events_diff():
+    events = Events()
+    events.diff("default", {"user1@domain.ext": {"book1"}}, 0)
+    assert events.last_id == 0
+    started = events.last_id
+    events.diff("default", {"user1@domain.ext": {"book1", "book2"}, "user2@domain.ext": set()}, started)
+    assert [(e.type, e.username, e.token) for e in events.since(0)[0]] == [
+        (USER_ADDED, "user2@domain.ext", None),
+        (BOOK_ADDED, "user1@domain.ext", "book2"),
+    ]
+
+    # a snapshot overlapping bcc's own write is discarded; the write itself updates the last snapshot
+    started = events.last_id
+    events.publish(USER_DELETED, "default", "user2@domain.ext")
+    events.diff("default", {"user1@domain.ext": {"book1", "book2"}, "user2@domain.ext": set()}, started)
+    assert events.last_id == started + 1
+    events.diff("default", {"user1@domain.ext": {"book1", "book2"}}, events.last_id)
+    assert events.last_id == started + 1
+
+
+async def test_events_subscribe():
+    events = Events(retention=10)
+    events.attach(asyncio.get_running_loop())
+    events.publish(USER_ADDED, "default", "user1@domain.ext")
+    stream = events.subscribe(0, keepalive=0.05)
+    message = await anext(stream)
+    assert message.startswith("id: 1\nevent: user_added\ndata: {")
+    assert await anext(stream) == ": keepalive\n\n"
+    asyncio.get_running_loop().call_later(0.01, events.publish, USER_DELETED, "default", "user1@domain.ext")
+    message = await asyncio.wait_for(anext(stream), 1)
+    assert message.startswith("id: 2\nevent: user_deleted\n")
+    await stream.aclose()
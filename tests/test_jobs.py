@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from bcc.jobs import Jobs, JobsFull, UnknownJob
+from bcc.models import UptimeResponse
+
+
+def wait_done(jobs, job, timeout=5):
+    deadline = time.time() + timeout
+    while not jobs.get(job.id).done:
+        assert time.time() < deadline, "timeout waiting for job"
+        time.sleep(0.01)
+    return jobs.get(job.id).status()
+
+
+def test_jobs_result():
+    jobs = Jobs(workers=2, retention=10, ttl=60)
+
+    def work(job):
+        for i in range(3):
+            job.update(users=i + 1, total=3)
+        return UptimeResponse(message="done")
+
+    status = wait_done(jobs, jobs.submit("work", work))
+    assert status.state == "succeeded"
+    assert status.progress == dict(users=3, total=3)
+    assert status.result["message"] == "done"
+    assert status.finished
+
+
+def test_jobs_failure():
+    jobs = Jobs(workers=1, retention=10, ttl=60)
+
+    def fail(job):
+        raise ValueError("broken")
+
+    status = wait_done(jobs, jobs.submit("fail", fail))
+    assert status.state == "failed"
+    assert status.error == "ValueError: broken"
+    with pytest.raises(UnknownJob):
+        jobs.get("nonexistent")
+
+
+def test_jobs_retention():
+    jobs = Jobs(workers=1, retention=2, ttl=60)
+    submitted = [jobs.submit(f"job{i}", lambda job: dict(ok=True)) for i in range(4)]
+    wait_done(jobs, submitted[-1])
+    remaining = [job.id for job in jobs.all()]
+    assert remaining == [job.id for job in submitted[2:]]
+
+
+def test_jobs_pending_limit():
+    jobs = Jobs(workers=1, retention=10, ttl=60, pending_limit=1)
+    release = threading.Event()
+    running = jobs.submit("running", lambda job: release.wait(5))
+    while running.state == "pending":
+        time.sleep(0.01)
+    jobs.submit("pending", lambda job: True)
+    with pytest.raises(JobsFull):
+        jobs.submit("refused", lambda job: True)
+    release.set()
+    assert wait_done(jobs, running).state == "succeeded"
+    assert jobs.status()["succeeded"] == 2
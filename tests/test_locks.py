@@ -0,0 +1,31 @@
+import time
+from threading import Thread
+
+from bcc import settings
+from bcc.locks import lock_file, locked, user_lock
+
+
+def test_locks_exclusive(tmp_path):
+    settings.LOCK_DIR = str(tmp_path)
+    events = []
+
+    def contender():
+        with user_lock("name@domain.ext"):
+            events.append("contender")
+
+    with user_lock("name@domain.ext"):
+        thread = Thread(target=contender)
+        thread.start()
+        time.sleep(0.2)
+        events.append("holder")
+    thread.join()
+    assert events == ["holder", "contender"]
+    assert lock_file("user-name@domain.ext").is_file()
+
+
+def test_locks_independent(tmp_path):
+    settings.LOCK_DIR = str(tmp_path)
+    with locked("user-one@domain.ext"):
+        with locked("user-two@domain.ext"):
+            pass
+    assert lock_file("user/../escape").parent == tmp_path
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bcc import settings
+from bcc.app import app
+from bcc.memory import MemoryBackend
+
+
+@pytest.fixture
+def memory_client(monkeypatch):
+    monkeypatch.setattr(settings, "BACKEND", "memory")
+    monkeypatch.setattr(settings, "TARGETS_FILE", "")
+    headers = {"X-Admin-Username": "admin", "X-Admin-Password": "adminpassword", "X-Api-Key": str(settings.API_KEY)}
+    with TestClient(app, headers=headers) as client:
+        yield client
+
+
+def test_memory_backend_api(memory_client):
+    assert isinstance(app.state.sessions.get(), MemoryBackend)
+    user = dict(username="user1@domain.ext", displayname="user one", password="password1")
+    response = memory_client.post("/user/", json=user)
+    assert response.status_code == 200
+    assert response.json()["user"]["uri"] == "principals/user1@domain.ext"
+    assert memory_client.post("/user/", json=user).status_code == 500
+
+    book = dict(username="user1@domain.ext", bookname="contacts", description="my contacts")
+    response = memory_client.post("/book/", json=book)
+    assert response.status_code == 200
+    token = response.json()["book"]["token"]
+    assert token == "user1-domain-ext-contacts"
+
+    users = memory_client.get("/users/").json()["users"]
+    assert [u["username"] for u in users] == ["user1@domain.ext"]
+    books = memory_client.get("/books/").json()["books"]
+    assert [b["token"] for b in books] == [token]
+
+    response = memory_client.request("DELETE", "/book/", json=dict(username="user1@domain.ext", token=token))
+    assert response.status_code == 200
+    response = memory_client.request("DELETE", "/user/", json=dict(username="user1@domain.ext"))
+    assert response.status_code == 200
+    assert memory_client.get("/users/").json()["users"] == []
+    assert memory_client.get("/status/").json()["status"]["backend"] == "memory"
+
+
+def test_memory_backend_deadline(memory_client):
+    app.state.sessions.get().latency = 0.2
+    response = memory_client.get("/users/", headers={"X-Request-Timeout": "0.05"})
+    assert response.status_code == 504
+    assert response.json()["message"] == "RequestTimeout"
+
+
+def test_memory_backend_events(memory_client):
+    start = app.state.events.last_id
+    user = dict(username="user2@domain.ext", displayname="user two", password="password2")
+    assert memory_client.post("/user/", json=user).status_code == 200
+    assert memory_client.request("DELETE", "/user/", json=dict(username="user2@domain.ext")).status_code == 200
+    events, _ = app.state.events.since(start)
+    assert [(event.type, event.username) for event in events] == [
+        ("user_added", "user2@domain.ext"),
+        ("user_deleted", "user2@domain.ext"),
+    ]
+
+
+def test_memory_backend_probes(memory_client):
+    assert memory_client.get("/healthz", headers={"X-Api-Key": ""}).status_code == 200
+    assert memory_client.get("/users/", headers={"X-Api-Key": ""}).status_code == 401
+    assert memory_client.get("/users/").status_code == 200
+    response = memory_client.get("/readyz", headers={"X-Api-Key": ""})
+    assert response.status_code == 200
+    default = response.json()["targets"]["default"]
+    assert default["ready"]
+    assert default["queued"] == 0
+    assert default["last_success"]
+
+
+def test_memory_backend_overload(memory_client, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_READS", 1)
+    app.state.sessions.get().latency = 0.3
+    first = threading.Thread(target=memory_client.get, args=("/users/",))
+    first.start()
+    time.sleep(0.1)
+    response = memory_client.get("/users/")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert memory_client.get("/uptime/").status_code == 200
+    first.join()
+    assert memory_client.get("/users/").status_code == 200
+
+
+def test_memory_backend_rejected_request_leaves_queue(memory_client):
+    assert memory_client.get("/users/").status_code == 200
+    response = memory_client.get("/users/", headers={"X-Request-Timeout": "abc"})
+    assert response.status_code == 400
+    assert app.state.admission.status()[0]["read"] == dict(waiting=0, running=0)
+    assert memory_client.get("/users/", headers={"X-Request-Timeout": "5"}).status_code == 200
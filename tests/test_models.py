@@ -1,3 +1,6 @@
+import json
+import time
+
 import pytest
 from pydantic import ValidationError
 
@@ -8,9 +11,13 @@ from bcc.models import (
     Book,
     DeleteBookRequest,
     DeleteUserRequest,
+    ListFilter,
     User,
+    UsersResponse,
 )
 
+BENCHMARK_RECORDS = 10000
+
 
 @pytest.fixture
 def valid_emails():
@@ -97,3 +104,79 @@ def test_models_add_book():
 def test_models_delete_book():
     request = DeleteBookRequest(username="name@domain.com", token="this-is-a-token-1234")
     assert isinstance(request, DeleteBookRequest)
+
+
+def test_models_list_filter():
+    usernames = ["bob@domain.ext", "alice@domain.ext", "alan@other.ext", "carol@domain.ext"]
+    assert [u for u in usernames if ListFilter().matches(u)] == usernames
+    assert [u for u in usernames if ListFilter(match="AL").matches(u)] == ["alice@domain.ext", "alan@other.ext"]
+    assert [u for u in usernames if ListFilter(match="*@domain.ext").matches(u)] == [
+        "bob@domain.ext",
+        "alice@domain.ext",
+        "carol@domain.ext",
+    ]
+    assert [u for u in usernames if ListFilter(username="bob@domain.ext").matches(u)] == ["bob@domain.ext"]
+
+    query = ListFilter(limit=2)
+    page = query.page(usernames)
+    assert page == ["alan@other.ext", "alice@domain.ext"]
+    assert query.next_cursor(page) == "alice@domain.ext"
+    query = ListFilter(limit=2, cursor="alice@domain.ext")
+    page = query.page(usernames)
+    assert page == ["bob@domain.ext", "carol@domain.ext"]
+    query = ListFilter(limit=2, cursor="carol@domain.ext")
+    assert query.page(usernames) == []
+    assert query.next_cursor([]) == ""
+    with pytest.raises(ValidationError):
+        _ = ListFilter(limit=-1)
+
+
+def _rows(count):
+    return [
+        dict(username=f"User{i}@domain.ext ", displayname=f"user {i}", uri=f"principals/user{i}@domain.ext")
+        for i in range(count)
+    ]
+
+
+def test_models_trusted_paths():
+    rows = _rows(100)
+    validated = [User(**dict(row)) for row in rows]
+    assert User.validate_list([dict(row) for row in rows]) == validated
+    response = UsersResponse(users=validated)
+    revalidated = UsersResponse.model_validate(response.model_dump()).model_dump_json()
+    assert UsersResponse.model_construct(users=validated).model_dump_json() == revalidated
+    received = json.loads(response.model_dump_json())["users"]
+    assert User.trusted_list(received) == validated
+
+
+def _per_record(func, rows, repeat=3):
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(rows)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed) / len(rows) * 1e6
+
+
+@pytest.mark.slow
+def test_models_trusted_benchmark(capsys):
+    rows = _rows(BENCHMARK_RECORDS)
+    validated = [User(**dict(row)) for row in rows]
+    response = UsersResponse(users=validated)
+    received = json.loads(response.model_dump_json())["users"]
+    costs = dict(
+        scrape_model=_per_record(lambda rows: [User(**dict(row)) for row in rows], rows),
+        scrape_list_adapter=_per_record(lambda rows: User.validate_list([dict(row) for row in rows]), rows),
+        serialize_revalidated=_per_record(
+            lambda rows: UsersResponse.model_validate(response.model_dump()).model_dump_json(), validated
+        ),
+        serialize_constructed=_per_record(
+            lambda rows: UsersResponse.model_construct(users=rows).model_dump_json(), validated
+        ),
+        client_validated=_per_record(lambda rows: [User(**dict(row)) for row in rows], received),
+        client_trusted=_per_record(User.trusted_list, received),
+    )
+    with capsys.disabled():
+        print(f"\nper-record cost for {BENCHMARK_RECORDS} records (microseconds):")
+        for path, cost in costs.items():
+            print(f"  {path}: {cost:.2f}")
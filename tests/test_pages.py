@@ -0,0 +1,421 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    StaleElementReferenceException,
+)
+
+from bcc import browser
+from bcc.browser import InitFailed, Session, UnexpectedServerResponse
+from bcc.models import (
+    Account,
+    AddBookRequest,
+    AddUserRequest,
+    DeleteBookRequest,
+    DeleteUserRequest,
+    Target,
+)
+from bcc.pages import USERS, Pages
+
+URL = "http://caldav.domain.ext/baikal"
+USERS_PATH = "/admin/?/users/"
+
+
+class Element:
+    def __init__(self, text="", attributes=None, children=None, click=None, field=None, form=None):
+        self.text = text
+        self.attributes = attributes or {}
+        self.children = children or {}
+        self.on_click = click
+        self.field = field
+        self.form = form
+
+    def get_attribute(self, name):
+        return self.attributes.get(name)
+
+    def find_elements(self, by, selector):
+        return self.children.get(selector, [])
+
+    def find_element(self, by, selector):
+        elements = self.find_elements(by, selector)
+        if not elements:
+            raise NoSuchElementException(selector)
+        return elements[0]
+
+    def click(self):
+        self.on_click()
+
+    def clear(self):
+        self.form[self.field] = ""
+
+    def send_keys(self, text):
+        self.form[self.field] += text
+
+
+def info(uri, username):
+    return Element(attributes={"data-content": f"<dl><dt>URI</dt><dd>{uri}</dd><dt>User name</dt><dd>{username}</dd>"})
+
+
+class Baikal:
+    """users and address books behind the fake admin UI, counting the pages it serves"""
+
+    def __init__(self):
+        self.users = {}
+        self.books = {}
+        self.loads = 0
+        self.password = "password"
+
+
+class Driver:
+    """just enough of the baikal admin UI for the browser session to drive"""
+
+    timeouts = None
+    capabilities = {}
+    title = "Baïkal Web Admin"
+
+    def __init__(self, baikal):
+        self.baikal = baikal
+        self.logged_in = False
+        self.page = None
+        self.form = {}
+        self.messages = []
+
+    @property
+    def current_url(self):
+        return URL + "/admin/"
+
+    @property
+    def page_source(self):
+        return "Installation was already completed." if self.page == "install" else "<html></html>"
+
+    def get(self, url):
+        path = url[len(URL) :]
+        if path == "/admin/install/":
+            self.title = ""
+            return self.load("install")
+        self.title = Driver.title
+        if not self.logged_in:
+            return self.load("login")
+        if path == USERS_PATH:
+            return self.load("users")
+        return self.load("dashboard")
+
+    def load(self, page, messages=()):
+        self.baikal.loads += 1
+        self.page = page
+        self.messages = list(messages)
+
+    def quit(self):
+        pass
+
+    def find_element(self, by, selector):
+        return Element(children=self.elements()).find_element(by, selector)
+
+    def find_elements(self, by, selector):
+        return self.elements().get(selector, [])
+
+    def input(self, name):
+        self.form.setdefault(name, "")
+        return [Element(field=name, form=self.form)]
+
+    def button(self, text, click):
+        return [Element(text, click=click)]
+
+    def elements(self):
+        page, _, username = self.page.partition(":")
+        elements = {'html > body [id="message"]': [Element(message) for message in self.messages]}
+        if page == "login":
+            elements['body form input[id="login"]'] = self.input("login")
+            elements['body form input[id="password"]'] = self.input("password")
+            elements["body form button"] = self.button("Authenticate", self.authenticate)
+            return elements
+        if page == "install":
+            return elements
+        links = [
+            Element("Dashboard", {"href": URL + "/admin/"}, click=lambda: self.load("dashboard")),
+            Element("Users and resources", {"href": URL + USERS_PATH}, click=lambda: self.load("users")),
+            Element("Logout", click=self.logout),
+        ]
+        elements["div.navbar"] = [Element(children={"a": links})]
+        if page == "users":
+            elements["body .btn"] = self.button("+ Add user", lambda: self.load("add_user"))
+            elements["body table tbody tr"] = [self.user_row(username) for username in self.baikal.users]
+        elif page == "books":
+            elements["body .btn"] = self.button("+ Add address book", lambda: self.load("add_book:" + username))
+            elements["body table tbody tr"] = [self.book_row(username, token) for token in self.baikal.books[username]]
+        elif page in ("add_user", "add_book"):
+            for field in ("username", "displayname", "email", "password", "passwordconfirm", "uri", "description"):
+                elements[f'body form input[name="data[{field}]"]'] = self.input(field)
+            elements["body form .btn"] = self.button("Save changes", lambda: self.save(page, username))
+        elif page == "saved_user":
+            elements["body form .btn"] = self.button("Close", lambda: self.load("users"))
+        elif page == "saved_book":
+            elements["body form .btn"] = self.button("Close", lambda: self.load("books:" + username))
+        elif page.startswith("delete"):
+            name, delete = self.confirmation(page, username)
+            elements["div.alert .btn-danger"] = self.button("Delete " + name, delete)
+        return elements
+
+    def authenticate(self):
+        if self.form["password"] != self.baikal.password:
+            return self.load("login", ["Login failed"])
+        self.logged_in = True
+        self.load("dashboard")
+
+    def logout(self):
+        self.logged_in = False
+        self.load("login")
+
+    def save(self, page, username):
+        if page == "add_user":
+            username = self.form["username"]
+            self.baikal.users[username] = self.form["displayname"]
+            self.baikal.books[username] = {}
+            self.load("saved_user", [f"User {username} has been created."])
+        else:
+            bookname = self.form["displayname"]
+            self.baikal.books[username][self.form["uri"]] = (bookname, self.form["description"])
+            self.load("saved_book:" + username, [f"Address Book {bookname} has been created."])
+
+    def user_row(self, username):
+        actions = [
+            Element("Address Books", click=lambda: self.load("books:" + username)),
+            Element("Delete", click=lambda: self.load("delete_user:" + username)),
+        ]
+        return Element(
+            children={
+                "td.col-username": [Element(f"{username}\n{self.baikal.users[username]} <{username}>")],
+                "td.col-actions": [
+                    Element(
+                        children={
+                            "span.btn.popover-hover": [info("principals/" + username, username)],
+                            "a.btn": actions,
+                        }
+                    )
+                ],
+            }
+        )
+
+    def book_row(self, username, token):
+        bookname, description = self.baikal.books[username][token]
+        uri = f"/baikal/dav.php/addressbooks/{username}/{token}/"
+        actions = [Element("Delete", click=lambda: self.load(f"delete_book:{username}/{token}"))]
+        return Element(
+            children={
+                "td.col-displayname": [Element(bookname)],
+                "td.col-contacts": [Element("0")],
+                "td.col-description": [Element(description)],
+                "td.col-actions": [
+                    Element(children={"span.btn.popover-hover": [info(uri, username)], "a.btn": actions})
+                ],
+            }
+        )
+
+    def confirmation(self, page, key):
+        if page == "delete_user":
+
+            def delete():
+                del self.baikal.users[key]
+                del self.baikal.books[key]
+                self.load("users")
+
+            return key, delete
+        username, _, token = key.partition("/")
+
+        def delete():
+            del self.baikal.books[username][token]
+            self.load("books:" + username)
+
+        return self.baikal.books[username][token][0], delete
+
+
+class Running:
+    name = "firefox"
+    pid = 0
+
+    def is_running(self):
+        return True
+
+
+class FakeProfile:
+    dir = "profile"
+
+    def __init__(self, logger=None):
+        pass
+
+    def clone(self, profile_dir, slim=False):
+        self.dir, self.slimmed = profile_dir, slim
+        return self
+
+    def AddCert(self, cert, key):
+        pass
+
+    def ListCerts(self):
+        return {}
+
+
+@pytest.fixture
+def session(monkeypatch):
+    baikal = Baikal()
+
+    def launch(self):
+        self.driver = Driver(baikal)
+        return [Running()]
+
+    monkeypatch.setattr(browser, "Profile", FakeProfile)
+    monkeypatch.setattr(Session, "_launch_driver", launch)
+    session = Session(target=Target(name="default", url=URL, client_cert="", client_key=""))
+    session.baikal = baikal
+    yield session
+    session.shutdown()
+
+
+def test_pages_profile_direct(monkeypatch):
+    monkeypatch.setattr(browser, "Profile", FakeProfile)
+    monkeypatch.setattr(browser.settings, "PROFILE_DIRECT", True)
+    session = Session(target=Target(name="default", url=URL, client_cert="", client_key=""))
+    assert session.profile.dir == browser.settings.PROFILE_DIR + ".direct"
+    assert session.profile.slimmed
+
+
+def test_pages_current():
+    pages = Pages()
+    pages.begin()
+    pages.show(USERS)
+    assert pages.current(USERS)
+    pages.begin()
+    assert not pages.current(USERS)
+    assert pages.known
+
+
+def test_pages_loads_per_operation(session):
+    admin = Account(username="admin", password="password")
+    username = "user@domain.ext"
+    user = AddUserRequest(username=username, displayname="User", password="password")
+    book = AddBookRequest(username=username, bookname="contacts", description="personal")
+
+    def loads(func, *args):
+        before = session.baikal.loads
+        func(admin, *args)
+        return session.baikal.loads - before
+
+    # operations and the page loads each needs with the browser already logged in
+    assert loads(session.login) == 2
+    assert loads(session.users) == 1
+    assert loads(session.usernames) == 1
+    assert loads(session.add_user, user) == 5
+    assert loads(session.books, username) == 2
+    assert loads(session.add_book, book) == 7
+    [added] = session.books(admin, username)
+    assert added.bookname == "contacts"
+    token = added.token
+    assert loads(session.delete_book, DeleteBookRequest(username=username, token=token)) == 4
+    assert loads(session.delete_user, DeleteUserRequest(username=username)) == 3
+    assert loads(session.status) == 0
+    assert loads(session.reset) == 3
+    with pytest.raises(InitFailed):
+        session.initialize(admin)
+    before = session.baikal.loads
+    session.logout()
+    assert session.baikal.loads - before == 2
+
+
+@pytest.mark.parametrize("verify, user_loads, book_loads", [("full", 5, 7), ("trust", 4, 5), ("async", 4, 5)])
+def test_pages_verify(session, verify, user_loads, book_loads):
+    session.verify = verify
+    admin = Account(username="admin", password="password")
+    username = "user@domain.ext"
+    session.login(admin)
+    before = session.baikal.loads
+    user = session.add_user(admin, AddUserRequest(username=username, displayname="User", password="password"))
+    assert session.baikal.loads - before == user_loads
+    assert user.uri == "principals/" + username
+    if verify == "async":
+        session.verifier.submit(lambda: None).result()
+    before = session.baikal.loads
+    book = session.add_book(admin, AddBookRequest(username=username, bookname="contacts", description="personal"))
+    assert session.baikal.loads - before == book_loads
+    assert book.token in session.baikal.books[username]
+    if verify == "async":
+        session.verifier.submit(lambda: None).result()
+        assert session.verification == dict(pending=0, verified=2, mismatched=0, failed=0)
+    assert session.status(admin)["verify"] == verify
+
+
+def test_pages_verify_as_writer(session):
+    # a verification queued behind another admin's request still reads back as the admin that wrote
+    session.verify = "async"
+    admin = Account(username="admin", password="password")
+    session.login(admin)
+    release = threading.Event()
+    session.verifier = ThreadPoolExecutor(max_workers=1)
+    session.verifier.submit(release.wait, 5)
+    session.add_user(admin, AddUserRequest(username="user@domain.ext", displayname="User", password="password"))
+    with pytest.raises(UnexpectedServerResponse):
+        session.login(Account(username="admin", password="wrongpassword"))
+    release.set()
+    session.verifier.submit(lambda: None).result()
+    assert session.verification == dict(pending=0, verified=1, mismatched=0, failed=0)
+
+
+def test_pages_retry_transient_only(session):
+    calls = []
+
+    def step(ex):
+        calls.append(ex)
+        raise ex
+
+    # a page that is not as expected fails at once; a stale element is retried
+    with pytest.raises(browser.BrowserInterfaceFailure):
+        session._retry("missing row", lambda: step(browser.BrowserInterfaceFailure("row not found")))
+    assert len(calls) == 1
+    with pytest.raises(StaleElementReferenceException):
+        session._retry("stale row", lambda: step(StaleElementReferenceException("stale")))
+    assert len(calls) == 1 + browser.settings.RETRY_ATTEMPTS
+
+
+def test_pages_login_handover(session):
+    # a session handed over to another credential logs in again, so a wrong password is refused
+    session.login(Account(username="admin", password="password"))
+    with pytest.raises(UnexpectedServerResponse, match="Login failed"):
+        session.login(Account(username="admin", password="wrongpassword"))
+    assert not session.logged_in
+    session.login(Account(username="admin", password="password"))
+    assert session.logged_in
+
+
+class Database:
+    def users(self, query=None):
+        return ["from the database"]
+
+
+def test_pages_database_read_authenticates(session):
+    session.database = Database()
+    with pytest.raises(UnexpectedServerResponse):
+        session.users(Account(username="admin", password="wrongpassword"))
+    admin = Account(username="admin", password="password")
+    assert session.users(admin) == ["from the database"]
+    before = session.baikal.loads
+    assert session.users(admin) == ["from the database"]
+    assert session.baikal.loads == before
+
+
+def test_pages_database_read_rechecks(session, monkeypatch):
+    session.database = Database()
+    admin = Account(username="admin", password="password")
+    assert session.users(admin) == ["from the database"]
+    # a password changed in baikal stops working for reads once the credential is checked again
+    session.baikal.password = "changedpassword"
+    assert session.users(admin) == ["from the database"]
+    monkeypatch.setattr(browser.settings, "STATUS_CACHE_TTL", 0)
+    with pytest.raises(UnexpectedServerResponse):
+        session.users(admin)
+
+
+def test_pages_status_login_per_credential(session):
+    admin = Account(username="admin", password="password")
+    assert session.status(admin)["login"] == "success"
+    assert session.status(Account(username="admin", password="wrongpassword"))["login"].startswith("failed")
+    assert session.status(admin)["login"] == "success"
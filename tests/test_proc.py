@@ -1,10 +1,105 @@
+import threading
 import time
 
-from bcc.process import Supervised
+from bcc.process import Supervised, Supervisor
 
 
 def test_process_supervised():
-    running = Supervised("Xvfb").is_running()
-    assert running
-    with Supervised("xterm"):
-        time.sleep(5)
+    with Supervised("sleep", "30") as sleeper:
+        assert sleeper.is_running()
+        assert Supervised.find("sleep") is not None
+        attached = Supervised.attach("sleep", pid=sleeper.pid)
+        assert attached.is_running()
+    assert not sleeper.is_running()
+    assert not attached.is_running()
+
+
+def test_process_supervised_using():
+    with Supervised("sleep", "30.5") as sleeper:
+        assert Supervised.using("30.5").pid == sleeper.pid
+    assert Supervised.using("30.5") is None
+
+
+def test_process_supervised_pidfile(tmp_path):
+    pidfile = tmp_path / "sleep.pid"
+    sleeper = Supervised("sleep", "30", pidfile=pidfile)
+    sleeper.start()
+    watcher = Supervised("sleep", pidfile=pidfile)
+    assert watcher.is_running()
+    watcher.stop()
+    assert not sleeper.is_running()
+    assert not pidfile.exists()
+
+
+def test_process_supervisor_probe_while_locked():
+    lock = threading.RLock()
+    launched = []
+
+    def launch():
+        process = Supervised("sleep", "30")
+        process.start()
+        launched.append(process)
+        return [process]
+
+    def teardown():
+        for process in launched:
+            process.stop()
+
+    supervisor = Supervisor("sleeper", launch, teardown, lock=lock, interval=0.1, backoff=60, backoff_max=60)
+    supervisor.ensure()
+    held = threading.Event()
+    release = threading.Event()
+
+    def operation():
+        with lock:
+            held.set()
+            release.wait(30)
+
+    thread = threading.Thread(target=operation)
+    thread.start()
+    held.wait(5)
+    # a death during an operation holding the lock is noticed before the operation ends
+    launched[0].proc.kill()
+    deadline = time.time() + 5
+    try:
+        while supervisor.state != "dead":
+            assert time.time() < deadline, "supervisor did not notice the death"
+            time.sleep(0.05)
+    finally:
+        release.set()
+        thread.join()
+    supervisor.stop()
+
+
+def test_process_supervisor_restart():
+    launched = []
+
+    def launch():
+        process = Supervised("sleep", "30")
+        process.start()
+        launched.append(process)
+        return [process]
+
+    def teardown():
+        for process in launched:
+            process.stop()
+
+    supervisor = Supervisor("sleeper", launch, teardown, interval=0.1, backoff=0.2, backoff_max=5)
+    supervisor.ensure()
+    assert supervisor.alive()
+    first = launched[0].pid
+
+    launched[0].proc.kill()
+    deadline = time.time() + 5
+    while supervisor.restarts == 0:
+        assert time.time() < deadline, "supervisor did not restart the process"
+        time.sleep(0.05)
+    assert supervisor.alive()
+    status = supervisor.status()
+    assert status["state"] == "running"
+    assert status["failures"] == 1
+    assert status["pids"]["sleep"] != first
+
+    supervisor.stop()
+    assert supervisor.status()["state"] == "stopped"
+    assert not any(process.is_running() for process in launched)
@@ -46,6 +46,21 @@ def test_profile_create(shared_datadir, keypair):
     assert len(after) == len(before) + 1
 
 
+def test_profile_slim_clone(tmp_path):
+    base = tmp_path / "profile"
+    for name in ["prefs.js", "cert9.db", "key4.db", "cookies.sqlite", "cookies.sqlite-wal", "lock"]:
+        (base / name).parent.mkdir(parents=True, exist_ok=True)
+        (base / name).write_text(name)
+    (base / "cache2" / "entries").mkdir(parents=True)
+    (base / "cache2" / "entries" / "0001").write_bytes(b"x" * 4096)
+    clone = Profile(dir=str(base), logger=logger).clone(tmp_path / "clone", slim=True)
+    assert sorted(path.name for path in clone.dir.iterdir()) == ["cert9.db", "key4.db", "prefs.js"]
+    (clone.dir / "startupCache").mkdir()
+    (clone.dir / ".parentlock").write_text("")
+    clone.slim()
+    assert sorted(path.name for path in clone.dir.iterdir()) == ["cert9.db", "key4.db", "prefs.js"]
+
+
 def test_profile_driver():
     driver_bin = settings.WEBDRIVER_BINARY
     if driver_bin:
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import tempfile
+
+from bcc import reaper, settings
+
+
+def test_reaper(tmp_path, monkeypatch):
+    base = tmp_path / "profile"
+    monkeypatch.setattr(settings, "PROFILE_DIR", str(base))
+    exited = subprocess.Popen(["true"])
+    exited.wait()
+    stale = tmp_path / f"profile.worker-{exited.pid}"
+    stale.mkdir()
+    live = tmp_path / f"profile.worker-{os.getpid()}"
+    live.mkdir()
+    target = tmp_path / "profile.other"
+    target.mkdir()
+
+    orphan = subprocess.Popen(["sleep", "30"], env=dict(os.environ, **{reaper.MARKER: f"{exited.pid}:0"}))
+    owned = subprocess.Popen(["sleep", "30"], env=reaper.marked_env())
+    try:
+        assert [process.pid for process in reaper.orphans()] == [orphan.pid]
+        result = reaper.reap()
+        assert result["processes"] == [str(orphan.pid)]
+        assert result["profiles"] == [str(stale)]
+        assert orphan.wait(5) is not None
+        assert owned.poll() is None
+        assert not stale.exists()
+        assert live.exists()
+        assert target.exists()
+    finally:
+        for proc in [orphan, owned]:
+            proc.kill()
+            proc.wait()
+
+
+def test_reaper_selenium_copies(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILE_DIR", str(tmp_path / "profile"))
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    exited = subprocess.Popen(["true"])
+    exited.wait()
+    copies = {}
+    for name, marker in [("orphaned", f"{exited.pid}:0"), ("owned", reaper.owner_marker()), ("foreign", None)]:
+        copies[name] = tmp_path / name
+        (copies[name] / reaper.SELENIUM_PROFILE_COPY).mkdir(parents=True)
+        if marker:
+            (copies[name] / reaper.MARKER_FILE).write_text(marker)
+    assert reaper.reap()["profiles"] == [str(copies["orphaned"])]
+    assert not copies["orphaned"].exists()
+    assert copies["owned"].exists()
+    assert copies["foreign"].exists()
@@ -0,0 +1,57 @@
+import pytest
+
+from bcc import deadlines
+from bcc.retry import retry
+
+
+class Flaky:
+    def __init__(self, failures, exception=ConnectionError):
+        self.failures = failures
+        self.exception = exception
+        self.calls = 0
+        self.recoveries = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.exception(f"failure {self.calls}")
+        return "ok"
+
+    def recover(self):
+        self.recoveries += 1
+
+
+def test_retry_transient():
+    flaky = Flaky(2)
+    assert retry("step", flaky, transient=(ConnectionError,), recover=flaky.recover, attempts=3, backoff=0) == "ok"
+    assert flaky.calls == 3
+    assert flaky.recoveries == 2
+
+
+def test_retry_budget():
+    flaky = Flaky(3)
+    with pytest.raises(ConnectionError):
+        retry("step", flaky, transient=(ConnectionError,), attempts=3, backoff=0)
+    assert flaky.calls == 3
+
+
+def test_retry_not_transient():
+    flaky = Flaky(1, ValueError)
+    with pytest.raises(ValueError):
+        retry("step", flaky, transient=(ConnectionError,), attempts=3, backoff=0)
+    assert flaky.calls == 1
+
+
+def test_retry_write_landed():
+    flaky = Flaky(1)
+    assert retry("write", flaky, transient=(ConnectionError,), landed=lambda: "landed", backoff=0) == "landed"
+    assert flaky.calls == 1
+    assert retry("write", Flaky(1), transient=(ConnectionError,), landed=lambda: None, backoff=0) == "ok"
+
+
+def test_retry_deadline():
+    flaky = Flaky(2)
+    with deadlines.deadline(deadlines.expiry(0.05)):
+        with pytest.raises(ConnectionError):
+            retry("step", flaky, transient=(ConnectionError,), attempts=5, backoff=0.1)
+    assert flaky.calls == 1
@@ -0,0 +1,125 @@
+import requests
+
+from bcc.client import API
+from bcc.shards import Shards, split_urls
+
+URLS = ["http://one/bcc", "http://two/bcc", "http://three/bcc"]
+
+
+class Response:
+    headers = {}
+    reason = "Not Found"
+
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+    def json(self):
+        return self.payload
+
+    def close(self):
+        pass
+
+
+class Session:
+    """answers as every server would, failing connections to the servers in down"""
+
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.sent = []
+
+    def send(self, method, url, **kwargs):
+        server = url.split("/")[2]
+        self.sent.append((method, server))
+        if server in self.down:
+            raise requests.ConnectionError(server)
+        if "/jobs/" in url and not url.endswith(("/jobs/", f"/jobs/{server}/")):
+            return Response(dict(detail="unknown job"), 404)
+        if url.endswith("/user/"):
+            return Response(dict(user=dict(username="user@domain.ext", displayname="", uri="principals/u")))
+        return Response(dict(job=dict(id=server), jobs=[dict(id=server)], server=server))
+
+    def get(self, url, **kwargs):
+        return self.send("get", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.send("post", url, **kwargs)
+
+
+def api(down=()):
+    api = API.__new__(API)
+    api.shards = Shards(URLS, eject_after=2, eject_seconds=60)
+    api.url = api.shards.endpoints[0].url
+    api.job_endpoints = {}
+    api.overload_retries = 0
+    api.session = Session(down)
+    return api
+
+
+def test_shards_split_urls():
+    assert split_urls("http://one/bcc/, http://two/bcc,") == ["http://one/bcc", "http://two/bcc"]
+
+
+def test_shards_hashed_stable():
+    shards = Shards(URLS)
+    owners = {f"user{i}@domain.ext": shards.hashed(f"user{i}@domain.ext").url for i in range(100)}
+    assert set(owners.values()) == {url.strip("/") for url in URLS}
+    assert owners == {key: Shards(URLS).hashed(key).url for key in owners}
+    # ejecting a server moves only its own users
+    ejected = shards.endpoints[0]
+    for _ in range(shards.eject_after):
+        shards.report(ejected, False)
+    moved = {key for key, url in owners.items() if shards.hashed(key).url != url}
+    assert moved == {key for key, url in owners.items() if url == ejected.url}
+
+
+def test_shards_least_loaded():
+    shards = Shards(URLS)
+    with shards.track(shards.least_loaded()) as first:
+        with shards.track(shards.least_loaded()) as second:
+            assert first is not second
+            assert shards.least_loaded() not in (first, second)
+    assert [endpoint["outstanding"] for endpoint in shards.status()] == [0, 0, 0]
+
+
+def test_shards_all_ejected():
+    shards = Shards(URLS[:1], eject_after=1)
+    shards.report(shards.endpoints[0], False)
+    assert not shards.status()[0]["healthy"]
+    assert shards.hashed("key") is shards.endpoints[0]
+
+
+def test_shards_client_writes_by_user():
+    client = api()
+    client.add_user("user@domain.ext", "User", "password")
+    client.add_user("user@domain.ext", "User", "password")
+    servers = {server for _, server in client.session.sent}
+    assert len(servers) == 1
+    assert servers == {client.shards.hashed("user@domain.ext").url.split("/")[2]}
+
+
+def test_shards_client_read_failover():
+    client = api(down=["one"])
+    for _ in range(3):
+        client._get("status")
+    # the failing server is tried until ejected, and reads move to the others
+    assert [server for _, server in client.session.sent].count("one") == 2
+    assert not client.shards.status()[0]["healthy"]
+
+
+def test_shards_client_jobs():
+    client = api()
+    job = client._post("users", background=True)
+    client.job(job["id"])
+    assert client.session.sent[-1] == ("get", job["id"])
+    assert sorted(job["id"] for job in client.jobs()) == ["one", "three", "two"]
+
+
+def test_shards_client_job_from_another_client():
+    client = api(down=["one"])
+    assert client.job("three")["id"] == "three"
+    assert client.job_endpoints["three"].url == "http://three/bcc"
+    client.session.sent = []
+    client.job("three")
+    assert client.session.sent == [("get", "three")]
@@ -0,0 +1,42 @@
+from bcc.snapshots import Snapshots, tagged
+
+
+class Driver:
+    current_url = "http://caldav.domain.ext/baikal/admin/"
+    page_source = "<html><body>" + "users " * 1000 + "</body></html>"
+
+    def get_screenshot_as_png(self):
+        return b"\x89PNG"
+
+
+def test_snapshots_ring():
+    ring = Snapshots(2, screenshots=True)
+    driver = Driver()
+    tagged("req1", ring.capture)(driver, "GET /admin/")
+    tagged("req2", ring.capture)(driver, "GET /admin/users/")
+    tagged("req2", ring.capture)(driver, "add_user failed")
+    ring.flush()
+    index = ring.index()
+    assert [snapshot["id"] for snapshot in index] == [2, 3]
+    assert [snapshot["step"] for snapshot in ring.index("req2")] == ["GET /admin/users/", "add_user failed"]
+    assert index[0]["size"] < len(Driver.page_source)
+    assert ring.source(3) == Driver.page_source
+    assert ring.screenshot(3) == b"\x89PNG"
+
+
+def test_snapshots_dump(tmp_path):
+    ring = Snapshots(10, screenshots=False)
+    tagged("req1", ring.capture)(Driver(), "GET /admin/")
+    ring.dump("req1", str(tmp_path))
+    ring.dump("req2", str(tmp_path))
+    ring.flush()
+    assert (tmp_path / "req1" / "000001.html").read_text() == Driver.page_source
+    assert not (tmp_path / "req1" / "000001.png").exists()
+    assert not (tmp_path / "req2").exists()
+
+
+def test_snapshots_disabled():
+    ring = Snapshots(0)
+    ring.capture(Driver(), "GET /admin/")
+    ring.flush()
+    assert ring.index() == []
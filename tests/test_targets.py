@@ -0,0 +1,153 @@
+import arrow
+import pytest
+
+from bcc import settings
+from bcc.memory import MemoryBackend
+from bcc.models import Account, credential
+from bcc.targets import BACKENDS, Sessions, UnknownTarget, load_targets, profile_dir
+
+
+@pytest.fixture
+def targets_file(tmp_path):
+    filename = tmp_path / "targets.yaml"
+    filename.write_text(
+        "site1:\n"
+        "  url: https://caldav.site1.ext/baikal\n"
+        "  client_cert: ~/certs/site1.pem\n"
+        "  client_key: ~/certs/site1.key\n"
+    )
+    return str(filename)
+
+
+def test_targets_load(targets_file):
+    targets = load_targets(targets_file)
+    assert set(targets.keys()) == {"default", "site1"}
+    assert targets["default"].url == settings.CALDAV_URL
+    assert targets["site1"].url == "https://caldav.site1.ext/baikal"
+    assert not targets["site1"].client_cert.startswith("~")
+    assert targets["site1"].admin_username == ""
+
+
+def test_targets_admin_credentials(tmp_path):
+    (tmp_path / "password").write_text("site2-password\n")
+    filename = tmp_path / "targets.yaml"
+    filename.write_text(
+        "site2:\n"
+        "  url: https://caldav.site2.ext/baikal\n"
+        "  client_cert: site2.pem\n"
+        "  client_key: site2.key\n"
+        "  admin_username: site2-admin\n"
+        f"  admin_password: '@{tmp_path / 'password'}'\n"
+    )
+    sessions = Sessions(load_targets(str(filename)))
+    target = sessions.target("site2")
+    assert (target.admin_username, target.admin_password) == ("site2-admin", "site2-password")
+    with pytest.raises(UnknownTarget):
+        sessions.target("nonexistent")
+
+
+def test_targets_profile_dir(monkeypatch):
+    monkeypatch.setattr(settings, "WORKERS", 1)
+    assert profile_dir("default") is None
+    assert profile_dir("site1") == settings.PROFILE_DIR + ".site1"
+    assert profile_dir("site1", "0123") == settings.PROFILE_DIR + ".site1.admin-0123"
+    monkeypatch.setattr(settings, "WORKERS", 4)
+    assert profile_dir("default").startswith(settings.PROFILE_DIR + ".worker-")
+
+
+def test_targets_unknown(targets_file):
+    sessions = Sessions(load_targets(targets_file))
+    with pytest.raises(UnknownTarget):
+        sessions.get("nonexistent")
+    assert sessions.status() == dict(default="unallocated", site1="unallocated")
+
+
+class AdminMemoryBackend(MemoryBackend):
+    per_admin = True
+
+
+def test_targets_admin_affinity(monkeypatch, targets_file):
+    monkeypatch.setitem(BACKENDS, "memory", AdminMemoryBackend)
+    monkeypatch.setattr(settings, "BACKEND", "memory")
+    monkeypatch.setattr(settings, "ADMIN_SESSIONS", 2)
+    sessions = Sessions(load_targets(targets_file))
+    alice = Account(username="alice", password="password-one")
+    bob = Account(username="bob", password="password-two")
+    assert sessions.get("site1", alice) is sessions.get("site1", alice)
+    assert sessions.get("site1", alice) is not sessions.get("site1", bob)
+    assert sessions.get("default", alice) is not sessions.get("site1", alice)
+    assert sessions.allocated() == {"default", "site1"}
+
+
+def test_targets_admin_session_limit(monkeypatch, targets_file):
+    monkeypatch.setitem(BACKENDS, "memory", AdminMemoryBackend)
+    monkeypatch.setattr(settings, "BACKEND", "memory")
+    monkeypatch.setattr(settings, "ADMIN_SESSIONS", 2)
+    sessions = Sessions(load_targets(targets_file))
+    admins = [Account(username=f"admin{i}", password="password") for i in range(3)]
+    first = sessions.get("site1", admins[0])
+    second = sessions.get("site1", admins[1])
+    sessions.get("site1", admins[1])
+    assert sessions.get("site1", admins[2]) is first
+    assert sessions.get("site1", admins[1]) is second
+    assert len(sessions.sessions) == 2
+
+
+def test_targets_admin_session_handover(monkeypatch, targets_file):
+    monkeypatch.setitem(BACKENDS, "memory", AdminMemoryBackend)
+    monkeypatch.setattr(settings, "BACKEND", "memory")
+    monkeypatch.setattr(settings, "ADMIN_SESSIONS", 1)
+    sessions = Sessions(load_targets(targets_file))
+    alice = Account(username="alice", password="password-one")
+    bob = Account(username="bob", password="password-two")
+    session = sessions.get("site1", alice)
+    # at the limit each switch of admin hands the one session over rather than allocating another
+    for admin in [bob, alice, bob]:
+        assert sessions.get("site1", admin) is session
+        assert list(sessions.sessions) == [("site1", credential(admin))]
+
+
+def test_targets_evict_idle(monkeypatch, targets_file):
+    monkeypatch.setitem(BACKENDS, "memory", ActiveMemoryBackend)
+    monkeypatch.setattr(settings, "BACKEND", "memory")
+    sessions = Sessions(load_targets(targets_file))
+    idle = sessions.get("site1", Account(username="alice", password="password-one"))
+    busy = sessions.get("default", Account(username="alice", password="password-one"))
+    idle.running = busy.running = True
+    idle.shutdown = lambda: setattr(idle, "running", False)
+    for key in sessions.last_used:
+        if key[0] == "site1":
+            sessions.last_used[key] = arrow.now().shift(seconds=-60)
+    sessions.evict_idle(timeout=30)
+    assert not idle.running
+    assert busy.running
+
+
+def test_targets_shared_backend(monkeypatch, targets_file):
+    monkeypatch.setattr(settings, "BACKEND", "memory")
+    sessions = Sessions(load_targets(targets_file))
+    alice = Account(username="alice", password="password-one")
+    bob = Account(username="bob", password="password-two")
+    assert sessions.get("site1", alice) is sessions.get("site1", bob)
+
+
+class ActiveMemoryBackend(MemoryBackend):
+    per_admin = True
+    running = False
+
+    @property
+    def active(self):
+        return self.running
+
+
+def test_targets_active(monkeypatch, targets_file):
+    monkeypatch.setitem(BACKENDS, "memory", ActiveMemoryBackend)
+    monkeypatch.setattr(settings, "BACKEND", "memory")
+    sessions = Sessions(load_targets(targets_file))
+    assert sessions.active() == {}
+    session = sessions.get("site1", Account(username="alice", password="password-one"))
+    used = dict(sessions.last_used)
+    assert sessions.active() == {}
+    session.running = True
+    assert sessions.active() == {"site1": session}
+    assert sessions.last_used == used